@@ -0,0 +1,42 @@
+# alerts/management/commands/profile_ticks.py
+"""
+Çalışan watcher süreçlerinde sonraki tick'lerin profilini ister (bkz. watcher/profiling.py):
+
+    python manage.py profile_ticks                       # ilk bakan süreç, WATCHER_PROFILE_TICKS tick
+    python manage.py profile_ticks --ticks 10 --mode sample
+    python manage.py profile_ticks --pid 4242            # belirli süreç
+    python manage.py profile_ticks --pid 4242 --signal   # istek dosyası yerine SIGUSR1 (varsayılan mod/sayı)
+
+Süreç aynı makinede olmalı; sonuç WATCHER_PROFILE_DIR altına yazılır.
+"""
+import os
+import signal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from watcher.profiling import MODES, PROFILE_DIR, PROFILE_MODE, PROFILE_TICKS, request_profile
+
+
+class Command(BaseCommand):
+    help = "Çalışan watcher'ın sonraki N tick'ini profille (cProfile ya da örnekleme)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ticks", type=int, default=PROFILE_TICKS, help="Profillenecek tick sayısı.")
+        parser.add_argument("--mode", choices=MODES, default=PROFILE_MODE)
+        parser.add_argument("--pid", type=int, default=None, help="Hedef süreç; yoksa ilk bakan süreç.")
+        parser.add_argument("--signal", action="store_true", help="İstek dosyası yerine SIGUSR1 gönder.")
+
+    def handle(self, *args, **opts):
+        if opts["ticks"] < 1:
+            raise CommandError("--ticks en az 1 olmalı")
+        if opts["signal"]:
+            if not opts["pid"] or not hasattr(signal, "SIGUSR1"):
+                raise CommandError("--signal için --pid gerekli (ve SIGUSR1 destekli bir sistem)")
+            try:
+                os.kill(opts["pid"], signal.SIGUSR1)
+            except OSError as exc:
+                raise CommandError(f"Sinyal gönderilemedi: {exc}")
+            self.stdout.write(f"SIGUSR1 → {opts['pid']}; sonuç: {PROFILE_DIR}")
+            return
+        path = request_profile(opts["ticks"], opts["mode"], opts["pid"])
+        self.stdout.write(f"İstek bırakıldı: {path}\nSonraki tick'te alınır; sonuç: {PROFILE_DIR}")
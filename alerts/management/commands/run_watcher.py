@@ -0,0 +1,141 @@
+# alerts/management/commands/run_watcher.py
+"""
+Eşik kontrol döngüsünü Telegram polling'inden bağımsız çalıştırır:
+
+    python manage.py run_watcher                 # sürekli
+    python manage.py run_watcher --once          # tek tick (ölçüm için), özet yazar
+    python manage.py run_watcher --shards 8      # sharded worker (bkz. watcher/sharding.py)
+
+Bot sürecinde WATCHER_EMBEDDED=0 verilince PTB sadece sohbet güncellemelerini işler.
+METRICS_PORT (ya da --metrics-port) verilirse metrikler http://127.0.0.1:<port>/metrics/ adresinde.
+SIGUSR1: sonraki WATCHER_PROFILE_TICKS tick profillenir (bkz. watcher/profiling.py).
+SIGINT/SIGTERM: süren tick biter, kuyruktaki mesajlar gönderilir, kiralar bırakılır.
+"""
+import asyncio
+import functools
+import json
+import logging
+import signal
+import time
+from dataclasses import asdict
+from typing import Optional
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from bot.clients import close_clients, start_clients
+from bot.dispatcher import configure_dispatcher, start_dispatcher, get_dispatcher
+from bot.metrics import METRICS_PORT, start_metrics_server, stop_metrics_server
+from bot.throttle import configure_fetch_scheduler
+from watcher import tasks
+from watcher.history import flush_price_history, preload_price_history
+from watcher.profiling import install_signal_handler, remove_signal_handler
+from watcher.registry import get_registry
+from watcher.runner import TickReport
+from watcher.sharding import LeaseManager
+
+log = logging.getLogger("watcher.run")
+
+
+async def run_loop(stop: asyncio.Event, interval: float, lease: Optional[LeaseManager] = None,
+                   once: bool = False, budget: Optional[float] = None,
+                   history_flush_seconds: float = settings.WATCHER_HISTORY_FLUSH_SECONDS) -> TickReport:
+    """
+    check_thresholds_and_notify ile aynı tick (tasks._runner / tasks._run_tick);
+    sharded modda her turdan önce kira heartbeat'i. Son tick raporunu döndürür.
+    """
+    registry = get_registry()
+    tick = tasks._run_tick if lease is None else functools.partial(tasks._run_tick, lease=lease)
+    loop = asyncio.get_running_loop()
+    report = TickReport()
+    last_flush = loop.time()
+    while not stop.is_set():
+        started = loop.time()
+        if lease is not None:
+            gained, _lost = await lease.heartbeat()
+            if gained or not registry.loaded:
+                # Devralınan shard'ların seviyeleri önceki sahibin commit ettiği hâlinden okunur
+                await registry.reload()
+                await preload_price_history()
+        if lease is None or lease.owned:
+            report = await tasks._runner.run(tick, budget)
+        if once:
+            break
+        if started - last_flush >= history_flush_seconds:
+            await flush_price_history()
+            last_flush = started
+        try:
+            await asyncio.wait_for(stop.wait(), max(0.0, interval - (loop.time() - started)))
+        except asyncio.TimeoutError:
+            pass
+    return report
+
+
+class Command(BaseCommand):
+    help = "Eşik kontrol döngüsünü (DexScreener → seviye → Telegram) ayrı süreçte çalıştırır."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Tek tick çalıştır, özet yaz ve çık.")
+        parser.add_argument("--interval", type=float, default=settings.WATCHER_TICK_SECONDS,
+                            help="Tick aralığı (sn).")
+        parser.add_argument("--budget", type=float, default=None,
+                            help="Tick süre bütçesi (sn); varsayılan WATCHER_TICK_BUDGET_SECONDS.")
+        parser.add_argument("--shards", type=int, default=settings.WATCHER_SHARDS,
+                            help=">1: kontratları DB kiralarıyla süreçler arasında böl.")
+        # Eşzamanlılık (env varsayılanlarını ezer)
+        parser.add_argument("--max-in-flight", type=int, default=None, help="DexScreener eşzamanlı istek.")
+        parser.add_argument("--rps", type=float, default=None, help="DexScreener istek/sn.")
+        parser.add_argument("--send-workers", type=int, default=None, help="Telegram gönderim worker sayısı.")
+        parser.add_argument("--send-rps", type=float, default=None, help="Telegram toplam mesaj/sn.")
+        parser.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                            help="/metrics/ dinleyici portu (0: kapalı).")
+        parser.add_argument("--drain-timeout", type=float, default=10.0,
+                            help="Kapanışta kuyruktaki mesajlar için bekleme (sn).")
+
+    def handle(self, *args, **opts):
+        self._configure(opts)
+        report = asyncio.run(self._main(opts))
+        if opts["once"]:
+            self.stdout.write(json.dumps(asdict(report)))
+
+    def _configure(self, opts) -> None:
+        fetch = {k: v for k, v in (("max_in_flight", opts["max_in_flight"]), ("rps", opts["rps"]))
+                 if v is not None}
+        if fetch:
+            configure_fetch_scheduler(**fetch)
+        send = {k: v for k, v in (("workers", opts["send_workers"]), ("global_rps", opts["send_rps"]))
+                if v is not None}
+        if send:
+            configure_dispatcher(**send)
+
+    async def _main(self, opts) -> TickReport:
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        install_signal_handler(loop)  # SIGUSR1: sonraki tick'leri profille
+
+        lease = LeaseManager(shards=opts["shards"]) if opts["shards"] > 1 else None
+        await start_clients()
+        await start_dispatcher()
+        await start_metrics_server(port=opts["metrics_port"])
+        if lease is None:
+            await get_registry().ensure_loaded()
+            await preload_price_history()
+        log.info("Watcher başladı (%s)", f"{lease.owner}, {lease.shards} shard" if lease else "tek süreç")
+        started = time.monotonic()
+        try:
+            return await run_loop(stop, opts["interval"], lease=lease, once=opts["once"],
+                                  budget=opts["budget"])
+        finally:
+            if lease is not None:
+                await lease.release()  # diğerleri süre dolmasını beklemeden devralsın
+            tasks.flush_alerts()  # pencerede bekleyen özetler
+            await get_dispatcher().stop(drain_timeout=opts["drain_timeout"])
+            await close_clients()
+            await flush_price_history()
+            await stop_metrics_server()
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.remove_signal_handler(sig)
+            remove_signal_handler(loop)
+            log.info("Watcher durdu (%.1f sn)", time.monotonic() - started)
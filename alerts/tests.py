@@ -1,3 +1,31 @@
-from django.test import TestCase
+import asyncio
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.test import TestCase, override_settings
+
+from alerts.management.commands.run_watcher import run_loop
+from bot.service import TokenStats
+from watcher import tasks
+from watcher.index import get_threshold_index
+from watcher.models import Token, User, UserToken
+
+
+@override_settings(DB_EXECUTOR_THREADS=0)  # TestCase transaction'ı tek thread'de
+class RunWatcherTests(TestCase):
+    def setUp(self):
+        get_threshold_index().clear()
+        self.token = Token.objects.create(contract_address="0x" + "a" * 40)
+        UserToken.objects.create(user=User.objects.create(telegram_id="42"), token=self.token)
+
+    def test_once_runs_the_same_tick_as_the_bot_job(self):
+        stats = {self.token.contract_address: TokenStats(market_cap=1100.0)}
+        sent = mock.MagicMock()
+        with mock.patch.object(tasks, "fetch_many_stats", mock.AsyncMock(return_value=stats)), \
+             mock.patch.object(tasks, "get_dispatcher", return_value=sent), \
+             mock.patch.object(tasks, "ADAPTIVE_POLLING", False):
+            report = async_to_sync(run_loop)(asyncio.Event(), interval=1, once=True)
+
+        self.assertEqual((report.processed, report.crossings), (1, 1))
+        self.assertEqual(sent.enqueue.call_args.args[0], "42")
+        self.assertEqual(UserToken.objects.get().last_alert_level, "mid")
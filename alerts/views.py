@@ -1,3 +1,18 @@
-from django.shortcuts import render
+import hmac
 
-# Create your views here.
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden, HttpResponseNotAllowed
+
+from bot import metrics
+
+
+def prometheus_metrics(request):
+    """Bu sürecin metrikleri (Prometheus metin biçimi); METRICS_TOKEN varsa Bearer ile."""
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+    expected = settings.METRICS_TOKEN
+    if expected:
+        given = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(given.encode(), f"Bearer {expected}".encode()):
+            return HttpResponseForbidden()
+    return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
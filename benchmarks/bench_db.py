@@ -0,0 +1,100 @@
+# benchmarks/bench_db.py
+"""
+Eşzamanlı handler DB akışı (/addtoken + /mytokens) için üç yolu karşılaştırır:
+- sync_to_async (thread-sensitive, eski yol: tüm sohbetler tek thread'de sıralanır)
+- Django 4.2 async ORM (aget_or_create, async for; içeride yine thread-sensitive)
+- bot.db.db_sync (sınırlı DB havuzu)
+
+Geçici bir SQLite dosyası kullanır; --latency her sorguya yapay gecikme ekler
+(ağ üzerindeki bir DB'yi taklit eder, GIL'i bırakır).
+
+    python -m benchmarks.bench_db --chats 200 --latency 2
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["DJANGO_DB_PATH"] = os.path.join(_tmp.name, "bench.sqlite3")
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "crypto_alert.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from asgiref.sync import sync_to_async  # noqa: E402
+from django.conf import settings  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db.backends.signals import connection_created  # noqa: E402
+
+from bot.db import db_sync  # noqa: E402
+from watcher.models import Token, User, UserToken  # noqa: E402
+
+_LATENCY = 0.0
+
+
+def _delay(execute, sql, params, many, context):
+    if _LATENCY:
+        time.sleep(_LATENCY)
+    return execute(sql, params, many, context)
+
+
+def _install_latency(sender, connection, **kwargs):
+    connection.execute_wrappers.append(_delay)
+
+
+def _flow_sync(i: int) -> int:
+    user, _ = User.objects.get_or_create(telegram_id=f"b{i}")
+    token, _ = Token.objects.get_or_create(contract_address=f"0x{i % 50:040x}")
+    UserToken.objects.get_or_create(user=user, token=token)
+    return len(list(UserToken.objects.select_related("token").filter(user=user)))
+
+
+async def _flow_async_orm(i: int) -> int:
+    user, _ = await User.objects.aget_or_create(telegram_id=f"b{i}")
+    token, _ = await Token.objects.aget_or_create(contract_address=f"0x{i % 50:040x}")
+    await UserToken.objects.aget_or_create(user=user, token=token)
+    return len([ut async for ut in UserToken.objects.select_related("token").filter(user=user)])
+
+
+async def _run(name: str, flow, chats: int, rounds: int) -> None:
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        await asyncio.gather(*(flow(i) for i in range(chats)))
+        best = min(best, time.perf_counter() - started)
+    print(f"{name:<28} {best * 1000:8.1f} ms   {chats / best:8.0f} akış/sn")
+
+
+async def main_async(args) -> None:
+    await _run("sync_to_async (eski)", sync_to_async(_flow_sync), args.chats, args.rounds)
+    await _run("async ORM (aget_or_create)", _flow_async_orm, args.chats, args.rounds)
+    settings.DB_EXECUTOR_THREADS = args.threads
+    await _run(f"db_sync ({args.threads} thread)", db_sync(_flow_sync), args.chats, args.rounds)
+
+
+def main() -> None:
+    global _LATENCY
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--chats", type=int, default=200, help="eşzamanlı handler akışı")
+    ap.add_argument("--threads", type=int, default=settings.DB_EXECUTOR_THREADS)
+    ap.add_argument("--latency", type=float, default=0.0, help="sorgu başına yapay gecikme (ms)")
+    ap.add_argument("--rounds", type=int, default=3)
+    args = ap.parse_args()
+
+    call_command("migrate", verbosity=0)
+    _LATENCY = args.latency / 1000.0
+    connection_created.connect(_install_latency)
+    print(f"{args.chats} eşzamanlı akış, sorgu gecikmesi {args.latency} ms")
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# benchmarks/bench_levels.py
+"""
+Skaler (_level_for + _should_notify) ve NumPy seviye değerlendirmesini karşılaştırır.
+
+    python -m benchmarks.bench_levels --rows 1000000 --contracts 10000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+import django  # noqa: E402
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "crypto_alert.settings")
+django.setup()
+
+from watcher import tasks, vectorized  # noqa: E402
+from watcher.index import Subscription, ThresholdIndex  # noqa: E402
+
+
+def _population(rows: int, contracts: int, moving: float, seed: int):
+    """
+    Kararlı durum: her abonelik mevcut mcap'te değerlendirilmiş; kontratların
+    `moving` oranı bu tick'te x3 yükseliyor.
+    """
+    rnd = random.Random(seed)
+    names = [f"c{i}" for i in range(contracts)]
+    prev = {c: rnd.uniform(1e4, 3e7) for c in names}
+    subs = []
+    for i in range(rows):
+        c = names[i % contracts]
+        low = rnd.uniform(1e4, 1e7)
+        level = tasks._level_for(prev[c], low, low * 2, low * 3)
+        subs.append(Subscription(i, 0, str(i % 100000), c, low, low * 2, low * 3, level))
+    mcaps = {c: (m * 3 if rnd.random() < moving else m) for c, m in prev.items()}
+    return subs, mcaps
+
+
+def _best(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=1_000_000)
+    ap.add_argument("--contracts", type=int, default=10_000)
+    ap.add_argument("--moving", type=float, default=0.01, help="bu tick'te yükselen kontrat oranı")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    if not vectorized.available():
+        print("numpy kurulu değil: pip install numpy")
+        return
+
+    subs, mcaps = _population(args.rows, args.contracts, args.moving, args.seed)
+    index = ThresholdIndex()
+    for sub in subs:
+        index.subs[sub.id] = sub  # sadece sütun önbelleği için; sıralı diziler gerekmiyor
+
+    cache = vectorized.ColumnCache()
+    t0 = time.perf_counter()
+    cache.sync(index)
+    build = time.perf_counter() - t0
+
+    now = time.time()
+    scalar = _best(lambda: tasks._evaluate_scalar(subs, mcaps, now), args.repeat)
+    cached = _best(lambda: cache.crossings(index, mcaps, now), args.repeat)
+    group = dict(list(mcaps.items())[:tasks.TICK_CHUNK])  # tick grubu: sadece o kontratların satırları
+    chunk = _best(lambda: cache.crossings(index, group, now), args.repeat)
+    cols = cache.cols
+    vec = cols.mcap_vector(mcaps)
+    kernel = _best(lambda: vectorized.evaluate(cols, vec, now), args.repeat)
+
+    n_scalar = len(tasks._evaluate_scalar(subs, mcaps, now)[0])
+    n_vector = len(cache.crossings(index, mcaps, now)[0])
+    assert n_scalar == n_vector, (n_scalar, n_vector)
+
+    print(f"rows={args.rows:,} contracts={args.contracts:,} crossings={n_scalar:,}")
+    print(f"scalar (_level_for döngüsü)     {scalar * 1000:9.1f} ms")
+    print(f"numpy çekirdek (evaluate)       {kernel * 1000:9.1f} ms  x{scalar / kernel:6.1f}")
+    print(f"numpy + sonuç listesi (tick)    {cached * 1000:9.1f} ms  x{scalar / cached:6.1f}")
+    print(f"numpy, {len(group)} kontratlık grup     {chunk * 1000:9.1f} ms")
+    print(f"sütun önbelleği kurulumu (1 kez) {build * 1000:8.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+# benchmarks/bench_parse.py
+"""
+DexScreener yanıt işleme: N kontrat için toplu (/tokens/{a,b,...}) yanıtları
+çözüp kontrat başına sonuç üretme maliyeti ve tick boyunca tutulan sonuçların belleği.
+
+- decode: json.loads / orjson.loads
+- parse: eski yol (listeyi sıralama + baseToken'a göre listeler + 11 anahtarlı dict)
+         ve yeni yol (tek geçişte en iyi pair + slotlu TokenStats)
+- sabit: DEX_PAIR_PINNING ile /pairs/{chain}/{...} yanıtları (kontrat başına tek pair)
+
+    python -m benchmarks.bench_parse --contracts 10000 --pairs 4
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from bot import service  # noqa: E402
+
+
+# ---------------- Eski yol (karşılaştırma için) ----------------
+def _old_pick(pairs):
+    if not pairs:
+        return None
+    pairs.sort(key=service._rank, reverse=True)
+    return pairs[0]
+
+
+def _old_normalize(top):
+    base = (top.get("baseToken") or {})
+    quote = (top.get("quoteToken") or {})
+    mcap = top.get("marketCap")
+    if mcap is None:
+        mcap = top.get("fdv")
+    mcap = service._float(mcap)
+    return {
+        "pair_url": top.get("url"),
+        "chain_id": top.get("chainId"),
+        "dex_id": top.get("dexId"),
+        "pair_address": top.get("pairAddress"),
+        "base_symbol": base.get("symbol"),
+        "base_address": base.get("address"),
+        "quote_symbol": quote.get("symbol"),
+        "price_usd": service._float(top.get("priceUsd")),
+        "market_cap": mcap,
+        "fdv": top.get("fdv"),
+        "liquidity_usd": (top.get("liquidity") or {}).get("usd"),
+        "volume_h24": (top.get("volume") or {}).get("h24"),
+    }
+
+
+def _old_chunk(data, chunk):
+    by_base = {}
+    for p in data.get("pairs") or []:
+        key = service._addr_key((p.get("baseToken") or {}).get("address"))
+        if key:
+            by_base.setdefault(key, []).append(p)
+    out = {}
+    for ca in chunk:
+        top = _old_pick(by_base.get(service._addr_key(ca), []))
+        if not top:
+            out[ca] = (None, {"error": "no_pairs"})
+        else:
+            norm = _old_normalize(top)
+            out[ca] = (norm["market_cap"], norm)
+    return out
+
+
+def _new_chunk(data, chunk):
+    best = service._best_pairs_by_base(data.get("pairs") or [])
+    out = {}
+    for ca in chunk:
+        top = best.get(service._addr_key(ca))
+        out[ca] = service._normalize_pair(top) if top is not None else service.NO_PAIRS
+    return out
+
+
+# ---------------- Veri ----------------
+def _bodies(contracts: int, pairs: int, batch: int, seed: int):
+    rnd = random.Random(seed)
+    cas = [f"0x{i:040x}" for i in range(contracts)]
+    chunks = [cas[i:i + batch] for i in range(0, len(cas), batch)]
+    bodies = []
+    for chunk in chunks:
+        out = []
+        for ca in chunk:
+            for j in range(pairs):
+                out.append({
+                    "chainId": "ethereum",
+                    "dexId": "uniswap",
+                    "url": f"https://dexscreener.com/ethereum/{ca}-{j}",
+                    "pairAddress": f"0x{rnd.getrandbits(160):040x}",
+                    "baseToken": {"address": ca, "name": "Token", "symbol": "TKN"},
+                    "quoteToken": {"address": "0x" + "e" * 40, "name": "Wrapped Ether", "symbol": "WETH"},
+                    "priceNative": "0.0001",
+                    "priceUsd": f"{rnd.uniform(0.0001, 5):.8f}",
+                    "txns": {"h24": {"buys": 10, "sells": 7}},
+                    "volume": {"h24": rnd.uniform(0, 1e6), "h6": 1.0, "h1": 1.0, "m5": 1.0},
+                    "priceChange": {"h24": 1.2},
+                    "liquidity": {"usd": rnd.uniform(0, 1e6), "base": 1.0, "quote": 1.0},
+                    "fdv": rnd.uniform(1e4, 1e8),
+                    "marketCap": rnd.uniform(1e4, 1e8),
+                    "pairCreatedAt": 1700000000000,
+                })
+        bodies.append((chunk, json.dumps({"schemaVersion": "1.0.0", "pairs": out}).encode()))
+    return bodies
+
+
+def _pinned_bodies(bodies):
+    """Aynı kontratlar için /pairs yanıtları: sadece sabitlenmiş (en iyi) pair'ler."""
+    out = []
+    for chunk, body in bodies:
+        best = service._best_pairs_by_base(json.loads(body)["pairs"])
+        pairs = [best[service._addr_key(ca)] for ca in chunk]
+        out.append((chunk, json.dumps({"schemaVersion": "1.0.0", "pairs": pairs}).encode()))
+    return out
+
+
+def _pinned_chunk(data, chunk):
+    by_address = {service._addr_key(p.get("pairAddress")): p for p in data.get("pairs") or []}
+    return {ca: service._normalize_pair(p) for ca, p in zip(chunk, by_address.values())}
+
+
+def _best_of(rounds: int, fn, setup=lambda: None) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        arg = setup()
+        started = time.perf_counter()
+        fn(arg)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def _retained(fn, bodies, loads) -> int:
+    """Tick boyunca tutulan sonuç dict'inin boyutu (çözülmüş JSON serbest bırakıldıktan sonra)."""
+    tracemalloc.start()
+    stats = {}
+    for chunk, body in bodies:
+        stats.update(fn(loads(body), chunk))
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del stats
+    return size
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--contracts", type=int, default=10000)
+    ap.add_argument("--pairs", type=int, default=4, help="kontrat başına pair")
+    ap.add_argument("--batch", type=int, default=service.DEX_BATCH_SIZE)
+    ap.add_argument("--rounds", type=int, default=5)
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    bodies = _bodies(args.contracts, args.pairs, args.batch, args.seed)
+    mb = sum(len(b) for _, b in bodies) / 1e6
+    print(f"{args.contracts} kontrat × {args.pairs} pair, {len(bodies)} yanıt, {mb:.1f} MB JSON")
+
+    decoders = [("json", json.loads)]
+    if service.orjson is not None:
+        decoders.append(("orjson", service.orjson.loads))
+    for name, loads in decoders:
+        t = _best_of(args.rounds, lambda _: [loads(b) for _, b in bodies])
+        print(f"decode  {name:<8} {t * 1000:8.1f} ms")
+
+    def decoded():
+        # Eski yol listeleri yerinde sıraladığı için her tur taze çözülmüş veriyle
+        return [(chunk, json.loads(body)) for chunk, body in bodies]
+
+    for name, fn in (("eski", _old_chunk), ("yeni", _new_chunk)):
+        t = _best_of(args.rounds, lambda ds: [fn(data, chunk) for chunk, data in ds], decoded)
+        print(f"parse   {name:<8} {t * 1000:8.1f} ms")
+
+    pinned = _pinned_bodies(bodies)
+    t = _best_of(args.rounds, lambda _: [_pinned_chunk(service._loads(b), chunk) for chunk, b in pinned])
+    mb_pinned = sum(len(b) for _, b in pinned) / 1e6
+    print(f"sabit   decode+parse {t * 1000:8.1f} ms   {mb_pinned:.1f} MB JSON")
+
+    loads = service._loads
+    for name, fn in (("eski", _old_chunk), ("yeni", _new_chunk)):
+        size = _retained(fn, bodies, loads)
+        print(f"bellek  {name:<8} {size / 1e6:8.2f} MB   ({size / args.contracts:.0f} B/kontrat)")
+
+
+if __name__ == "__main__":
+    main()
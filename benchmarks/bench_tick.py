@@ -0,0 +1,388 @@
+# benchmarks/bench_tick.py
+"""
+Uçtan uca yük testi: sentetik nüfus → check_thresholds_and_notify tick'leri.
+
+1) Geçici (ya da --db ile kalıcı) bir SQLite dosyasına --users kullanıcı, --contracts
+   kontrat ve --subscriptions UserToken üretir (seed'li; popüler kontratlar --hot oranında).
+   Seviyeler başlangıç mcap'ine göre hesaplanır: ilk tick sadece gerçek geçişleri bildirir.
+2) DexScreener + Telegram taklitlerini ayrı süreçte başlatır (benchmarks/stand_ins.py;
+   gecikme, 429 oranı, yanıt boyutu ayarlanabilir).
+3) --ticks tur çalıştırır; her tur taklitteki fiyatlar ilerler. Tur başına tick süresi,
+   aşama süreleri (bot/metrics.py), gönderim kuyruğunun boşalma süresi, istek/mesaj
+   sayıları ve RSS ölçülür. Sonuç JSON olarak var/bench/ altına yazılır.
+
+    python -m benchmarks.bench_tick                                   # 100k/10k/1M
+    python -m benchmarks.bench_tick --subscriptions 100000 --contracts 2000 --users 20000
+    python -m benchmarks.bench_tick --dex-latency 80 --dex-throttle 0.02 --pairs 8
+    python -m benchmarks.bench_tick --db /tmp/pop.sqlite3             # nüfusu sonraki koşulara sakla
+    python -m benchmarks.bench_tick --compare var/bench/tick-önceki.json
+
+Varsayılanlar ölçümü yalıtır: önbellek, fiyat geçmişi ve uyarlamalı sorgu kapalı
+(her tick tüm kontratlar), DexScreener/Telegram hız sınırları kaldırılmış.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone as dt_timezone
+from typing import Any, Dict, List, Optional
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from benchmarks.stand_ins import (  # noqa: E402
+    StandInConfig, StandInProcess, base_market_cap, contract_address,
+)
+
+
+def _parse_args() -> argparse.Namespace:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    pop = ap.add_argument_group("nüfus")
+    pop.add_argument("--users", type=int, default=100_000)
+    pop.add_argument("--contracts", type=int, default=10_000)
+    pop.add_argument("--subscriptions", type=int, default=1_000_000, help="UserToken satırı")
+    pop.add_argument("--hot", type=float, default=0.5, help="aboneliklerin en popüler %%1 kontrata düşen oranı")
+    pop.add_argument("--seed", type=int, default=1)
+    pop.add_argument("--db", default="", help="nüfusu sakla: aynı parametrelerle varsa kopyası kullanılır")
+
+    up = ap.add_argument_group("taklitler")
+    up.add_argument("--volatility", type=float, default=0.05, help="tur başına log-mcap sapması")
+    up.add_argument("--pairs", type=int, default=3, help="kontrat başına havuz (yanıt boyutu)")
+    up.add_argument("--padding", type=int, default=0, help="pair başına ek bayt")
+    up.add_argument("--dex-latency", type=float, default=20.0, help="ms")
+    up.add_argument("--dex-jitter", type=float, default=10.0, help="ms")
+    up.add_argument("--dex-throttle", type=float, default=0.0, help="429 dönen istek oranı")
+    up.add_argument("--dex-retry-after", type=float, default=1.0, help="429 Retry-After (sn)")
+    up.add_argument("--tg-latency", type=float, default=30.0, help="ms")
+    up.add_argument("--tg-throttle", type=float, default=0.0, help="429 dönen sendMessage oranı")
+
+    run = ap.add_argument_group("koşu")
+    run.add_argument("--ticks", type=int, default=5)
+    run.add_argument("--budget", type=float, default=600.0, help="tick süre bütçesi (sn)")
+    run.add_argument("--max-in-flight", type=int, default=8, help="DexScreener eşzamanlı istek")
+    run.add_argument("--dex-rps", type=float, default=0.0, help="0: sınırsız")
+    run.add_argument("--send-workers", type=int, default=8)
+    run.add_argument("--send-rps", type=float, default=0.0, help="Telegram toplam mesaj/sn; 0: sınırsız")
+    run.add_argument("--drain-timeout", type=float, default=300.0, help="tur sonunda gönderim kuyruğu bekleme (sn)")
+    run.add_argument("--adaptive", action="store_true", help="uyarlamalı sorgu (varsayılan: her tick tüm kontratlar)")
+    run.add_argument("--cache", action="store_true", help="DexScreener sonuç önbelleği açık")
+    run.add_argument("--history", action="store_true", help="fiyat geçmişi açık")
+    run.add_argument("--pinning", action="store_true", help="DEX_PAIR_PINNING=1")
+
+    out = ap.add_argument_group("çıktı")
+    out.add_argument("--out", default="", help="sonuç JSON yolu (varsayılan var/bench/tick-<zaman>.json)")
+    out.add_argument("--compare", default="", help="karşılaştırılacak önceki sonuç JSON'u")
+    out.add_argument("--label", default="", help="sonuca eklenecek serbest etiket")
+    return ap.parse_args()
+
+
+def _configure_env(args: argparse.Namespace, db_path: str) -> None:
+    """Modül seviyesinde okunan ayarlar: Django ve bot modülleri import edilmeden önce."""
+    os.environ["DJANGO_DB_PATH"] = db_path
+    os.environ["DJANGO_SETTINGS_MODULE"] = "crypto_alert.settings"
+    os.environ["BOT_TOKEN"] = "bench"
+    os.environ["DEX_CACHE_ENABLED"] = "1" if args.cache else "0"
+    os.environ["DEX_PAIR_PINNING"] = "1" if args.pinning else "0"
+    os.environ["WATCHER_HISTORY_ENABLED"] = "1" if args.history else "0"
+    os.environ["WATCHER_ADAPTIVE_POLLING"] = "1" if args.adaptive else "0"
+    os.environ["WATCHER_TICK_BUDGET_SECONDS"] = str(args.budget)
+    os.environ["WATCHER_DIGEST_WINDOW_SECONDS"] = "0"
+
+
+# ---------------- Nüfus ----------------
+POPULATION_KEYS = ("users", "contracts", "subscriptions", "hot", "seed")
+
+
+def _population_params(args: argparse.Namespace) -> Dict[str, Any]:
+    return {k: getattr(args, k) for k in POPULATION_KEYS}
+
+
+def _sqlite_copy(src: str, dst: str) -> None:
+    """WAL dahil tutarlı kopya (backup API)."""
+    with sqlite3.connect(src) as source, sqlite3.connect(dst) as target:
+        source.backup(target)
+
+
+def _saved_population(args: argparse.Namespace) -> bool:
+    if not args.db or not os.path.exists(args.db + ".json"):
+        return False
+    with open(args.db + ".json") as f:
+        return json.load(f) == _population_params(args)
+
+
+def _populate(args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Ham executemany ile toplu yazım (ORM bulk_create 1M satırda dakikalar sürer).
+    Koşu her zaman çalışma kopyasında: tick'ler seviyeleri yazar, saklanan nüfus bozulmaz.
+    """
+    from django.core.management import call_command
+    from django.db import connection, transaction
+    from watcher.alerting import level_for
+    from watcher.models import Token, User, UserToken
+
+    work = os.environ["DJANGO_DB_PATH"]
+    if _saved_population(args):
+        connection.close()
+        _sqlite_copy(args.db, work)
+        call_command("migrate", verbosity=0)  # saklandıktan sonra eklenen migration'lar
+        return {"reused": True, "seconds": 0.0}
+
+    started = time.perf_counter()
+    call_command("migrate", verbosity=0)
+    rnd = random.Random(args.seed)
+    hot = max(1, args.contracts // 100)
+    per_user, extra = divmod(args.subscriptions, args.users)
+    now = datetime.now(dt_timezone.utc).replace(tzinfo=None).isoformat(" ")
+    bases = [base_market_cap(args.seed, i) for i in range(args.contracts)]
+
+    def user_tokens():
+        ut_id = 0
+        for u in range(args.users):
+            k = min(args.contracts, per_user + (1 if u < extra else 0))
+            picked = set()
+            while len(picked) < k:
+                hot_pick = rnd.random() < args.hot and len(picked) < hot  # popüler küme dolarsa hepsinden
+                picked.add(rnd.randrange(hot) if hot_pick else rnd.randrange(args.contracts))
+            for c in picked:
+                ut_id += 1
+                low = bases[c] * rnd.uniform(0.6, 1.4)
+                mid, high = low * rnd.uniform(1.2, 2.0), low * rnd.uniform(2.2, 4.0)
+                yield (ut_id, u + 1, c + 1, low, mid, high, level_for(bases[c], low, mid, high), now, False)
+
+    with transaction.atomic(), connection.cursor() as cur:
+        cur.executemany(f"INSERT INTO {Token._meta.db_table} (id, contract_address) VALUES (%s, %s)",
+                        ((i + 1, contract_address(i)) for i in range(args.contracts)))
+        cur.executemany(f"INSERT INTO {User._meta.db_table} (id, telegram_id) VALUES (%s, %s)",
+                        ((u + 1, str(10_000_000 + u)) for u in range(args.users)))
+        cur.executemany(
+            f"INSERT INTO {UserToken._meta.db_table} (id, user_id, token_id, threshold_low, threshold_mid, "
+            "threshold_high, last_alert_level, updated_at, alert_down) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)",
+            user_tokens(),
+        )
+    seconds = round(time.perf_counter() - started, 3)
+    if args.db:
+        connection.close()
+        if os.path.exists(args.db):
+            os.remove(args.db)
+        _sqlite_copy(work, args.db)
+        with open(args.db + ".json", "w") as f:
+            json.dump(_population_params(args), f)
+    return {"reused": False, "seconds": seconds}
+
+
+# ---------------- Ölçüm ----------------
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        return 0.0
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024  # macOS bayt, Linux KB
+
+
+def _stage_sums() -> Dict[str, float]:
+    from bot import metrics
+
+    stages = metrics.REGISTRY.get("watcher_tick_stage_seconds")
+    return {s: stages.labels(s).sum for s in ("load", "fetch", "evaluate", "write", "send")}
+
+
+def _dispatcher_counts() -> Dict[str, int]:
+    from bot.dispatcher import get_dispatcher
+
+    d = get_dispatcher()
+    return {"sent": d.sent, "failed": d.failed}
+
+
+async def _control(session, url: str, path: str, method: str = "GET") -> Dict[str, Any]:
+    async with session.request(method, f"{url}/_control/{path}") as resp:
+        return await resp.json()
+
+
+def _delta(after: Dict[str, Any], before: Dict[str, Any]) -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    for key, value in after.items():
+        if isinstance(value, dict):
+            out[key] = {k: v - before.get(key, {}).get(k, 0) for k, v in value.items()}
+        elif isinstance(value, (int, float)):
+            out[key] = round(value - before.get(key, 0), 6)
+    return out
+
+
+async def _run(args: argparse.Namespace, url: str) -> Dict[str, Any]:
+    import aiohttp  # type: ignore
+
+    from bot import service, services
+    from bot.clients import close_clients, start_clients
+    from bot.dispatcher import configure_dispatcher, get_dispatcher
+    from bot.throttle import configure_fetch_scheduler
+    from watcher import tasks
+    from watcher.registry import get_registry
+
+    service.DEX_BASE = f"{url}/latest/dex"
+    services.BASE_URL = f"{url}/botbench"
+    configure_fetch_scheduler(max_in_flight=args.max_in_flight, rps=args.dex_rps, burst=max(1, args.max_in_flight))
+    configure_dispatcher(workers=args.send_workers, global_rps=args.send_rps or 1e9, per_chat_interval=0.0)
+
+    await start_clients()
+    dispatcher = get_dispatcher()
+    await dispatcher.start()
+    control = aiohttp.ClientSession()
+    result: Dict[str, Any] = {}
+    try:
+        started = time.perf_counter()
+        await get_registry().ensure_loaded()
+        result["registry"] = {
+            "load_seconds": round(time.perf_counter() - started, 3),
+            "subscriptions": len(get_registry().index.subs),
+            "contracts": get_registry().index.contract_count(),
+            "rss_mb": round(_rss_mb(), 1),
+        }
+
+        ticks: List[Dict[str, Any]] = []
+        for n in range(1, args.ticks + 1):
+            await _control(control, url, f"tick?n={n}", "POST")
+            upstream, stages, sends = await _control(control, url, "stats"), _stage_sums(), _dispatcher_counts()
+            started = time.perf_counter()
+            await tasks.check_thresholds_and_notify(None)
+            tick_seconds = time.perf_counter() - started
+            drained = await dispatcher.join(args.drain_timeout)
+            drain_seconds = time.perf_counter() - started - tick_seconds
+            report = tasks._runner.last_report
+            ticks.append({
+                "tick": n,
+                "seconds": round(tick_seconds, 4),
+                "drain_seconds": round(drain_seconds, 4),
+                "drained": drained,
+                "processed": report.processed,
+                "carried": report.carried,
+                "crossings": report.crossings,
+                "stages": {k: round(v, 4) for k, v in _delta(_stage_sums(), stages).items()},
+                "messages": _delta(_dispatcher_counts(), sends),
+                "upstream": _delta(await _control(control, url, "stats"), upstream),
+                "rss_mb": round(_rss_mb(), 1),
+            })
+            line = ticks[-1]
+            print(f"tick {n:>3}  {line['seconds']:8.3f} sn  gönderim +{line['drain_seconds']:7.3f} sn  "
+                  f"geçiş {line['crossings']:>7,}  mesaj {line['messages']['sent']:>6,}  "
+                  f"dex istek {line['upstream']['dex_requests'] + line['upstream']['dex_pair_requests']:>5,}  "
+                  f"RSS {line['rss_mb']:7.1f} MB")
+        result["ticks"] = ticks
+        result["upstream_total"] = await _control(control, url, "stats")
+    finally:
+        await control.close()
+        await dispatcher.stop(drain_timeout=1.0)
+        await close_clients()
+    return result
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def _summary(result: Dict[str, Any]) -> Dict[str, Any]:
+    ticks = result["ticks"]
+    warm = [t["seconds"] for t in ticks[1:]] or [t["seconds"] for t in ticks]
+    return {
+        "cold_tick_seconds": ticks[0]["seconds"] if ticks else 0.0,
+        "warm_tick_p50_seconds": _percentile(warm, 0.5),
+        "warm_tick_p95_seconds": _percentile(warm, 0.95),
+        "warm_tick_max_seconds": max(warm) if warm else 0.0,
+        "registry_load_seconds": result["registry"]["load_seconds"],
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "messages_sent": sum(t["messages"]["sent"] for t in ticks),
+        "messages_failed": sum(t["messages"]["failed"] for t in ticks),
+        "dex_requests": sum(t["upstream"]["dex_requests"] + t["upstream"]["dex_pair_requests"] for t in ticks),
+        "dex_429": sum(t["upstream"]["dex_status"].get("429", 0) for t in ticks),
+    }
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR,
+                             capture_output=True, text=True, timeout=10)
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=BASE_DIR,
+                               capture_output=True, text=True, timeout=30)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    rev = out.stdout.strip()
+    return f"{rev}-dirty" if rev and dirty.stdout.strip() else (rev or None)
+
+
+def _compare(current: Dict[str, Any], path: str) -> None:
+    with open(path) as f:
+        previous = json.load(f)
+    print(f"\nkarşılaştırma: {path} ({previous.get('meta', {}).get('git')})")
+    for key, now in current["summary"].items():
+        before = previous.get("summary", {}).get(key)
+        if not isinstance(now, (int, float)) or not isinstance(before, (int, float)):
+            continue
+        change = f"{(now - before) / before * 100:+7.1f}%" if before else "       -"
+        print(f"  {key:<26} {before:>12,.3f} → {now:>12,.3f}  {change}")
+
+
+def main() -> None:
+    args = _parse_args()
+    tmp = tempfile.TemporaryDirectory()
+    _configure_env(args, os.path.join(tmp.name, "bench.sqlite3"))
+
+    import django
+
+    django.setup()
+
+    population = _populate(args)
+    source = "yeniden kullanıldı" if population["reused"] else f"{population['seconds']} sn"
+    print(f"nüfus: {args.users:,} kullanıcı, {args.contracts:,} kontrat, {args.subscriptions:,} abonelik ({source})")
+
+    config = StandInConfig(
+        contracts=args.contracts, seed=args.seed, volatility=args.volatility, pairs=args.pairs,
+        padding=args.padding, dex_latency=args.dex_latency / 1000, dex_jitter=args.dex_jitter / 1000,
+        dex_throttle_rate=args.dex_throttle, dex_retry_after=args.dex_retry_after,
+        tg_latency=args.tg_latency / 1000, tg_throttle_rate=args.tg_throttle,
+    )
+    with StandInProcess(config) as url:
+        result = asyncio.run(_run(args, url))
+
+    result["meta"] = {
+        "label": args.label,
+        "git": _git_revision(),
+        "started_at": datetime.now(dt_timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "args": vars(args),
+    }
+    result["population"] = dict(_population_params(args), **population)
+    result["summary"] = _summary(result)
+
+    out = args.out or os.path.join(BASE_DIR, "var", "bench", f"tick-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+
+    print()
+    for key, value in result["summary"].items():
+        print(f"  {key:<26} {value:>12,}" if isinstance(value, int) else f"  {key:<26} {value:>12,.3f}")
+    print(f"sonuç: {out}")
+    if args.compare:
+        _compare(result, args.compare)
+    tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+# benchmarks/stand_ins.py
+"""
+Yük testi için yerel DexScreener ve Telegram taklitleri (aiohttp, ayrı süreçte).
+
+Tek sunucu iki API'yi birden sunar:
+- GET  /latest/dex/tokens/{a,b,...}       kontrat başına `pairs` havuz (en likidi gerçek mcap)
+- GET  /latest/dex/pairs/{chain}/{p,...}  sabitlenmiş pair'ler (DEX_PAIR_PINNING)
+- POST /bot{token}/sendMessage            Telegram
+- GET  /_control/stats, POST /_control/tick?n=  sayaçlar / fiyat turunu ilerlet
+
+Sunucu ölçülen süreçten ayrı çalışır: JSON üretimi ve gecikme benzetimi tick süresine
+karışmaz. Fiyatlar (seed, tur, kontrat) ile belirlenir; aynı argümanlarla her koşu
+aynı yanıtları alır. 429'lar da seed'li sırayla gelir.
+"""
+from __future__ import annotations
+import asyncio
+import json
+import math
+import multiprocessing
+import random
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiohttp import web  # type: ignore
+
+
+# ---------------- Ortak (üretici ile paylaşılır) ----------------
+def contract_address(i: int) -> str:
+    return f"0x{i:040x}"
+
+
+def base_market_cap(seed: int, i: int) -> float:
+    """Kontratın başlangıç mcap'i: 1e4–1e8 arası log-düzgün."""
+    return 10 ** random.Random(f"{seed}:base:{i}").uniform(4, 8)
+
+
+def market_cap(seed: int, i: int, tick: int, volatility: float) -> float:
+    """Tur `tick`'te mcap: başlangıç × exp(σ·N(0,1)); tur 0 başlangıcın kendisi."""
+    base = base_market_cap(seed, i)
+    if tick == 0 or volatility <= 0:
+        return base
+    return base * math.exp(volatility * random.Random(f"{seed}:{tick}:{i}").gauss(0.0, 1.0))
+
+
+# ---------------- Sunucu ----------------
+@dataclass
+class StandInConfig:
+    contracts: int = 10_000
+    seed: int = 1
+    volatility: float = 0.05      # tur başına log-mcap sapması
+    pairs: int = 3                # kontrat başına havuz (yanıt boyutu)
+    padding: int = 0              # pair başına ek bayt (info.description)
+    dex_latency: float = 0.0      # sn
+    dex_jitter: float = 0.0       # sn, U(0, jitter) eklenir
+    dex_throttle_rate: float = 0.0  # isteklerin bu oranı 429
+    dex_retry_after: float = 1.0
+    tg_latency: float = 0.0
+    tg_throttle_rate: float = 0.0
+    tg_retry_after: int = 1
+
+
+@dataclass
+class StandInStats:
+    dex_requests: int = 0
+    dex_pair_requests: int = 0
+    dex_contracts: int = 0
+    dex_bytes: int = 0
+    dex_status: Dict[str, int] = field(default_factory=dict)
+    tg_requests: int = 0
+    tg_bytes: int = 0
+    tg_status: Dict[str, int] = field(default_factory=dict)
+    tg_chats: int = 0
+
+
+class StandIn:
+    def __init__(self, config: StandInConfig):
+        self.config = config
+        self.tick = 0
+        self.stats = StandInStats()
+        self._chats: set = set()
+        self._dex_rnd = random.Random(f"{config.seed}:dex-throttle")
+        self._tg_rnd = random.Random(f"{config.seed}:tg-throttle")
+        self._padding = "x" * config.padding
+
+    @staticmethod
+    def _count(table: Dict[str, int], status: int) -> None:
+        table[str(status)] = table.get(str(status), 0) + 1
+
+    def _pair(self, i: int, j: int, mcap: float) -> Dict[str, Any]:
+        address = contract_address(i)
+        liquidity = mcap / (10 * (j + 1))  # j = 0 en likit
+        pair = {
+            "chainId": "ethereum",
+            "dexId": "uniswap",
+            "url": f"https://dexscreener.com/ethereum/{address}p{j}",
+            "pairAddress": f"{address}p{j}",
+            "baseToken": {"address": address, "name": f"Token {i}", "symbol": f"T{i}"},
+            "quoteToken": {"address": "0x" + "e" * 40, "name": "Wrapped Ether", "symbol": "WETH"},
+            "priceUsd": f"{mcap / 1e9:.10f}",
+            "marketCap": mcap if j == 0 else mcap * 0.98,
+            "fdv": mcap,
+            "liquidity": {"usd": liquidity, "base": liquidity, "quote": liquidity},
+            "volume": {"h24": liquidity / 3, "h6": liquidity / 12, "h1": liquidity / 50, "m5": liquidity / 600},
+            "txns": {"h24": {"buys": 120, "sells": 95}},
+            "priceChange": {"h24": 1.5, "h6": -0.4, "h1": 0.1},
+        }
+        if self._padding:
+            pair["info"] = {"description": self._padding}
+        return pair
+
+    def _index_of(self, address: str) -> Optional[int]:
+        try:
+            i = int(address.lower().split("p", 1)[0], 16)
+        except ValueError:
+            return None
+        return i if 0 <= i < self.config.contracts else None
+
+    async def _dex_delay(self) -> Optional[web.Response]:
+        cfg = self.config
+        delay = cfg.dex_latency + (self._dex_rnd.uniform(0, cfg.dex_jitter) if cfg.dex_jitter else 0.0)
+        if delay:
+            await asyncio.sleep(delay)
+        if cfg.dex_throttle_rate and self._dex_rnd.random() < cfg.dex_throttle_rate:
+            self._count(self.stats.dex_status, 429)
+            return web.Response(status=429, headers={"Retry-After": str(cfg.dex_retry_after)})
+        return None
+
+    def _dex_body(self, pairs: List[Dict[str, Any]]) -> web.Response:
+        body = json.dumps({"schemaVersion": "1.0.0", "pairs": pairs}).encode()
+        self.stats.dex_bytes += len(body)
+        self._count(self.stats.dex_status, 200)
+        return web.Response(body=body, content_type="application/json")
+
+    async def tokens(self, request: web.Request) -> web.Response:
+        self.stats.dex_requests += 1
+        throttled = await self._dex_delay()
+        if throttled is not None:
+            return throttled
+        cfg = self.config
+        pairs: List[Dict[str, Any]] = []
+        for address in request.match_info["addrs"].split(","):
+            i = self._index_of(address)
+            if i is None:
+                continue
+            self.stats.dex_contracts += 1
+            mcap = market_cap(cfg.seed, i, self.tick, cfg.volatility)
+            pairs.extend(self._pair(i, j, mcap) for j in range(cfg.pairs))
+        return self._dex_body(pairs)
+
+    async def pairs_by_address(self, request: web.Request) -> web.Response:
+        self.stats.dex_pair_requests += 1
+        throttled = await self._dex_delay()
+        if throttled is not None:
+            return throttled
+        cfg = self.config
+        pairs: List[Dict[str, Any]] = []
+        for address in request.match_info["addrs"].split(","):
+            i = self._index_of(address)
+            if i is None:
+                continue
+            self.stats.dex_contracts += 1
+            j = int(address.split("p", 1)[1]) if "p" in address else 0
+            pairs.append(self._pair(i, j, market_cap(cfg.seed, i, self.tick, cfg.volatility)))
+        return self._dex_body(pairs)
+
+    async def send_message(self, request: web.Request) -> web.Response:
+        cfg = self.config
+        payload = await request.read()
+        self.stats.tg_requests += 1
+        self.stats.tg_bytes += len(payload)
+        if cfg.tg_latency:
+            await asyncio.sleep(cfg.tg_latency)
+        if cfg.tg_throttle_rate and self._tg_rnd.random() < cfg.tg_throttle_rate:
+            self._count(self.stats.tg_status, 429)
+            return web.json_response({"ok": False, "error_code": 429, "description": "Too Many Requests",
+                                      "parameters": {"retry_after": cfg.tg_retry_after}}, status=429)
+        chat_id = json.loads(payload).get("chat_id")
+        if chat_id not in self._chats:
+            self._chats.add(chat_id)
+            self.stats.tg_chats += 1
+        self._count(self.stats.tg_status, 200)
+        return web.json_response({"ok": True, "result": {"message_id": self.stats.tg_requests}})
+
+    async def control_stats(self, _request: web.Request) -> web.Response:
+        return web.json_response(dict(asdict(self.stats), tick=self.tick))
+
+    async def control_tick(self, request: web.Request) -> web.Response:
+        self.tick = int(request.query.get("n", self.tick + 1))
+        return web.json_response({"tick": self.tick})
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=1 << 20)
+        app.router.add_get("/latest/dex/tokens/{addrs}", self.tokens)
+        app.router.add_get("/latest/dex/pairs/{chain}/{addrs}", self.pairs_by_address)
+        app.router.add_post("/bot{token}/sendMessage", self.send_message)
+        app.router.add_get("/_control/stats", self.control_stats)
+        app.router.add_post("/_control/tick", self.control_tick)
+        return app
+
+
+def _serve(config: StandInConfig, conn) -> None:
+    async def main() -> None:
+        runner = web.AppRunner(StandIn(config).app(), access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        conn.send(runner.addresses[0][1])
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+class StandInProcess:
+    """Taklit sunucuyu alt süreçte başlatır: `with StandInProcess(cfg) as url: ...`."""
+
+    def __init__(self, config: StandInConfig):
+        self.config = config
+        self.url = ""
+        self._process: Optional[multiprocessing.Process] = None
+
+    def __enter__(self) -> str:
+        ctx = multiprocessing.get_context("spawn")  # Django/aiohttp durumu devralınmasın
+        parent, child = ctx.Pipe()
+        self._process = ctx.Process(target=_serve, args=(self.config, child), daemon=True)
+        self._process.start()
+        if not parent.poll(30):
+            self._process.terminate()
+            raise RuntimeError("Taklit sunucu başlamadı")
+        self.url = f"http://127.0.0.1:{parent.recv()}"
+        return self.url
+
+    def __exit__(self, *exc: Tuple[Any, ...]) -> None:
+        if self._process is not None:
+            self._process.terminate()
+            self._process.join(5)
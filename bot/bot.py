@@ -1,6 +1,7 @@
 # bot/bot.py
 import os
 import sys
+import asyncio
 import logging
 import django
 from dotenv import load_dotenv
@@ -15,15 +16,25 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "crypto_alert.settings")
 django.setup()
 
 # --- PTB ve job importları (Django setup'tan SONRA) ---
+from typing import Optional
+
 from telegram.ext import (  # type: ignore
     Application,
+    BasePersistence,
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
     ConversationHandler,
     filters,
 )
-from watcher.tasks import check_thresholds_and_notify
+from django.conf import settings
+from watcher.tasks import check_thresholds_and_notify, flush_alerts
+from bot.clients import start_clients, close_clients
+from bot.dispatcher import start_dispatcher, stop_dispatcher
+from bot.metrics import start_metrics_server, stop_metrics_server
+from watcher.registry import load_registry
+from watcher.history import flush_price_history, preload_price_history
+from watcher.profiling import install_signal_handler
 
 # --- .env ---
 load_dotenv()
@@ -50,12 +61,47 @@ from .handlers import (  # noqa: E402
 )
 
 
-def main() -> None:
-    if not BOT_TOKEN:
-        print("HATA: BOT_TOKEN bulunamadı. Lütfen .env dosyasını kontrol edin (BOT_TOKEN=...).")
-        return
+ALLOWED_UPDATES = ["message", "callback_query"]
+
+
+def _watcher_embedded() -> bool:
+    # Ayrı süreç (manage.py run_watcher / watcher.worker) varsa PTB sadece sohbet güncellemelerini işler.
+    # Webhook modunda her ASGI worker'ı bir Application kurar; döngü orada çalışmaz.
+    return (settings.WATCHER_EMBEDDED and settings.WATCHER_SHARDS <= 1
+            and not settings.TELEGRAM_WEBHOOK_URL)
+
+
+async def _post_init(app: Application) -> None:
+    await start_clients(app)
+    await start_dispatcher(app)
+    if _watcher_embedded():
+        await load_registry(app)
+        await preload_price_history(app)
+        install_signal_handler(asyncio.get_running_loop())  # SIGUSR1: sonraki tick'leri profille
+    if not settings.TELEGRAM_WEBHOOK_URL:
+        await start_metrics_server(app)  # webhook modunda ASGI'nin /metrics/ yolu var
+
+
+async def _post_shutdown(app: Application) -> None:
+    # Önce bekleyen özetleri ve kuyruktaki mesajları gönder, sonra bağlantıları kapat
+    if _watcher_embedded():
+        flush_alerts()
+    await stop_dispatcher(app)
+    await close_clients(app)
+    await flush_price_history()
+    await stop_metrics_server(app)
 
-    app = Application.builder().token(BOT_TOKEN).build()
+
+def build_application(token: str = BOT_TOKEN, persistence: Optional[BasePersistence] = None) -> Application:
+    """
+    Handler'ları ve (gömülü moddaysa) periyodik job'ları kurulmuş Application.
+    `persistence` verilirse (webhook: bot/persistence.py) wizard durumu onda tutulur.
+    """
+    # Paylaşımlı HTTP havuzları + gönderim kuyruğu: açılışta kur, kapanışta kapat
+    builder = Application.builder().token(token).post_init(_post_init).post_shutdown(_post_shutdown)
+    if persistence is not None:
+        builder = builder.persistence(persistence)
+    app = builder.build()
 
     # ---------- WIZARDLAR (ÖNCE bunları ekle) ----------
     add_conv = ConversationHandler(
@@ -65,7 +111,7 @@ def main() -> None:
         },
         fallbacks=[],
         name="addtoken_wizard",
-        persistent=False,
+        persistent=persistence is not None,
     )
     app.add_handler(add_conv)
 
@@ -79,7 +125,7 @@ def main() -> None:
         },
         fallbacks=[],
         name="setthreshold_wizard",
-        persistent=False,
+        persistent=persistence is not None,
     )
     app.add_handler(set_conv)
 
@@ -99,8 +145,49 @@ def main() -> None:
     app.add_handler(MessageHandler(filters.TEXT & filters.Regex(r"^Close$"), close_menu))
 
     # ---------- Periyodik eşik kontrolü (DexScreener) ----------
-    # 30 sn’de bir kontrol et (5 sn sonra başlasın)
-    app.job_queue.run_repeating(check_thresholds_and_notify, interval=30, first=5)
+    # WATCHER_TICK_SECONDS'ta bir kontrol et (5 sn sonra başlasın). Uyarlamalı modda
+    # her tick sadece zamanı gelen kontratları çeker (bkz. watcher/scheduler.py).
+    # Tick'ler üst üste binmez: runner kendi kilidini tutar, APScheduler da tek örnek çalıştırır.
+    # WATCHER_EMBEDDED=0 ya da WATCHER_SHARDS > 1 ise kontroller `manage.py run_watcher`
+    # / `python -m watcher.worker` süreçlerinde (bkz. watcher/sharding.py).
+    if _watcher_embedded():
+        app.job_queue.run_repeating(
+            check_thresholds_and_notify,
+            interval=settings.WATCHER_TICK_SECONDS,
+            first=5,
+            job_kwargs={"max_instances": 1, "coalesce": True},
+        )
+        # Fiyat geçmişi: bellekteki örnekleri periyodik olarak diske ekle
+        app.job_queue.run_repeating(flush_price_history, interval=settings.WATCHER_HISTORY_FLUSH_SECONDS, first=60)
+    return app
+
+
+async def _register_webhook(app: Application) -> None:
+    async with app.bot:
+        await app.bot.set_webhook(
+            url=settings.TELEGRAM_WEBHOOK_URL,
+            secret_token=settings.TELEGRAM_WEBHOOK_SECRET,
+            allowed_updates=ALLOWED_UPDATES,
+            max_connections=settings.TELEGRAM_WEBHOOK_MAX_CONNECTIONS,
+        )
+
+
+def main() -> None:
+    if not BOT_TOKEN:
+        print("HATA: BOT_TOKEN bulunamadı. Lütfen .env dosyasını kontrol edin (BOT_TOKEN=...).")
+        return
+
+    app = build_application()
+
+    if settings.TELEGRAM_WEBHOOK_URL:
+        # Webhook modu: güncellemeler ASGI uygulamasına gelir (bot/webhook.py); burada sadece kayıt.
+        # Sunucu: uvicorn crypto_alert.asgi:application --workers N (sohbet durumu DB'de)
+        if not settings.TELEGRAM_WEBHOOK_SECRET:
+            print("HATA: TELEGRAM_WEBHOOK_SECRET gerekli (webhook isteklerini doğrulamak için).")
+            return
+        asyncio.run(_register_webhook(app))
+        print(f"🔗 Webhook kaydedildi: {settings.TELEGRAM_WEBHOOK_URL}")
+        return
 
     print("🚀 Bot çalışıyor… Komutlar:")
     print("  /start")
@@ -109,7 +196,8 @@ def main() -> None:
     print("  /mytokens")
     print("  /setthreshold <low> <mid> <high> [contract]")
 
-    app.run_polling(allowed_updates=["message", "callback_query"])
+    # Polling webhook kaydını siler; webhook'tan polling'e dönmek için tekrar çalıştırmak yeterli
+    app.run_polling(allowed_updates=ALLOWED_UPDATES)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,255 @@
+# bot/cache.py
+from __future__ import annotations
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+DEX_CACHE_ENABLED = os.getenv("DEX_CACHE_ENABLED", "1") != "0"
+DEX_CACHE_TTL = float(os.getenv("DEX_CACHE_TTL", "5"))              # başarılı sonuç (sn)
+DEX_CACHE_ERROR_TTL = float(os.getenv("DEX_CACHE_ERROR_TTL", "2"))  # mcap'siz sonuç (sn); 0 → saklama
+DEX_CACHE_SIZE = int(os.getenv("DEX_CACHE_SIZE", "20000"))          # süreç içi LRU kapasitesi
+# Paylaşımlı katman: Django cache alias'ı (ör. "stats"); boşsa sadece süreç içi
+DEX_CACHE_SHARED = os.getenv("DEX_CACHE_SHARED", "")
+DEX_CACHE_LOCK_WAIT = float(os.getenv("DEX_CACHE_LOCK_WAIT", "3"))   # başka süreç çekerken bekleme üst sınırı
+
+_KEY_PREFIX = "dexstats:"
+_LOCK_PREFIX = "dexstats-lock:"
+_POLL_INTERVAL = 0.05
+
+Fetcher = Callable[[List[str]], Awaitable[Dict[str, Any]]]
+
+
+def _is_error(value: Any) -> bool:
+    return value is None or value.market_cap is None
+
+
+class StatsCache:
+    """
+    Kontrat → stats önbelleği, iki katman:
+    - süreç içi: girdi başına TTL, OrderedDict ile LRU tahliye, aynı anahtar için
+      uçuştaki isteği paylaşan future'lar (single-flight);
+    - opsiyonel paylaşımlı: Django cache framework (aynı makinedeki botlar için
+      FileBased/Redis/Memcached). Anahtar başına `add` ile kısa bir kilit alınır;
+      kilidi alamayan süreç, sahibinin yazdığı sonucu bekler. Böylece TTL penceresinde
+      kontrat başına tek upstream isteği yapılır.
+    Hatalı sonuçlar (mcap yok) daha kısa error_ttl ile saklanır.
+    """
+
+    def __init__(
+        self,
+        ttl: float = DEX_CACHE_TTL,
+        error_ttl: float = DEX_CACHE_ERROR_TTL,
+        maxsize: int = DEX_CACHE_SIZE,
+        shared: Optional[str] = DEX_CACHE_SHARED or None,
+        lock_wait: float = DEX_CACHE_LOCK_WAIT,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        self.maxsize = maxsize
+        self.shared_alias = shared
+        self.lock_wait = lock_wait
+        self.clock = clock
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.shared_hits = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    # ---------------- Süreç içi katman ----------------
+    def _ttl_for(self, value: Any) -> float:
+        return self.error_ttl if _is_error(value) else self.ttl
+
+    def get_local(self, key: str) -> Tuple[bool, Any]:
+        item = self._data.get(key)
+        if item is None:
+            return False, None
+        expires, value = item
+        if expires <= self.clock():
+            del self._data[key]
+            return False, None
+        self._data.move_to_end(key)
+        return True, value
+
+    def put_local(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self._ttl_for(value) if ttl is None else ttl
+        if ttl <= 0:
+            return
+        self._data[key] = (self.clock() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    # ---------------- Paylaşımlı katman (Django cache) ----------------
+    def _shared(self):
+        if not self.shared_alias:
+            return None
+        from django.core.cache import caches  # Django sadece bu katman açıksa gerekli
+        return caches[self.shared_alias]
+
+    async def _shared_get(self, keys: List[str]) -> Dict[str, Any]:
+        backend = self._shared()
+        if backend is None or not keys:
+            return {}
+        try:
+            found = await backend.aget_many([_KEY_PREFIX + k for k in keys])
+        except Exception:
+            log.exception("Paylaşımlı stats cache okunamadı")
+            return {}
+        return {k[len(_KEY_PREFIX):]: v for k, v in found.items()}
+
+    async def _shared_set(self, values: Dict[str, Any]) -> None:
+        backend = self._shared()
+        if backend is None:
+            return
+        try:
+            for ttl, group in _group_by_ttl(values, self._ttl_for).items():
+                if ttl > 0:
+                    await backend.aset_many({_KEY_PREFIX + k: v for k, v in group.items()},
+                                            timeout=max(1, math.ceil(ttl)))
+        except Exception:
+            log.exception("Paylaşımlı stats cache yazılamadı")
+
+    async def _claim(self, keys: List[str]) -> Tuple[List[str], List[str]]:
+        """Paylaşımlı kilit: (bu sürecin çekeceği, başka sürecin çektiği) anahtarlar."""
+        backend = self._shared()
+        if backend is None:
+            return keys, []
+        mine, theirs = [], []
+        for key in keys:
+            try:
+                won = await backend.aadd(_LOCK_PREFIX + key, 1, timeout=max(1, int(self.lock_wait) + 1))
+            except Exception:
+                won = True
+            (mine if won else theirs).append(key)
+        return mine, theirs
+
+    async def _release(self, keys: List[str]) -> None:
+        backend = self._shared()
+        if backend is None or not keys:
+            return
+        try:
+            await backend.adelete_many([_LOCK_PREFIX + k for k in keys])
+        except Exception:
+            pass
+
+    async def _wait_shared(self, keys: List[str]) -> Dict[str, Any]:
+        found: Dict[str, Any] = {}
+        deadline = time.monotonic() + self.lock_wait
+        missing = list(keys)
+        while missing and time.monotonic() < deadline:
+            await asyncio.sleep(_POLL_INTERVAL)
+            found.update(await self._shared_get(missing))
+            missing = [k for k in missing if k not in found]
+        return found
+
+    # ---------------- Ana giriş ----------------
+    async def get_many(self, keys: Iterable[str], fetch: Fetcher) -> Dict[str, Any]:
+        """
+        Önbellekte olmayanlar için `fetch(eksik_anahtarlar)` bir kez çağrılır.
+        Aynı anahtarı isteyen eşzamanlı çağrılar aynı isteğin sonucunu bekler.
+        """
+        out: Dict[str, Any] = {}
+        waiting: Dict[str, asyncio.Future] = {}
+        missing: List[str] = []
+        for key in dict.fromkeys(keys):
+            hit, value = self.get_local(key)
+            if hit:
+                self.hits += 1
+                out[key] = value
+            elif key in self._inflight:
+                waiting[key] = self._inflight[key]
+            else:
+                missing.append(key)
+
+        if missing:
+            self.misses += len(missing)
+            loop = asyncio.get_running_loop()
+            futures = {k: loop.create_future() for k in missing}
+            self._inflight.update(futures)
+            try:
+                fetched = await self._resolve(missing, fetch)
+            except BaseException as exc:
+                for fut in futures.values():
+                    if fut.done():
+                        continue
+                    if isinstance(exc, asyncio.CancelledError):
+                        fut.cancel()  # bekleyenler kendileri yeniden dener
+                    else:
+                        fut.set_exception(exc)
+                        fut.exception()  # bekleyen yoksa "never retrieved" uyarısını bastır
+                raise
+            finally:
+                for k in missing:
+                    self._inflight.pop(k, None)
+            for k, fut in futures.items():
+                value = fetched.get(k)
+                self.put_local(k, value)
+                if not fut.done():
+                    fut.set_result(value)
+                out[k] = value
+
+        retry: List[str] = []
+        for key, fut in waiting.items():
+            try:
+                out[key] = await asyncio.shield(fut)
+            except asyncio.CancelledError:
+                if not fut.cancelled():
+                    raise  # bu görev iptal edildi
+                retry.append(key)  # isteği başlatan iptal edildi
+        if retry:
+            out.update(await self.get_many(retry, fetch))
+        return out
+
+    async def _resolve(self, keys: List[str], fetch: Fetcher) -> Dict[str, Any]:
+        found = await self._shared_get(keys)
+        self.shared_hits += len(found)
+        rest = [k for k in keys if k not in found]
+        if not rest:
+            return found
+
+        mine, theirs = await self._claim(rest)
+        locked = list(mine)
+        try:
+            if theirs:
+                # Başka süreç çekiyor: onun sonucunu bekle, gelmeyeni kendimiz çekelim
+                waited = await self._wait_shared(theirs)
+                self.shared_hits += len(waited)
+                found.update(waited)
+                mine += [k for k in theirs if k not in waited]
+            if mine:
+                fetched = await fetch(mine)
+                found.update(fetched)
+                await self._shared_set({k: fetched.get(k) for k in mine})
+        finally:
+            await self._release(locked)
+        return found
+
+
+def _group_by_ttl(values: Dict[str, Any], ttl_for: Callable[[Any], float]) -> Dict[float, Dict[str, Any]]:
+    groups: Dict[float, Dict[str, Any]] = {}
+    for k, v in values.items():
+        groups.setdefault(ttl_for(v), {})[k] = v
+    return groups
+
+
+_stats_cache: Optional[StatsCache] = None
+
+
+def get_stats_cache() -> StatsCache:
+    global _stats_cache
+    if _stats_cache is None:
+        _stats_cache = StatsCache()
+    return _stats_cache
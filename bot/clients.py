@@ -0,0 +1,71 @@
+# bot/clients.py
+from __future__ import annotations
+import asyncio
+import os
+from typing import Any, Optional
+
+import aiohttp  # type: ignore
+
+# Uzun ömürlü bağlantı havuzu ayarları (TCP + TLS el sıkışması bir kez yapılır)
+HTTP_KEEPALIVE = float(os.getenv("HTTP_KEEPALIVE", "60"))
+HTTP_DNS_TTL = int(os.getenv("HTTP_DNS_TTL", "300"))
+DEX_CONN_LIMIT = int(os.getenv("DEX_CONN_LIMIT", "32"))
+DEX_CONN_PER_HOST = int(os.getenv("DEX_CONN_PER_HOST", "16"))
+TG_CONN_LIMIT = int(os.getenv("TG_CONN_LIMIT", "64"))
+TG_CONN_PER_HOST = int(os.getenv("TG_CONN_PER_HOST", "32"))
+
+
+class SessionPool:
+    """
+    Tek bir upstream için süreç boyunca yaşayan ClientSession.
+    Session event loop'a bağlı olduğundan loop değişirse yenisi açılır.
+    """
+
+    def __init__(self, limit: int, limit_per_host: int):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def get(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=HTTP_DNS_TTL,
+                keepalive_timeout=HTTP_KEEPALIVE,
+                enable_cleanup_closed=True,
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._loop = loop
+        return self._session
+
+    async def close(self) -> None:
+        session, self._session, self._loop = self._session, None, None
+        if session is not None and not session.closed:
+            await session.close()
+
+
+_dex = SessionPool(DEX_CONN_LIMIT, DEX_CONN_PER_HOST)
+_telegram = SessionPool(TG_CONN_LIMIT, TG_CONN_PER_HOST)
+
+
+def dex_session() -> aiohttp.ClientSession:
+    return _dex.get()
+
+
+def telegram_session() -> aiohttp.ClientSession:
+    return _telegram.get()
+
+
+async def start_clients(_app: Any = None) -> None:
+    """PTB Application.post_init: havuzları çalışan loop üzerinde aç."""
+    _dex.get()
+    _telegram.get()
+
+
+async def close_clients(_app: Any = None) -> None:
+    """PTB Application.post_shutdown: açık bağlantıları kapat."""
+    await _dex.close()
+    await _telegram.close()
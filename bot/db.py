@@ -0,0 +1,54 @@
+# bot/db.py
+"""
+DB helper'ları için sınırlı thread havuzu.
+
+`@sync_to_async` (thread_sensitive=True) tüm çağrıları tek bir thread'e sıralar:
+bütün sohbetlerin ve watcher'ın DB işleri birbirini bekler. Django 4.2'nin async ORM
+metotları (aget_or_create, aupdate, ...) da içeride aynı yolu kullanır; gerçek bir
+async sürücü yok. `@db_sync` ile sarılan helper'lar bunun yerine DB_EXECUTOR_THREADS
+boyutlu ayrı bir havuzda çalışır: her thread'in kendi kalıcı bağlantısı olur, bağlantı
+sayısı havuz boyutuyla sınırlı kalır. SQLite'ta okumalar WAL sayesinde paralel,
+yazmalar busy timeout ile sıraya girer (bkz. watcher/signals.py).
+
+DB_EXECUTOR_THREADS=0 → Django'nun varsayılan (thread-sensitive) yolu; testler
+TestCase transaction'ını görebilmek için bunu kullanır.
+"""
+from __future__ import annotations
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+T = TypeVar("T")
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_size = 0
+
+
+def get_db_executor() -> Optional[ThreadPoolExecutor]:
+    global _executor, _executor_size
+    size = getattr(settings, "DB_EXECUTOR_THREADS", 4)
+    if size <= 0:
+        return None
+    if _executor is None or _executor_size != size:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+        _executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="db")
+        _executor_size = size
+    return _executor
+
+
+def db_sync(fn: Callable[..., T]) -> Callable[..., Awaitable[T]]:
+    """`@sync_to_async` yerine: senkron ORM fonksiyonunu DB havuzunda çalıştırır."""
+
+    @functools.wraps(fn)
+    async def wrapper(*args: Any, **kwargs: Any) -> T:
+        executor = get_db_executor()
+        if executor is None:
+            return await sync_to_async(fn)(*args, **kwargs)
+        return await sync_to_async(fn, thread_sensitive=False, executor=executor)(*args, **kwargs)
+
+    wrapper.sync = fn  # type: ignore[attr-defined]
+    return wrapper
@@ -0,0 +1,278 @@
+# bot/dispatcher.py
+from __future__ import annotations
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import random
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from . import metrics, services
+from .throttle import TokenBucket
+
+log = logging.getLogger(__name__)
+
+# Telegram limitleri: ~30 mesaj/sn toplam, aynı sohbete ~1 mesaj/sn
+TG_GLOBAL_RPS = float(os.getenv("TG_GLOBAL_RPS", "30"))
+TG_PER_CHAT_INTERVAL = float(os.getenv("TG_PER_CHAT_INTERVAL", "1.0"))
+TG_SEND_WORKERS = int(os.getenv("TG_SEND_WORKERS", "8"))
+TG_SEND_RETRIES = int(os.getenv("TG_SEND_RETRIES", "3"))
+
+_SEND_SECONDS = metrics.histogram("telegram_send_seconds", "sendMessage isteği süresi")
+_MESSAGES = metrics.counter("telegram_messages_total", "Giden mesajların sonucu", ("result",))
+_SENT = _MESSAGES.labels("sent")
+_FAILED = _MESSAGES.labels("failed")
+_BLOCKED = _MESSAGES.labels("blocked")
+_SEND_RETRIES = metrics.counter("telegram_send_retries_total", "Tekrar kuyruğa alınan mesajlar", ("reason",))
+_RETRY_429 = _SEND_RETRIES.labels("429")
+_RETRY_ERROR = _SEND_RETRIES.labels("error")
+
+
+@dataclass
+class OutboundMessage:
+    chat_id: str
+    text: str
+    parse_mode: Optional[str] = "Markdown"
+    attempts: int = 0
+
+
+class TelegramDispatcher:
+    """
+    Giden mesaj kuyruğu + worker havuzu.
+    - Her sohbetin kendi FIFO'su var; hazır olma zamanına göre bir heap'te sıralanır,
+      böylece yoğun bir sohbet diğerlerini bekletmez (head-of-line blocking yok).
+    - Global token bucket toplam hızı, sohbet başı aralık tek sohbet hızını sınırlar.
+    - 429 → retry_after kadar sonra aynı mesaj tekrar; 403 → sohbet engellendi, düşür.
+    """
+
+    def __init__(
+        self,
+        workers: int = TG_SEND_WORKERS,
+        global_rps: float = TG_GLOBAL_RPS,
+        per_chat_interval: float = TG_PER_CHAT_INTERVAL,
+        max_retries: int = TG_SEND_RETRIES,
+        on_blocked: Optional[Callable[[str], Any]] = None,
+    ):
+        self.workers = max(1, workers)
+        self.bucket = TokenBucket(global_rps, burst=max(1, int(global_rps)))
+        self.per_chat_interval = per_chat_interval
+        self.max_retries = max_retries
+        self.on_blocked = on_blocked
+
+        self.blocked: Set[str] = set()
+        self.sent = 0
+        self.failed = 0
+
+        self._chats: Dict[str, Deque[OutboundMessage]] = {}
+        self._chat_next: Dict[str, float] = {}
+        self._ready: List[Tuple[float, int, str]] = []
+        self._seq = itertools.count()
+        self._pending = 0
+        self._tasks: List[asyncio.Task] = []
+        self._wake: Optional[asyncio.Event] = None
+        self._idle: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    # ---------------- Yaşam döngüsü ----------------
+    async def start(self) -> None:
+        self._ensure_started()
+
+    def _ensure_started(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._tasks:
+            return
+        self._loop = loop
+        self._wake = asyncio.Event()
+        self._idle = asyncio.Event()
+        if self._pending == 0:
+            self._idle.set()
+        self._tasks = [loop.create_task(self._worker(), name=f"tg-send-{i}") for i in range(self.workers)]
+
+    async def join(self, timeout: Optional[float] = None) -> bool:
+        """Kuyruk boşalana kadar bekle. Zaman aşımında False."""
+        if self._idle is None or self._pending == 0:
+            return True
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def stop(self, drain_timeout: Optional[float] = 10.0) -> None:
+        if drain_timeout:
+            await self.join(drain_timeout)
+        tasks, self._tasks = self._tasks, []
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    # ---------------- Kuyruk ----------------
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def enqueue(self, chat_id: str, text: str, parse_mode: Optional[str] = "Markdown") -> bool:
+        """
+        Mesajı kuyruğa ekler, beklemez. Engellenmiş sohbet için False döner.
+        """
+        chat_id = str(chat_id)
+        if not chat_id or chat_id in self.blocked:
+            return False
+        self._ensure_started()
+
+        msg = OutboundMessage(chat_id, text, parse_mode)
+        queue = self._chats.get(chat_id)
+        if queue is None:
+            queue = self._chats[chat_id] = deque()
+            self._schedule(chat_id, self._chat_next.pop(chat_id, 0.0))
+        queue.append(msg)
+        self._pending += 1
+        self._idle.clear()
+        return True
+
+    def unblock(self, chat_id: str) -> None:
+        """Kullanıcı botu tekrar başlattığında (/start) çağrılır."""
+        self.blocked.discard(str(chat_id))
+
+    def _schedule(self, chat_id: str, ready_at: float) -> None:
+        heapq.heappush(self._ready, (ready_at, next(self._seq), chat_id))
+        self._wake.set()
+
+    def _done(self, n: int = 1) -> None:
+        self._pending -= n
+        if self._pending <= 0:
+            self._pending = 0
+            self._idle.set()
+
+    # ---------------- Worker ----------------
+    async def _worker(self) -> None:
+        while True:
+            if not self._ready:
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+
+            ready_at, _, chat_id = self._ready[0]
+            delay = ready_at - time.monotonic()
+            if delay > 0:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._ready)
+            queue = self._chats[chat_id]
+            msg = queue.popleft()
+            try:
+                next_at = await self._deliver(msg)
+            except Exception:
+                log.exception("Telegram gönderimi beklenmedik hata: %s", chat_id)
+                self.failed += 1
+                _FAILED.inc()
+                self._done()
+                next_at = time.monotonic() + self.per_chat_interval
+
+            if chat_id in self.blocked:
+                self._done(len(queue))
+                self.failed += len(queue)
+                _BLOCKED.inc(len(queue))
+                queue.clear()
+            if queue:
+                self._schedule(chat_id, next_at)
+            else:
+                del self._chats[chat_id]
+                self._chat_next[chat_id] = next_at
+                self._prune_chat_next()
+
+    def _prune_chat_next(self) -> None:
+        if len(self._chat_next) < 10000:
+            return
+        now = time.monotonic()
+        self._chat_next = {c: t for c, t in self._chat_next.items() if t > now}
+
+    async def _deliver(self, msg: OutboundMessage) -> float:
+        """
+        Tek mesajı gönderir; sohbetin bir sonraki gönderim zamanını döndürür.
+        Tekrar denenecek mesaj sohbet kuyruğunun başına geri konur.
+        """
+        await self.bucket.acquire()
+        payload: Dict[str, Any] = {"chat_id": msg.chat_id, "text": msg.text}
+        if msg.parse_mode:
+            payload["parse_mode"] = msg.parse_mode
+        started = time.monotonic()
+        status, body = await services.telegram_api("sendMessage", payload)
+        now = time.monotonic()
+        _SEND_SECONDS.observe(now - started)
+
+        if status == 200 and (body or {}).get("ok", True):
+            self.sent += 1
+            _SENT.inc()
+            self._done()
+            return now + self.per_chat_interval
+
+        if status == 403:
+            # Kullanıcı botu engellemiş / sohbet silinmiş → bir daha deneme
+            self.blocked.add(msg.chat_id)
+            self.failed += 1
+            _BLOCKED.inc()
+            self._done()
+            if self.on_blocked is not None:
+                try:
+                    self.on_blocked(msg.chat_id)
+                except Exception:
+                    log.exception("on_blocked hatası: %s", msg.chat_id)
+            return now
+
+        retryable = status == 429 or status == 0 or status >= 500
+        if not retryable or msg.attempts >= self.max_retries:
+            log.warning("Telegram gönderilemedi (%s): %s %s", status, msg.chat_id, (body or {}).get("description"))
+            self.failed += 1
+            _FAILED.inc()
+            self._done()
+            return now + self.per_chat_interval
+
+        msg.attempts += 1
+        if status == 429:
+            _RETRY_429.inc()
+            retry_after = ((body or {}).get("parameters") or {}).get("retry_after") or 1
+            delay = float(retry_after)
+        else:
+            _RETRY_ERROR.inc()
+            delay = random.uniform(0, min(30.0, 0.5 * (2 ** msg.attempts)))
+        self._chats[msg.chat_id].appendleft(msg)
+        return now + max(delay, self.per_chat_interval)
+
+
+_dispatcher: Optional[TelegramDispatcher] = None
+
+
+def get_dispatcher() -> TelegramDispatcher:
+    global _dispatcher
+    if _dispatcher is None:
+        _dispatcher = TelegramDispatcher()
+    return _dispatcher
+
+
+metrics.gauge("telegram_queue_pending", "Gönderim kuyruğunda bekleyen mesaj",
+              lambda: _dispatcher.pending if _dispatcher is not None else 0)
+
+
+def configure_dispatcher(**kwargs) -> TelegramDispatcher:
+    """Varsayılanları (env) ezerek süreç genelindeki dispatcher'ı yeniden kurar (başlatmadan önce)."""
+    global _dispatcher
+    _dispatcher = TelegramDispatcher(**kwargs)
+    return _dispatcher
+
+
+async def start_dispatcher(_app: Any = None) -> None:
+    await get_dispatcher().start()
+
+
+async def stop_dispatcher(_app: Any = None) -> None:
+    await get_dispatcher().stop()
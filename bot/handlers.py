@@ -2,7 +2,8 @@
 import re
 from typing import Optional, Tuple, List
 
-from asgiref.sync import sync_to_async
+from django.db import IntegrityError, transaction
+from django.utils import timezone
 from telegram import (
     Update,
     ReplyKeyboardRemove,
@@ -15,6 +16,10 @@ from telegram.ext import (
 )
 
 from watcher.models import User, Token, UserToken
+from watcher.registry import get_registry
+from .db import db_sync
+from .dispatcher import get_dispatcher
+from .identity import get_identity_cache
 
 # -------------------- Utils --------------------
 # EVM (Ethereum/EVM zincirleri): 0x + 40 hex
@@ -47,53 +52,75 @@ CB_CLOSE = "CLOSE"
 
 (ST_SET_LO, ST_SET_MI, ST_SET_HI, ST_SET_CONTRACT, ST_ADD_CONTRACT) = range(5)
 
-# -------------------- DB Helpers (async-safe) --------------------
-@sync_to_async
-def _get_or_create_user(tg_id: str, username: Optional[str]) -> Tuple[User, bool]:
-    return User.objects.get_or_create(telegram_id=tg_id, defaults={"username": username})
-
-@sync_to_async
-def _get_or_create_token(contract: str) -> Tuple[Token, bool]:
-    return Token.objects.get_or_create(contract_address=contract)
-
-@sync_to_async
-def _get_or_create_user_token(user: User, token: Token) -> Tuple[UserToken, bool]:
-    return UserToken.objects.get_or_create(
-        user=user,
-        token=token,
-        defaults={"threshold_low": 500, "threshold_mid": 1000, "threshold_high": 1500},
-    )
+# -------------------- DB Helpers (async-safe, DB havuzunda; bkz. bot/db.py) --------------------
+# Kimlikler (telegram_id → User pk, contract → Token pk) bot/identity.py önbelleğinden gelir;
+# her komut en fazla bir DB turu (tek transaction) yapar.
+@db_sync
+def _subscribe(user_pk: int, tg_id: str, contract: str, token_pk: Optional[int]) -> Tuple[int, bool]:
+    with transaction.atomic():
+        if token_pk is None:
+            token_pk = Token.objects.get_or_create(contract_address=contract)[0].pk
+        # pk'li örnekler: post_save sinyali (watcher/signals.py) user/token için ayrıca sorgu atmaz
+        _, created = UserToken.objects.get_or_create(
+            user=User(pk=user_pk, telegram_id=tg_id),
+            token=Token(pk=token_pk, contract_address=contract),
+            defaults={"threshold_low": 500, "threshold_mid": 1000, "threshold_high": 1500},
+        )
+    return token_pk, created
 
-@sync_to_async
-def _user_tokens(user: User) -> List[UserToken]:
+@db_sync
+def _user_tokens(user_pk: int) -> List[UserToken]:
     return list(
         UserToken.objects.select_related("token")
-        .filter(user=user)
+        .filter(user_id=user_pk)
         .order_by("token__contract_address")
     )
 
-@sync_to_async
-def _update_thresholds_for_contract(user: User, contract: str, low: float, mid: float, high: float) -> int:
-    try:
-        token = Token.objects.get(contract_address=contract)
-    except Token.DoesNotExist:
-        return -1  # token yok
-    return UserToken.objects.filter(user=user, token=token).update(
-        threshold_low=low, threshold_mid=mid, threshold_high=high
+# .update() sinyal tetiklemez → watcher kaydına olayı elle bildir; updated_at da
+# elle set edilir ki başka süreçlerin uzlaştırması değişikliği görsün.
+@db_sync
+def _update_thresholds_for_contract(user_pk: int, tg_id: str, contract: str,
+                                    low: float, mid: float, high: float) -> int:
+    updated = UserToken.objects.filter(user_id=user_pk, token__contract_address=contract).update(
+        threshold_low=low, threshold_mid=mid, threshold_high=high, updated_at=timezone.now()
     )
+    if updated:
+        get_registry().thresholds_changed(tg_id, contract, low, mid, high)
+        return updated
+    if not Token.objects.filter(contract_address=contract).exists():
+        return -1  # token yok
+    return 0
 
-@sync_to_async
-def _update_thresholds_for_all(user: User, low: float, mid: float, high: float) -> int:
-    qs = UserToken.objects.filter(user=user)
-    count = qs.count()
+@db_sync
+def _update_thresholds_for_all(user_pk: int, tg_id: str, low: float, mid: float, high: float) -> int:
+    count = UserToken.objects.filter(user_id=user_pk).update(
+        threshold_low=low, threshold_mid=mid, threshold_high=high, updated_at=timezone.now()
+    )
     if count:
-        qs.update(threshold_low=low, threshold_mid=mid, threshold_high=high)
+        get_registry().thresholds_changed(tg_id, None, low, mid, high)
     return count
 
+async def _user_pk(update: Update) -> Tuple[int, str]:
+    tg_id, username = _tg_ids(update)
+    return await get_identity_cache().user_pk(tg_id, username), tg_id
+
+async def _add_subscription(update: Update, contract: str) -> bool:
+    identity = get_identity_cache()
+    user_pk, tg_id = await _user_pk(update)
+    try:
+        token_pk, created = await _subscribe(user_pk, tg_id, contract, identity.token_pk(contract))
+    except IntegrityError:
+        # Önbellekteki kimlik başka süreçte silinmiş: unut, bir kez DB'den yeniden çöz
+        identity.forget(tg_id, contract)
+        user_pk, tg_id = await _user_pk(update)
+        token_pk, created = await _subscribe(user_pk, tg_id, contract, None)
+    identity.remember_token(contract, token_pk)
+    return created
+
 # -------------------- Komut Handlers --------------------
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    tg_id, username = _tg_ids(update)
-    await _get_or_create_user(tg_id, username)
+    _, tg_id = await _user_pk(update)  # önbellekteyse DB'ye gitmez
+    get_dispatcher().unblock(tg_id)  # botu engelleyip geri dönen kullanıcı
 
     if update.message:
         await update.message.reply_text("👋 Hoş geldin! Bir seçim yap:", reply_markup=_inline_menu())
@@ -114,9 +141,6 @@ async def close_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("🧹 Menü kapatıldı.", reply_markup=ReplyKeyboardRemove())
 
 async def addtoken(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    tg_id, username = _tg_ids(update)
-    user, _ = await _get_or_create_user(tg_id, username)
-
     if not context.args:
         await update.message.reply_text("⚠️ Kullanım: `/addtoken <contract_address>`", parse_mode="Markdown")
         return
@@ -131,8 +155,7 @@ async def addtoken(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
 
-    token, _ = await _get_or_create_token(contract)
-    _, created = await _get_or_create_user_token(user, token)
+    created = await _add_subscription(update, contract)
 
     if created:
         await update.message.reply_text(f"✅ Takibe alındı:\n`{contract}`", parse_mode="Markdown")
@@ -146,11 +169,9 @@ async def mytokens(update: Update, context: ContextTypes.DEFAULT_TYPE):
         q = update.callback_query
         await q.answer()
 
-    tg_id, username = _tg_ids(update)
-    user, _ = await _get_or_create_user(tg_id, username)
-
     try:
-        items = await _user_tokens(user)
+        user_pk, _ = await _user_pk(update)
+        items = await _user_tokens(user_pk)
     except Exception as e:
         text = f"❌ DB hatası: {e}"
         if is_callback:
@@ -179,9 +200,6 @@ async def mytokens(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(text, parse_mode="Markdown")
 
 async def setthreshold(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    tg_id, username = _tg_ids(update)
-    user, _ = await _get_or_create_user(tg_id, username)
-
     if len(context.args) < 3:
         await update.message.reply_text(
             "⚠️ Kullanım: `/setthreshold <low> <mid> <high> [contract]`", parse_mode="Markdown"
@@ -206,7 +224,8 @@ async def setthreshold(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 parse_mode="Markdown",
             )
             return
-        updated = await _update_thresholds_for_contract(user, contract, low, mid, high)
+        user_pk, tg_id = await _user_pk(update)
+        updated = await _update_thresholds_for_contract(user_pk, tg_id, contract, low, mid, high)
         if updated == -1:
             await update.message.reply_text("❌ Bu contract adresi listende yok. Önce `/addtoken` ile ekle.")
         elif updated == 0:
@@ -218,7 +237,8 @@ async def setthreshold(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
         return
 
-    count = await _update_thresholds_for_all(user, low, mid, high)
+    user_pk, tg_id = await _user_pk(update)
+    count = await _update_thresholds_for_all(user_pk, tg_id, low, mid, high)
     if count == 0:
         await update.message.reply_text("🗒️ Önce `/addtoken <contract>` ile en az bir coin ekle.")
     else:
@@ -254,8 +274,6 @@ async def addtoken_inline_start(update: Update, context: ContextTypes.DEFAULT_TY
     return ST_ADD_CONTRACT
 
 async def addtoken_inline_capture(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    tg_id, username = _tg_ids(update)
-    user, _ = await _get_or_create_user(tg_id, username)
     contract = (update.message.text or "").strip()
 
     if not _is_supported_contract(contract):
@@ -265,8 +283,7 @@ async def addtoken_inline_capture(update: Update, context: ContextTypes.DEFAULT_
         )
         return ConversationHandler.END
 
-    token, _ = await _get_or_create_token(contract)
-    _, created = await _get_or_create_user_token(user, token)
+    created = await _add_subscription(update, contract)
     if created:
         await update.message.reply_text(f"✅ Takibe alındı: `{contract}`", parse_mode="Markdown", reply_markup=_inline_menu())
     else:
@@ -321,12 +338,11 @@ async def setthreshold_inline_high(update: Update, context: ContextTypes.DEFAULT
 
 async def setthreshold_inline_apply(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = (update.message.text or "").strip()
-    tg_id, username = _tg_ids(update)
-    user, _ = await _get_or_create_user(tg_id, username)
+    user_pk, tg_id = await _user_pk(update)
     low, mid, high = context.user_data["low"], context.user_data["mid"], context.user_data["high"]
 
     if text.lower() in {"tüm takipler", "tum takipler", "hepsi", "all"}:
-        count = await _update_thresholds_for_all(user, low, mid, high)
+        count = await _update_thresholds_for_all(user_pk, tg_id, low, mid, high)
         if count == 0:
             await update.message.reply_text("🗒️ Önce en az bir coin ekle: /addtoken <contract>")
         else:
@@ -343,7 +359,7 @@ async def setthreshold_inline_apply(update: Update, context: ContextTypes.DEFAUL
         )
         return ST_SET_CONTRACT
 
-    updated = await _update_thresholds_for_contract(user, text, low, mid, high)
+    updated = await _update_thresholds_for_contract(user_pk, tg_id, text, low, mid, high)
     if updated == -1:
         await update.message.reply_text("❌ Bu contract listende yok. Önce /addtoken ile ekle.")
     elif updated == 0:
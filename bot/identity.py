@@ -0,0 +1,163 @@
+# bot/identity.py
+"""
+Handler'lar için kimlik katmanı:
+- sınırlı LRU önbellek: telegram_id → User pk, contract → Token pk;
+- önbellekte olmayan kullanıcılar için eşzamanlı istekler birkaç ms toplanıp tek
+  bulk INSERT (ignore_conflicts) + tek SELECT ile çözülür: 1000 /start patlaması
+  SQLite'a 1000 get_or_create değil, birkaç sorgu olarak gider.
+Önbellek sadece event loop thread'inde okunur/yazılır; DB işleri bot/db.py havuzunda.
+"""
+from __future__ import annotations
+import asyncio
+import os
+from collections import OrderedDict
+from typing import Dict, Generic, Optional, Tuple, TypeVar
+
+from django.db import transaction
+
+from watcher.models import User
+
+from .db import db_sync
+
+IDENTITY_CACHE_SIZE = int(os.getenv("IDENTITY_CACHE_SIZE", "10000"))
+IDENTITY_BATCH_WINDOW = float(os.getenv("IDENTITY_BATCH_WINDOW", "0.005"))  # sn
+
+K = TypeVar("K")
+V = TypeVar("V")
+
+
+class LRU(Generic[K, V]):
+    def __init__(self, maxsize: int):
+        self.maxsize = max(1, maxsize)
+        self._data: "OrderedDict[K, V]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: K) -> Optional[V]:
+        value = self._data.get(key)
+        if value is not None:
+            self._data.move_to_end(key)
+        return value
+
+    def put(self, key: K, value: V) -> None:
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: K) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+@db_sync
+def _upsert_users(users: Dict[str, Optional[str]]) -> Dict[str, int]:
+    """Eksik kullanıcıları tek INSERT ile ekler, hepsinin pk'sini tek SELECT ile döndürür."""
+    with transaction.atomic():
+        User.objects.bulk_create(
+            [User(telegram_id=tg_id, username=username) for tg_id, username in users.items()],
+            ignore_conflicts=True,
+        )
+        return dict(User.objects.filter(telegram_id__in=list(users)).values_list("telegram_id", "id"))
+
+
+class IdentityCache:
+    def __init__(self, maxsize: int = IDENTITY_CACHE_SIZE, batch_window: float = IDENTITY_BATCH_WINDOW):
+        self.users: LRU[str, int] = LRU(maxsize)
+        self.tokens: LRU[str, int] = LRU(maxsize)
+        self.batch_window = batch_window
+        self._batch: Dict[str, Optional[str]] = {}
+        self._waiters: Dict[str, asyncio.Future] = {}
+        self._flush: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def clear(self) -> None:
+        self.users.clear()
+        self.tokens.clear()
+
+    async def user_pk(self, tg_id: str, username: Optional[str]) -> int:
+        """Kullanıcının pk'si; yoksa oluşturur (get_or_create: username sadece ilk kayıtta)."""
+        pk = self.users.get(tg_id)
+        if pk is not None:
+            return pk
+        fut = self._waiters.get(tg_id)
+        if fut is None:
+            self._loop = asyncio.get_running_loop()
+            fut = self._waiters[tg_id] = self._loop.create_future()
+            self._batch[tg_id] = username
+            if self._flush is None:
+                self._flush = asyncio.create_task(self._flush_batch())
+                self._flush.add_done_callback(self._flush_done)
+        return await asyncio.shield(fut)
+
+    async def _flush_batch(self) -> None:
+        await asyncio.sleep(self.batch_window)
+        batch, waiters = self._take_batch()  # sonrakiler yeni partiye
+        try:
+            pks = await _upsert_users(batch)
+        except BaseException as exc:
+            # İptal (kapanış) dahil: partideki hiçbir bekleyen asılı kalmasın
+            for fut in waiters.values():
+                if not fut.done():
+                    if isinstance(exc, Exception):
+                        fut.set_exception(exc)
+                    else:
+                        fut.cancel()
+            if not isinstance(exc, Exception):
+                raise
+            return
+        for tg_id, fut in waiters.items():
+            self.users.put(tg_id, pks[tg_id])
+            if not fut.done():
+                fut.set_result(pks[tg_id])
+
+    def _flush_done(self, task: asyncio.Task) -> None:
+        # Pencere içinde (ya da görev hiç başlamadan) iptal: parti hâlâ bu görevin
+        if self._flush is task:
+            _, waiters = self._take_batch()
+            for fut in waiters.values():
+                if not fut.done():
+                    fut.cancel()
+
+    def _take_batch(self) -> Tuple[Dict[str, Optional[str]], Dict[str, asyncio.Future]]:
+        batch, self._batch, self._flush = self._batch, {}, None
+        return batch, {tg_id: self._waiters.pop(tg_id) for tg_id in batch}
+
+    def remember_token(self, contract: str, pk: int) -> None:
+        self.tokens.put(contract, pk)
+
+    def token_pk(self, contract: str) -> Optional[int]:
+        return self.tokens.get(contract)
+
+    def forget(self, tg_id: Optional[str] = None, contract: Optional[str] = None) -> None:
+        if tg_id is not None:
+            self.users.pop(tg_id)
+        if contract is not None:
+            self.tokens.pop(contract)
+
+
+_identity: Optional[IdentityCache] = None
+
+
+def get_identity_cache() -> IdentityCache:
+    global _identity
+    if _identity is None:
+        _identity = IdentityCache()
+    return _identity
+
+
+def forget_identity(tg_id: Optional[str] = None, contract: Optional[str] = None) -> None:
+    """Silinen User/Token için (sinyaller, herhangi bir thread)."""
+    cache = get_identity_cache()
+    loop = cache._loop
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if loop is not None and loop.is_running() and running is not loop:
+        loop.call_soon_threadsafe(cache.forget, tg_id, contract)
+    else:
+        cache.forget(tg_id, contract)
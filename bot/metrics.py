@@ -0,0 +1,247 @@
+# bot/metrics.py
+"""
+Süreç içi metrikler (sayaç, gösterge, histogram) ve Prometheus metin biçimi.
+
+- Sıcak döngüde açık kalacak kadar ucuz: inc() bir toplama, observe() sabit kova
+  listesinde bisect + iki toplama. Etiketli metriklerin çocukları modül seviyesinde
+  bir kez alınır (`labels(...)`), döngüde sözlük araması bile yapılmaz.
+- Kilit yok: metrikler event loop thread'inde güncellenir (DB havuzu thread'leri yazmaz).
+- Değerler süreç başınadır. /metrics/ (crypto_alert/urls.py) sadece o ASGI worker'ının
+  değerlerini döndürür; polling botu ve `manage.py run_watcher` HTTP sunmadığı için
+  METRICS_PORT verilince aynı çıktıyı kendi küçük aiohttp dinleyicisinden sunar.
+"""
+from __future__ import annotations
+import logging
+import math
+import os
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+log = logging.getLogger(__name__)
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # 0: ayrı dinleyici yok
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Saniye; DexScreener isteği / tick aşaması / DB yazımı aynı ölçekte
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _fmt(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+# ---------------- Metrik türleri ----------------
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """Etiket değerleri için çocuk metrik; sıcak yolda modül seviyesinde bir kez alın."""
+        key = tuple(str(v) for v in values)
+        if len(key) != len(self.labelnames):
+            raise ValueError(f"{self.name}: {len(self.labelnames)} etiket bekleniyordu")
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = self._new_child()
+        return child
+
+    def _samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._children[()].inc(amount)
+
+    def _samples(self) -> Iterable[str]:
+        for key, child in self._children.items():
+            yield f"{self.name}{_label_text(self.labelnames, key)} {_fmt(child.value)}"
+
+
+class Gauge(Counter):
+    """Değer ya set() ile yazılır ya da `fn` verilirse çıktı alınırken okunur (sayım için ucuz)."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, fn: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation)
+        self.fn = fn
+
+    def set(self, value: float) -> None:
+        self._children[()].set(value)
+
+    def _samples(self) -> Iterable[str]:
+        if self.fn is not None:
+            try:
+                self.set(self.fn())
+            except Exception:
+                log.exception("Gösterge okunamadı: %s", self.name)
+        return super()._samples()
+
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...]) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # son kova: +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self) -> _HistogramValue:
+        return _HistogramValue(self.bounds)
+
+    def observe(self, value: float) -> None:
+        self._children[()].observe(value)
+
+    def _samples(self) -> Iterable[str]:
+        for key, child in self._children.items():
+            total = 0
+            for bound, count in zip(self.bounds + (math.inf,), child.counts):
+                total += count
+                le = _label_text(self.labelnames, key, f'le="{_fmt(bound)}"')
+                yield f"{self.name}_bucket{le} {total}"
+            labels = _label_text(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_fmt(child.sum)}"
+            yield f"{self.name}_count{labels} {total}"
+
+
+# ---------------- Kayıt ----------------
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        # Aynı ad ikinci kez kaydedilirse (modül yeniden yükleme, testler) ilki kullanılır
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            if type(existing) is not type(metric):
+                raise ValueError(f"{metric.name} farklı türle kayıtlı")
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))  # type: ignore[return-value]
+
+
+def gauge(name: str, documentation: str, fn: Optional[Callable[[], float]] = None) -> Gauge:
+    metric = REGISTRY.register(Gauge(name, documentation, fn))
+    if fn is not None:
+        metric.fn = fn  # type: ignore[attr-defined]
+    return metric  # type: ignore[return-value]
+
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))  # type: ignore[return-value]
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+# ---------------- Ayrı dinleyici (polling / run_watcher) ----------------
+_runner = None
+
+
+async def start_metrics_server(_app=None, port: int = METRICS_PORT, host: str = METRICS_HOST) -> None:
+    """METRICS_PORT > 0 ise GET /metrics/ sunan aiohttp dinleyicisini başlatır."""
+    global _runner
+    if port <= 0 or _runner is not None:
+        return
+    from aiohttp import web  # type: ignore
+
+    async def handle(_request):
+        return web.Response(body=render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    app.router.add_get("/metrics/", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    _runner = runner
+    log.info("Metrikler: http://%s:%s/metrics/", host, port)
+
+
+async def stop_metrics_server(_app=None) -> None:
+    global _runner
+    if _runner is not None:
+        runner, _runner = _runner, None
+        await runner.cleanup()
@@ -0,0 +1,171 @@
+# bot/persistence.py
+"""
+Webhook modunda PTB sohbet durumunun Django DB'sinde (BotState) paylaşılması.
+
+Telegram tek URL'ye gönderir; ASGI sunucusu güncellemeyi herhangi bir worker'a verebilir.
+Wizard adımı (ConversationHandler) ve user_data süreç belleğinde kalsaydı bir sohbetin
+adımları farklı süreçlere düşünce kaybolurdu. Bunun yerine (bkz. bot/webhook.py):
+- işlemeden önce: güncellemenin konuşma anahtarları ve kullanıcının user_data'sı tek
+  SELECT ile okunur (load_update); user_data PTB'nin refresh_user_data çağrısında verilir;
+- işledikten sonra: Application.update_persistence değişenleri yazar.
+Son okunan/yazılan değerler küçük bir LRU'da: değişmeyen user_data tekrar yazılmaz.
+chat_data, bot_data ve callback_data kullanılmıyor.
+"""
+from __future__ import annotations
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from telegram import Update  # type: ignore
+from telegram.ext import BasePersistence, ConversationHandler, PersistenceInput  # type: ignore
+
+from watcher.models import BotState
+
+from .db import db_sync
+from .identity import LRU
+
+PERSISTENCE_CACHE_SIZE = int(os.getenv("BOT_PERSISTENCE_CACHE_SIZE", "10000"))
+
+_USER = "user"
+
+
+def _conv_kind(name: str) -> str:
+    return f"conv:{name}"
+
+
+def _conv_key(key: Tuple[Any, ...]) -> str:
+    return json.dumps(list(key))
+
+
+@db_sync
+def _load(pairs: List[Tuple[str, str]]) -> Dict[Tuple[str, str], Any]:
+    wanted = set(pairs)
+    rows = BotState.objects.filter(kind__in={kind for kind, _ in wanted},
+                                   key__in={key for _, key in wanted}).values_list("kind", "key", "data")
+    return {(kind, key): data for kind, key, data in rows if (kind, key) in wanted}
+
+
+@db_sync
+def _store(kind: str, key: str, data: Any) -> None:
+    BotState.objects.update_or_create(kind=kind, key=key, defaults={"data": data})
+
+
+@db_sync
+def _drop(kind: str, key: str) -> None:
+    BotState.objects.filter(kind=kind, key=key).delete()
+
+
+class DjangoPersistence(BasePersistence):
+    """PTB BasePersistence: durum açılışta toplu yüklenmez, güncelleme başına okunur."""
+
+    def __init__(self, update_interval: float = 60, cache_size: int = PERSISTENCE_CACHE_SIZE):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self._known: LRU[Tuple[str, str], str] = LRU(cache_size)  # (kind, key) → DB'deki JSON
+        # user id → load_update'te okunan user_data (refresh_user_data tüketir; işlenmeyenler LRU'dan düşer)
+        self._prefetched: LRU[str, Dict[Any, Any]] = LRU(1024)
+
+    def _remember(self, kind: str, key: str, data: Any) -> bool:
+        """DB'deki değer `data` ise False (yazmaya gerek yok); değilse kaydeder, True."""
+        encoded = json.dumps(data, sort_keys=True)
+        if self._known.get((kind, key)) == encoded:
+            return False
+        self._known.put((kind, key), encoded)
+        return True
+
+    # ---------------- Güncelleme başına okuma ----------------
+    async def load_update(self, application, update: Update) -> None:
+        """Güncellemenin ilgilendirdiği konuşmaları handler'lara, user_data'yı önbelleğe yükler."""
+        targets: List[Tuple[ConversationHandler, Tuple[Any, ...], Tuple[str, str]]] = []
+        for handlers in application.handlers.values():
+            for handler in handlers:
+                if not (isinstance(handler, ConversationHandler) and handler.persistent and handler.name):
+                    continue
+                try:
+                    key = handler._get_key(update)  # PTB'nin kendi anahtarı (chat, user)
+                except RuntimeError:
+                    continue  # sohbeti/kullanıcısı olmayan güncelleme
+                targets.append((handler, key, (_conv_kind(handler.name), _conv_key(key))))
+        user = update.effective_user
+        user_pair = (_USER, str(user.id)) if user is not None else None
+        pairs = [pair for _, _, pair in targets] + ([user_pair] if user_pair else [])
+        if not pairs:
+            return
+        stored = await _load(pairs)
+        if user_pair is not None:
+            self._prefetched.put(user_pair[1], stored.get(user_pair) or {})
+        for handler, key, pair in targets:
+            state = stored.get(pair)
+            self._known.put(pair, json.dumps(state, sort_keys=True))
+            # Takipsiz güncelleme: okunan değer tekrar yazılmasın
+            if state is None:
+                handler._conversations.data.pop(key, None)
+            else:
+                handler._conversations.update_no_track({key: state})
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict[Any, Any]) -> None:
+        pair = (_USER, str(user_id))
+        data = self._prefetched.get(pair[1])
+        self._prefetched.pop(pair[1])
+        if data is None:
+            data = (await _load([pair])).get(pair) or {}
+        self._known.put(pair, json.dumps(data, sort_keys=True))
+        user_data.clear()
+        user_data.update(data)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Any) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: Any) -> None:
+        pass
+
+    # ---------------- Açılış (tembel: boş) ----------------
+    async def get_user_data(self) -> Dict[int, Dict[Any, Any]]:
+        return {}
+
+    async def get_chat_data(self) -> Dict[int, Any]:
+        return {}
+
+    async def get_bot_data(self) -> Any:
+        return {}
+
+    async def get_callback_data(self) -> Optional[Any]:
+        return None
+
+    async def get_conversations(self, name: str) -> Dict[Tuple[Any, ...], object]:
+        return {}
+
+    # ---------------- Yazma ----------------
+    async def update_conversation(self, name: str, key: Tuple[Any, ...], new_state: Optional[object]) -> None:
+        kind, ckey = _conv_kind(name), _conv_key(key)
+        if not self._remember(kind, ckey, new_state):
+            return
+        if new_state is None:
+            await _drop(kind, ckey)
+        else:
+            await _store(kind, ckey, new_state)
+
+    async def update_user_data(self, user_id: int, data: Dict[Any, Any]) -> None:
+        if self._remember(_USER, str(user_id), data):
+            await _store(_USER, str(user_id), data)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._known.pop((_USER, str(user_id)))
+        await _drop(_USER, str(user_id))
+
+    async def update_chat_data(self, chat_id: int, data: Any) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def update_bot_data(self, data: Any) -> None:
+        pass
+
+    async def update_callback_data(self, data: Any) -> None:
+        pass
+
+    async def flush(self) -> None:
+        pass  # her yazım anında DB'de
@@ -0,0 +1,90 @@
+# bot/pins.py
+"""
+Pair sabitleme (DEX_PAIR_PINNING=1):
+/tokens/{ca} kontratın tüm havuzlarını döndürür (çoğu zaman onlarca), biz sadece en
+likit olanı kullanırız. Keşiften sonra seçilen pair (chain_id + pair_address) hatırlanır
+ve sonraki tick'lerde çok daha küçük /pairs/{chain}/{p1,p2,...} uç noktası sorgulanır.
+
+Tam keşif (tokens uç noktası) yeniden yapılır:
+- sabit süre dolunca (DEX_PIN_REDISCOVER_SECONDS, yeni havuzlar için),
+- sabit pair'in likiditesi sabitlendiği andakinin DEX_PIN_LIQUIDITY_DROP katının altına
+  düşünce (likidite başka havuza taşınmış olabilir),
+- pair yanıtta yoksa ya da istek başarısızsa.
+"""
+from __future__ import annotations
+import os
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+DEX_PAIR_PINNING = os.getenv("DEX_PAIR_PINNING", "0") == "1"
+DEX_PIN_REDISCOVER_SECONDS = float(os.getenv("DEX_PIN_REDISCOVER_SECONDS", "900"))
+DEX_PIN_LIQUIDITY_DROP = float(os.getenv("DEX_PIN_LIQUIDITY_DROP", "0.5"))
+DEX_PIN_MAX = int(os.getenv("DEX_PIN_MAX", "100000"))
+
+
+@dataclass(slots=True)
+class Pin:
+    chain_id: str
+    pair_address: str
+    liquidity: float
+    pinned_at: float
+
+
+class PairPins:
+    def __init__(self, rediscover_seconds: float = DEX_PIN_REDISCOVER_SECONDS,
+                 liquidity_drop: float = DEX_PIN_LIQUIDITY_DROP, maxsize: int = DEX_PIN_MAX,
+                 clock: Callable[[], float] = time.monotonic):
+        self.rediscover_seconds = rediscover_seconds
+        self.liquidity_drop = liquidity_drop
+        self.maxsize = maxsize
+        self.clock = clock
+        self._pins: Dict[str, Pin] = {}
+
+    def __len__(self) -> int:
+        return len(self._pins)
+
+    def clear(self) -> None:
+        self._pins.clear()
+
+    def get(self, contract: str) -> Optional[Pin]:
+        return self._pins.get(contract)
+
+    def split(self, contracts: List[str]) -> Tuple[Dict[str, Pin], List[str]]:
+        """(sabit pair'i geçerli olanlar, tam keşif gerekenler)."""
+        now = self.clock()
+        pinned: Dict[str, Pin] = {}
+        discover: List[str] = []
+        for contract in contracts:
+            pin = self._pins.get(contract)
+            if pin is not None and now - pin.pinned_at < self.rediscover_seconds:
+                pinned[contract] = pin
+            else:
+                discover.append(contract)
+        return pinned, discover
+
+    def pin(self, contract: str, chain_id: Optional[str], pair_address: Optional[str],
+            liquidity: Optional[float]) -> None:
+        """Keşif sonucu; likiditesi bilinmeyen pair sabitlenmez."""
+        if not chain_id or not pair_address or not liquidity:
+            self._pins.pop(contract, None)
+            return
+        if contract not in self._pins and len(self._pins) >= self.maxsize:
+            self._pins.pop(next(iter(self._pins)))  # en eski sabitleme
+        self._pins[contract] = Pin(chain_id, pair_address, liquidity, self.clock())
+
+    def healthy(self, pin: Pin, liquidity: Optional[float]) -> bool:
+        return liquidity is not None and liquidity >= pin.liquidity * self.liquidity_drop
+
+    def unpin(self, contract: str) -> None:
+        self._pins.pop(contract, None)
+
+
+_pins: Optional[PairPins] = None
+
+
+def get_pair_pins() -> PairPins:
+    global _pins
+    if _pins is None:
+        _pins = PairPins()
+    return _pins
@@ -1,108 +1,320 @@
 # bot/service.py
 from __future__ import annotations
 import asyncio
+import json
+import os
+import time
+from dataclasses import dataclass
 from typing import Any, Dict, List, Optional, Tuple
 
 import aiohttp  # type: ignore
 
-DEX_BASE = "https://api.dexscreener.com/latest/dex"
+try:  # opsiyonel: json'dan birkaç kat hızlı
+    import orjson  # type: ignore
+except ImportError:  # pragma: no cover
+    orjson = None
+
+from . import metrics
+from .cache import DEX_CACHE_ENABLED, get_stats_cache
+from .clients import dex_session
+from .pins import DEX_PAIR_PINNING, Pin, get_pair_pins
+from .throttle import get_fetch_scheduler, parse_retry_after
+
+DEX_BASE = os.getenv("DEX_BASE_URL", "https://api.dexscreener.com/latest/dex")
 DEFAULT_TIMEOUT = aiohttp.ClientTimeout(total=12)
-_RETRIES = 2
+_RETRIES = int(os.getenv("DEX_RETRIES", "2"))
+_RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# /tokens/{a,b,c} tek istekte en fazla 30 adres kabul ediyor
+DEX_BATCH_SIZE = int(os.getenv("DEX_BATCH_SIZE", "30"))
+DEX_BATCHED = os.getenv("DEX_BATCHED", "1") != "0"
+
+DEX_FAST_JSON = os.getenv("DEX_FAST_JSON", "1") != "0"
+
+_loads = orjson.loads if (orjson is not None and DEX_FAST_JSON) else json.loads
+
+# ---------------- Metrikler ----------------
+_REQUEST_SECONDS = metrics.histogram(
+    "dex_request_seconds", "DexScreener isteği süresi (deneme başına, gövde okuma dahil)")
+_RESPONSES = metrics.counter(
+    "dex_responses_total", "DexScreener yanıtları (HTTP kodu; timeout/error: yanıt yok)", ("status",))
+_RETRIES_TOTAL = metrics.counter("dex_retries_total", "Tekrar denenen DexScreener istekleri")
+_THROTTLED = metrics.counter("dex_throttled_total", "429 yanıtı sonrası süreç geneli bekleme")
+_PARSE_ERRORS = metrics.counter("dex_parse_errors_total", "200 dönüp çözülemeyen yanıtlar")
+_STATUS_200 = _RESPONSES.labels("200")
+_STATUS_TIMEOUT = _RESPONSES.labels("timeout")
+_STATUS_ERROR = _RESPONSES.labels("error")
+
+
+@dataclass(slots=True)
+class TokenStats:
+    """
+    Kontratın seçilen (en likit) pair'inden normalize edilmiş veri.
+    Tick boyunca kontrat başına bir tane tutulur (slots: dict'e göre küçük).
+    Salt okunur kabul edilir: önbellek ve watcher aynı nesneyi paylaşır. frozen=True
+    kullanılmadı; alan başına object.__setattr__ kurulumu ~5 kat yavaşlatıyor.
+    market_cap None → veri yok (error nedenini söyler).
+    """
+    market_cap: Optional[float] = None
+    price_usd: Optional[float] = None
+    liquidity_usd: Optional[float] = None
+    volume_h24: Optional[float] = None
+    fdv: Optional[float] = None
+    pair_url: Optional[str] = None
+    chain_id: Optional[str] = None
+    dex_id: Optional[str] = None
+    pair_address: Optional[str] = None
+    base_symbol: Optional[str] = None
+    base_address: Optional[str] = None
+    quote_symbol: Optional[str] = None
+    error: Optional[str] = None
+
+
+# Hata kayıtları değişmez; kontrat başına yeni nesne üretmeye gerek yok
+NO_PAIRS = TokenStats(error="no_pairs")
+HTTP_ERROR = TokenStats(error="http_or_parse_error")
 
 
 async def _get_json(session: aiohttp.ClientSession, url: str) -> Optional[Dict[str, Any]]:
+    scheduler = get_fetch_scheduler()
     for attempt in range(_RETRIES + 1):
+        retry_after: Optional[float] = None
         try:
-            async with session.get(url, timeout=DEFAULT_TIMEOUT) as resp:
-                if resp.status == 200:
-                    return await resp.json()
-                if resp.status in (429, 500, 502, 503, 504) and attempt < _RETRIES:
-                    await asyncio.sleep(0.6 * (attempt + 1))
-                    continue
-                return None
+            async with scheduler.slot():
+                started = time.perf_counter()
+                try:
+                    async with session.get(url, timeout=DEFAULT_TIMEOUT) as resp:
+                        if resp.status == 200:
+                            body = await resp.read()
+                            _REQUEST_SECONDS.observe(time.perf_counter() - started)
+                            _STATUS_200.inc()
+                            try:
+                                return _loads(body)
+                            except ValueError:
+                                _PARSE_ERRORS.inc()
+                                return None
+                        _REQUEST_SECONDS.observe(time.perf_counter() - started)
+                        _RESPONSES.labels(resp.status).inc()
+                        if resp.status == 429:
+                            # Son denemede de: süreçteki diğer istekler Retry-After kadar beklesin
+                            retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+                            _THROTTLED.inc()
+                            scheduler.throttled(scheduler.retry_delay(attempt, retry_after))
+                        if resp.status not in _RETRY_STATUSES or attempt >= _RETRIES:
+                            return None
+                except asyncio.TimeoutError:
+                    _REQUEST_SECONDS.observe(time.perf_counter() - started)
+                    _STATUS_TIMEOUT.inc()
+                    raise
         except asyncio.TimeoutError:
-            if attempt < _RETRIES:
-                continue
-            return None
+            if attempt >= _RETRIES:
+                return None
         except Exception:
+            _STATUS_ERROR.inc()
             return None
+        _RETRIES_TOTAL.inc()
+        delay = scheduler.retry_delay(attempt, retry_after)
+        # Bekleme slot dışında: in-flight kotası başka isteklere kalsın
+        await asyncio.sleep(delay)
     return None
 
 
+_NO_RANK = (float("-inf"), float("-inf"))
+
+
+def _rank(pair: Dict[str, Any]) -> Tuple[float, float]:
+    return (
+        (pair.get("liquidity") or {}).get("usd", 0) or 0,
+        (pair.get("volume") or {}).get("h24", 0) or 0,
+    )
+
+
 def _pick_best_pair(pairs: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Likidite, sonra 24s hacim; eşitlikte ilk gelen. Tek geçiş, listeyi değiştirmez."""
     if not pairs:
         return None
-    pairs.sort(
-        key=lambda p: (
-            (p.get("liquidity") or {}).get("usd", 0) or 0,
-            (p.get("volume") or {}).get("h24", 0) or 0,
-        ),
-        reverse=True,
-    )
-    return pairs[0]
+    return max(pairs, key=_rank)
+
+
+def _float(value: Any) -> Optional[float]:
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
 
 
-def _normalize_pair(top: Dict[str, Any]) -> Dict[str, Any]:
+def _normalize_pair(top: Dict[str, Any]) -> TokenStats:
     base = (top.get("baseToken") or {})
     quote = (top.get("quoteToken") or {})
-    price_usd = top.get("priceUsd")
-    try:
-        price_usd = float(price_usd) if price_usd is not None else None
-    except Exception:
-        price_usd = None
+    fdv = _float(top.get("fdv"))
+    raw_mcap = top.get("marketCap")
+    return TokenStats(
+        market_cap=_float(raw_mcap) if raw_mcap is not None else fdv,
+        price_usd=_float(top.get("priceUsd")),
+        liquidity_usd=_float((top.get("liquidity") or {}).get("usd")),
+        volume_h24=_float((top.get("volume") or {}).get("h24")),
+        fdv=fdv,
+        pair_url=top.get("url"),
+        chain_id=top.get("chainId"),
+        dex_id=top.get("dexId"),
+        pair_address=top.get("pairAddress"),
+        base_symbol=base.get("symbol"),
+        base_address=base.get("address"),
+        quote_symbol=quote.get("symbol"),
+    )
 
-    mcap = top.get("marketCap")
-    if mcap is None:
-        mcap = top.get("fdv")
-    try:
-        mcap = float(mcap) if mcap is not None else None
-    except Exception:
-        mcap = None
-
-    return {
-        "pair_url": top.get("url"),
-        "chain_id": top.get("chainId"),
-        "dex_id": top.get("dexId"),
-        "base_symbol": base.get("symbol"),
-        "base_address": base.get("address"),
-        "quote_symbol": quote.get("symbol"),
-        "price_usd": price_usd,
-        "market_cap": mcap,
-        "fdv": top.get("fdv"),
-        "liquidity_usd": (top.get("liquidity") or {}).get("usd"),
-        "volume_h24": (top.get("volume") or {}).get("h24"),
-    }
-
-
-async def fetch_token_stats(contract: str) -> Tuple[Optional[float], Dict[str, Any]]:
-    url = f"{DEX_BASE}/tokens/{contract}"
-    async with aiohttp.ClientSession() as session:
-        data = await _get_json(session, url)
-    if not data:
-        return (None, {"error": "http_or_parse_error"})
 
-    pairs = data.get("pairs") or []
+def _addr_key(addr: Optional[str]) -> str:
+    """
+    EVM adresleri büyük/küçük harf duyarsız (checksum), Solana base58 duyarlı.
+    """
+    addr = (addr or "").strip()
+    return addr.lower() if addr.startswith("0x") else addr
+
+
+def _stats_from_pairs(pairs: List[Dict[str, Any]]) -> TokenStats:
     top = _pick_best_pair(pairs)
     if not top:
-        return (None, {"error": "no_pairs"})
-
-    norm = _normalize_pair(top)
-    return (norm["market_cap"], norm)
-
-
-async def fetch_many_stats(contracts: List[str]) -> Dict[str, Tuple[Optional[float], Dict[str, Any]]]:
-    async with aiohttp.ClientSession() as session:
-        async def _one(ca: str):
-            url = f"{DEX_BASE}/tokens/{ca}"
-            data = await _get_json(session, url)
-            if not data:
-                return ca, (None, {"error": "http_or_parse_error"})
-            pairs = data.get("pairs") or []
-            top = _pick_best_pair(pairs)
-            if not top:
-                return ca, (None, {"error": "no_pairs"})
-            norm = _normalize_pair(top)
-            return ca, (norm["market_cap"], norm)
-
-        results = await asyncio.gather(*(_one(ca) for ca in contracts), return_exceptions=False)
-        return dict(results)
+        return NO_PAIRS
+    return _normalize_pair(top)
+
+
+def _best_pairs_by_base(pairs: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Toplu yanıtta baseToken başına en iyi pair; ara listeler kurmadan tek geçiş."""
+    best: Dict[str, Dict[str, Any]] = {}
+    ranks: Dict[str, Tuple[float, float]] = {}
+    for p in pairs:
+        key = _addr_key((p.get("baseToken") or {}).get("address"))
+        if not key:
+            continue
+        rank = _rank(p)
+        if rank > ranks.get(key, _NO_RANK):
+            ranks[key] = rank
+            best[key] = p
+    return best
+
+
+def _chunks(items: List[Any], size: int) -> List[List[Any]]:
+    size = max(1, size)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+async def _fetch_one(session: aiohttp.ClientSession, contract: str) -> TokenStats:
+    data = await _get_json(session, f"{DEX_BASE}/tokens/{contract}")
+    if not data:
+        return HTTP_ERROR
+    return _stats_from_pairs(data.get("pairs") or [])
+
+
+async def _fetch_chunk(session: aiohttp.ClientSession, chunk: List[str]) -> Dict[str, TokenStats]:
+    """
+    Birden fazla kontratı tek /tokens/{a,b,...} isteğiyle çeker; dönen pair'leri
+    baseToken.address'e göre dağıtır. İstek başarısızsa kontratları tek tek dener.
+    """
+    data = await _get_json(session, f"{DEX_BASE}/tokens/{','.join(chunk)}")
+    if not data:
+        results = await asyncio.gather(*(_fetch_one(session, ca) for ca in chunk))
+        return dict(zip(chunk, results))
+
+    best = _best_pairs_by_base(data.get("pairs") or [])
+    out: Dict[str, TokenStats] = {}
+    for ca in chunk:
+        top = best.get(_addr_key(ca))
+        out[ca] = _normalize_pair(top) if top is not None else NO_PAIRS
+    return out
+
+
+async def _discover(session: aiohttp.ClientSession, contracts: List[str],
+                    batched: bool) -> Dict[str, TokenStats]:
+    """Tam keşif: tokens uç noktası, kontratın tüm havuzlarından en iyisi."""
+    if not batched:
+        results = await asyncio.gather(*(_fetch_one(session, ca) for ca in contracts))
+        return dict(zip(contracts, results))
+
+    out: Dict[str, TokenStats] = {}
+    parts = await asyncio.gather(*(_fetch_chunk(session, c) for c in _chunks(contracts, DEX_BATCH_SIZE)))
+    for part in parts:
+        out.update(part)
+    return out
+
+
+async def _fetch_pairs_chunk(session: aiohttp.ClientSession, chain_id: str,
+                             chunk: List[Tuple[str, Pin]]) -> Optional[Dict[str, Optional[Dict[str, Any]]]]:
+    """
+    Aynı zincirdeki sabit pair'ler tek /pairs/{chain}/{p1,p2,...} isteğiyle.
+    İstek başarısızsa (ağ/HTTP/parse) None: pair'in kaybolduğu bilinmiyor.
+    """
+    data = await _get_json(session, f"{DEX_BASE}/pairs/{chain_id}/{','.join(pin.pair_address for _, pin in chunk)}")
+    if not data:
+        return None
+    pairs = data.get("pairs") or ([data["pair"]] if data.get("pair") else [])
+    by_address = {_addr_key(p.get("pairAddress")): p for p in pairs}
+    return {ca: by_address.get(_addr_key(pin.pair_address)) for ca, pin in chunk}
+
+
+async def _fetch_pinned(session: aiohttp.ClientSession,
+                        pinned: Dict[str, Pin]) -> Tuple[Dict[str, TokenStats], List[str]]:
+    """Sabit pair'leri çeker. Dönüş: (sonuçlar, yeniden keşfedilecek kontratlar)."""
+    pins = get_pair_pins()
+    by_chain: Dict[str, List[Tuple[str, Pin]]] = {}
+    for ca, pin in pinned.items():
+        by_chain.setdefault(pin.chain_id, []).append((ca, pin))
+    jobs = [(chain, chunk) for chain, items in by_chain.items() for chunk in _chunks(items, DEX_BATCH_SIZE)]
+    parts = await asyncio.gather(*(_fetch_pairs_chunk(session, chain, chunk) for chain, chunk in jobs))
+
+    out: Dict[str, TokenStats] = {}
+    lost: List[str] = []
+    for (_, chunk), part in zip(jobs, parts):
+        if part is None:
+            # Geçici hata (429/5xx/zaman aşımı): sabitleme kalır, sonraki tick tekrar dener
+            out.update((ca, HTTP_ERROR) for ca, _ in chunk)
+            continue
+        for ca, pair in part.items():
+            stats = _normalize_pair(pair) if pair is not None else None
+            if stats is None or not pins.healthy(pinned[ca], stats.liquidity_usd):
+                # Pair kayboldu ya da likidite düştü: tam keşif bu tick'te
+                pins.unpin(ca)
+                lost.append(ca)
+            else:
+                out[ca] = stats
+    return out, lost
+
+
+async def _fetch_many_uncached(contracts: List[str], batched: bool) -> Dict[str, TokenStats]:
+    session = dex_session()
+    if not DEX_PAIR_PINNING:
+        return await _discover(session, contracts, batched)
+
+    pins = get_pair_pins()
+    pinned, discover = pins.split(contracts)
+    out, lost = await _fetch_pinned(session, pinned) if pinned else ({}, [])
+    found = await _discover(session, discover + lost, batched) if (discover or lost) else {}
+    for ca, stats in found.items():
+        pins.pin(ca, stats.chain_id, stats.pair_address, stats.liquidity_usd)
+    out.update(found)
+    return out
+
+
+async def fetch_token_stats(contract: str, fresh: bool = False) -> TokenStats:
+    """Tek kontrat; TTL süresince önbellekten (fresh=True → doğrudan ağdan)."""
+    if fresh or not DEX_CACHE_ENABLED:
+        return await _fetch_one(dex_session(), contract)
+    stats = await get_stats_cache().get_many([contract], lambda keys: _fetch_many_uncached(keys, batched=False))
+    return stats[contract]
+
+
+async def fetch_many_stats(contracts: List[str], batched: Optional[bool] = None,
+                           fresh: bool = False) -> Dict[str, TokenStats]:
+    """
+    Kontrat listesi için {contract: TokenStats} döndürür.
+    batched=True (varsayılan, DEX_BATCHED) → DEX_BATCH_SIZE'lık çoklu adres istekleri.
+    Önbellekte olmayanlar çekilir; handler ve watcher aynı kontrat için aynı isteği paylaşır.
+    """
+    if batched is None:
+        batched = DEX_BATCHED
+    unique = list(dict.fromkeys(contracts))
+    if fresh or not DEX_CACHE_ENABLED:
+        return await _fetch_many_uncached(unique, batched)
+    return await get_stats_cache().get_many(unique, lambda keys: _fetch_many_uncached(keys, batched))
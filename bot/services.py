@@ -1,33 +1,46 @@
 # bot/services.py
 import os
-from typing import Optional
+from typing import Any, Dict, Optional, Tuple
 
 import aiohttp  # type: ignore
 from dotenv import load_dotenv
 
+from .clients import telegram_session
+
 load_dotenv()
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 BASE_URL = f"https://api.telegram.org/bot{BOT_TOKEN}"
+SEND_TIMEOUT = aiohttp.ClientTimeout(total=10)
 
 
-async def send_telegram_message(chat_id: str, text: str, parse_mode: Optional[str] = "Markdown") -> Optional[dict]:
+async def telegram_api(method: str, payload: Dict[str, Any]) -> Tuple[int, Optional[dict]]:
     """
-    Telegram'a asenkron mesaj gönderir. (watcher/tasks.py içinden await ile çağrılır)
+    Ham Bot API çağrısı → (HTTP status, JSON gövde). Ağ hatasında (0, None).
+    429/403 gibi durumları ayırt etmesi gereken dispatcher bunu kullanır.
     """
     if not BOT_TOKEN:
-        return None
+        return 0, None
+    try:
+        async with telegram_session().post(f"{BASE_URL}/{method}", json=payload, timeout=SEND_TIMEOUT) as resp:
+            try:
+                body = await resp.json(content_type=None)
+            except Exception:
+                body = None
+            return resp.status, body
+    except Exception:
+        return 0, None
+
 
-    url = f"{BASE_URL}/sendMessage"
+async def send_telegram_message(chat_id: str, text: str, parse_mode: Optional[str] = "Markdown") -> Optional[dict]:
+    """
+    Telegram'a asenkron mesaj gönderir. (watcher/tasks.py içinden await ile çağrılır)
+    """
     payload = {"chat_id": chat_id, "text": text}
     if parse_mode:
         payload["parse_mode"] = parse_mode
 
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=payload, timeout=10) as resp:
-                if resp.status != 200:
-                    return None
-                return await resp.json()
-    except Exception:
+    status, body = await telegram_api("sendMessage", payload)
+    if status != 200:
         return None
+    return body
@@ -0,0 +1,129 @@
+# bot/throttle.py
+from __future__ import annotations
+import asyncio
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Optional
+
+DEX_MAX_IN_FLIGHT = int(os.getenv("DEX_MAX_IN_FLIGHT", "8"))
+DEX_RPS = float(os.getenv("DEX_RPS", "5"))          # DexScreener: ~300 istek/dk
+DEX_BURST = int(os.getenv("DEX_BURST", "10"))
+DEX_BACKOFF_BASE = float(os.getenv("DEX_BACKOFF_BASE", "0.5"))
+DEX_BACKOFF_CAP = float(os.getenv("DEX_BACKOFF_CAP", "30"))
+DEX_RETRY_AFTER_MAX = float(os.getenv("DEX_RETRY_AFTER_MAX", "60"))
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Retry-After başlığı: saniye ("12") ya da HTTP tarihi. Anlaşılamazsa None.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+class TokenBucket:
+    """
+    Saniyede `rate` istek, en fazla `burst` ani patlama (GCRA).
+    Kilitsiz: her acquire kendi zaman dilimini rezerve edip o ana kadar uyur.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tat = 0.0            # theoretical arrival time
+        self._paused_until = 0.0
+
+    def _reserve(self) -> float:
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        interval = 1.0 / self.rate
+        start = max(now, self._paused_until)
+        tat = max(self._tat, start)
+        self._tat = tat + interval
+        return max(0.0, start - now, tat - (self.burst - 1) * interval - now)
+
+    async def acquire(self) -> None:
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """429 sonrası tüm süreç için yeni istekleri `seconds` kadar durdur."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class FetchScheduler:
+    """
+    Upstream istekleri için süreç genelinde eşzamanlılık sınırı + hız sınırı.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = DEX_MAX_IN_FLIGHT,
+        rps: float = DEX_RPS,
+        burst: int = DEX_BURST,
+        backoff_base: float = DEX_BACKOFF_BASE,
+        backoff_cap: float = DEX_BACKOFF_CAP,
+    ):
+        self.max_in_flight = max(1, max_in_flight)
+        self.bucket = TokenBucket(rps, burst)
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._sem_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        # Semaphore ilk kullanıldığı event loop'a bağlanır; loop değişirse yenile
+        loop = asyncio.get_running_loop()
+        if self._sem is None or self._sem_loop is not loop:
+            self._sem = asyncio.Semaphore(self.max_in_flight)
+            self._sem_loop = loop
+        return self._sem
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        async with self._semaphore():
+            await self.bucket.acquire()
+            yield
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Full-jitter üstel bekleme: U(0, min(cap, base * 2^attempt))."""
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    def retry_delay(self, attempt: int, retry_after: Optional[float]) -> float:
+        if retry_after is None:
+            return self.backoff_delay(attempt)
+        return min(retry_after, DEX_RETRY_AFTER_MAX)
+
+    def throttled(self, delay: float) -> None:
+        self.bucket.pause(delay)
+
+
+_scheduler: Optional[FetchScheduler] = None
+
+
+def get_fetch_scheduler() -> FetchScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = FetchScheduler()
+    return _scheduler
+
+
+def configure_fetch_scheduler(**kwargs) -> FetchScheduler:
+    """Varsayılanları (env) ezerek süreç genelindeki scheduler'ı yeniden kurar."""
+    global _scheduler
+    _scheduler = FetchScheduler(**kwargs)
+    return _scheduler
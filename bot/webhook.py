@@ -0,0 +1,136 @@
+# bot/webhook.py
+"""
+Webhook modu: Telegram güncellemeleri ASGI uygulamasına (crypto_alert/asgi.py → urls.py)
+POST edilir ve bu süreçteki PTB Application'ında işlenir.
+
+- İstek X-Telegram-Bot-Api-Secret-Token başlığıyla doğrulanır (sabit zamanlı karşılaştırma).
+- Application ASGI lifespan'inde kurulur ve kapatılır (post_shutdown: özetler, gönderim
+  kuyruğu, HTTP oturumları); lifespan'i olmayan sunucularda ilk istekte kurulur.
+- Birden çok worker aynı URL'nin arkasında çalışabilir: wizard adımı ve user_data
+  DB'de (bot/persistence.py). Güncelleme istek içinde işlenir; durum DB'ye yazılmadan
+  200 dönülmez, aynı sohbetin sonraki güncellemesi hangi worker'a düşerse düşsün onu görür.
+"""
+from __future__ import annotations
+import asyncio
+import hmac
+import json
+import logging
+from typing import Optional
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, HttpResponseNotAllowed
+from telegram import Update  # type: ignore
+
+from .persistence import DjangoPersistence
+
+log = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+_app = None
+_app_loop: Optional[asyncio.AbstractEventLoop] = None
+_app_lock: Optional[asyncio.Lock] = None
+
+
+async def get_application():
+    """Bu süreç (ve event loop) için başlatılmış Application; ilk çağrıda kurulur."""
+    global _app, _app_loop, _app_lock
+    loop = asyncio.get_running_loop()
+    if _app is not None and _app_loop is loop:
+        return _app
+    if _app_lock is None or _app_loop is not loop:
+        _app_lock, _app_loop, _app = asyncio.Lock(), loop, None
+    async with _app_lock:
+        if _app is None:
+            from bot.bot import build_application  # Django hazır olduktan sonra, tembel
+
+            app = build_application(persistence=DjangoPersistence())
+            await app.initialize()
+            if app.post_init:
+                await app.post_init(app)
+            await app.start()  # update_queue'yu tüketen görev + job queue
+            _app = app
+            log.info("Webhook Application başlatıldı")
+    return _app
+
+
+async def shutdown_application() -> None:
+    """Application'ı PTB'nin kapanış sırasıyla durdurur (stop → shutdown → post_shutdown)."""
+    global _app
+    app, _app = _app, None
+    if app is not None:
+        await app.stop()  # kuyruktaki güncellemeler işlenir, job queue durur
+        if app.post_stop:
+            await app.post_stop(app)
+        await app.shutdown()
+        if app.post_shutdown:
+            await app.post_shutdown(app)
+        log.info("Webhook Application kapatıldı")
+
+
+async def process_update(app, update: Update) -> None:
+    """Paylaşımlı durumla tek güncelleme: DB'den oku → işle → değişenleri DB'ye yaz."""
+    if isinstance(app.persistence, DjangoPersistence):
+        await app.persistence.load_update(app, update)
+    await app.process_update(update)
+    if app.persistence is not None:
+        await app.update_persistence()
+
+
+async def lifespan(scope, receive, send) -> None:
+    """ASGI lifespan: webhook modunda Application açılışta kurulur, kapanışta düzgün kapanır."""
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            try:
+                if settings.TELEGRAM_WEBHOOK_URL:
+                    await get_application()
+            except Exception as exc:
+                log.exception("Webhook Application başlatılamadı")
+                await send({"type": "lifespan.startup.failed", "message": str(exc)})
+                return
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            try:
+                await shutdown_application()
+            except Exception as exc:
+                log.exception("Webhook Application kapatılamadı")
+                await send({"type": "lifespan.shutdown.failed", "message": str(exc)})
+                return
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+def _secret_ok(request) -> bool:
+    expected = settings.TELEGRAM_WEBHOOK_SECRET
+    if not expected:
+        return False  # sır tanımlı değilse webhook kapalı
+    given = request.headers.get(SECRET_HEADER, "")
+    return hmac.compare_digest(given.encode(), expected.encode())
+
+
+async def telegram_webhook(request):
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+    if not _secret_ok(request):
+        return HttpResponseForbidden()
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return HttpResponseBadRequest()
+    if not isinstance(data, dict):
+        return HttpResponseBadRequest()  # Telegram her zaman JSON nesnesi gönderir
+
+    app = await get_application()
+    try:
+        update = Update.de_json(data, app.bot)
+    except (KeyError, TypeError, ValueError):
+        return HttpResponseBadRequest()
+    if update is None:
+        return HttpResponseBadRequest()
+    await process_update(app, update)
+    return HttpResponse(status=200)
+
+
+# Django 4.2'de csrf_exempt dekoratörü async view'ı sync'e çevirir; işareti doğrudan koy
+telegram_webhook.csrf_exempt = True
@@ -3,4 +3,14 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'crypto_alert.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from bot import webhook  # noqa: E402  (Django kurulduktan sonra)
+
+
+async def application(scope, receive, send):
+    # Django ASGI lifespan'i işlemez; webhook Application'ının açılış/kapanışı burada
+    if scope["type"] == "lifespan":
+        await webhook.lifespan(scope, receive, send)
+        return
+    await django_application(scope, receive, send)
@@ -9,7 +9,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = 'gecici-bir-secret-key-' + os.getenv('BOT_TOKEN', 'default-key')
 
 DEBUG = True
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = [h for h in os.getenv('DJANGO_ALLOWED_HOSTS', '').split(',') if h]
 
 INSTALLED_APPS = [
     'django.contrib.admin',
@@ -56,9 +56,15 @@ WSGI_APPLICATION = 'crypto_alert.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.getenv('DJANGO_DB_PATH', BASE_DIR / 'db.sqlite3'),
+        # Sharded watcher süreçleri / DB havuzu thread'leri aynı dosyaya yazar: kilit için bekle
+        'OPTIONS': {'timeout': 20},
     }
 }
+# async handler/watcher DB helper'larının thread havuzu (bot/db.py); 0 → Django'nun tek thread'li yolu
+DB_EXECUTOR_THREADS = int(os.getenv('DB_EXECUTOR_THREADS', '4'))
+# SQLite: WAL (okuyucular yazarı beklemez) + synchronous=NORMAL (watcher/signals.py)
+SQLITE_WAL = os.getenv('SQLITE_WAL', '1') != '0'
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -87,7 +93,63 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Telegram bot ayarları
 TELEGRAM_BOT_TOKEN = os.getenv('BOT_TOKEN')
 TELEGRAM_CHAT_ID = os.getenv('CHAT_ID')
+# Webhook modu (bot/webhook.py): URL verilirse `python -m bot.bot` sadece webhook'u kaydeder,
+# güncellemeler ASGI sunucusuna (uvicorn crypto_alert.asgi:application --workers N) gelir.
+# Wizard durumu ve user_data DB'de (bot/persistence.py): her worker her güncellemeyi işleyebilir.
+TELEGRAM_WEBHOOK_URL = os.getenv('TELEGRAM_WEBHOOK_URL', '')  # ör. https://alan.adi/telegram/webhook/
+TELEGRAM_WEBHOOK_SECRET = os.getenv('TELEGRAM_WEBHOOK_SECRET', '')  # X-Telegram-Bot-Api-Secret-Token
+TELEGRAM_WEBHOOK_MAX_CONNECTIONS = int(os.getenv('TELEGRAM_WEBHOOK_MAX_CONNECTIONS', '40'))
+
+# Metrikler (bot/metrics.py): /metrics/ Prometheus metin biçimi; token verilirse "Authorization: Bearer <token>".
+# Polling botu / run_watcher HTTP sunmaz; onlar için METRICS_PORT ile ayrı dinleyici açılır.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Cache: "stats" aliası DexScreener sonuçlarının süreçler arası paylaşımı için
+# (bot/cache.py, DEX_CACHE_SHARED=stats ile açılır). FileBased aynı makinedeki süreçleri kapsar.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'stats': {
+        'BACKEND': os.getenv('STATS_CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv('STATS_CACHE_LOCATION', str(BASE_DIR / 'var' / 'cache' / 'stats')),
+    },
+}
 
 # Celery
 CELERY_BROKER_URL = 'memory://'
 CELERY_RESULT_BACKEND = 'cache+memory://'
+
+# Watcher (eşik kontrol döngüsü)
+WATCHER_WRITE_BATCH_SIZE = int(os.getenv('WATCHER_WRITE_BATCH_SIZE', '500'))  # UPDATE ... WHERE id IN (...) başına id
+WATCHER_VECTORIZE_MIN = int(os.getenv('WATCHER_VECTORIZE_MIN', '5000'))  # bu kadar aday satırdan sonra NumPy yolu
+WATCHER_RECONCILE_SECONDS = int(os.getenv('WATCHER_RECONCILE_SECONDS', '60'))  # updated_at ile artımlı uzlaştırma
+WATCHER_FULL_RESYNC_EVERY = int(os.getenv('WATCHER_FULL_RESYNC_EVERY', '60'))  # her N uzlaştırmada bir id karşılaştırması
+WATCHER_ADAPTIVE_POLLING = os.getenv('WATCHER_ADAPTIVE_POLLING', '1') != '0'  # eşiğe uzaklığa göre kontrat başı sorgu aralığı
+WATCHER_TICK_SECONDS = float(os.getenv('WATCHER_TICK_SECONDS', '5' if WATCHER_ADAPTIVE_POLLING else '30'))
+WATCHER_POLL_MIN_SECONDS = float(os.getenv('WATCHER_POLL_MIN_SECONDS', '5'))
+WATCHER_POLL_MAX_SECONDS = float(os.getenv('WATCHER_POLL_MAX_SECONDS', '300'))
+WATCHER_TICK_BUDGET_SECONDS = float(os.getenv('WATCHER_TICK_BUDGET_SECONDS', str(WATCHER_TICK_SECONDS * 0.9)))  # tick süresi üst sınırı
+WATCHER_TICK_CHUNK = int(os.getenv('WATCHER_TICK_CHUNK', '240'))  # süre kontrolü arasında işlenen kontrat
+WATCHER_POLL_BUDGET_RPS = float(os.getenv('WATCHER_POLL_BUDGET_RPS', '100'))  # saniyede en fazla sorgulanan kontrat
+WATCHER_HISTORY_ENABLED = os.getenv('WATCHER_HISTORY_ENABLED', '1') != '0'  # kontrat başına fiyat geçmişi (watcher/history.py)
+WATCHER_HISTORY_DIR = Path(os.getenv('WATCHER_HISTORY_DIR', str(BASE_DIR / 'var' / 'history')))
+WATCHER_HISTORY_MEMORY_SAMPLES = int(os.getenv('WATCHER_HISTORY_MEMORY_SAMPLES', '120'))  # bellekte kontrat başına son örnek
+WATCHER_HISTORY_RETENTION_SECONDS = int(os.getenv('WATCHER_HISTORY_RETENTION_SECONDS', '86400'))  # diskte tutulan süre
+WATCHER_HISTORY_FLUSH_SECONDS = float(os.getenv('WATCHER_HISTORY_FLUSH_SECONDS', '60'))
+WATCHER_SHARDS = int(os.getenv('WATCHER_SHARDS', '1'))  # >1: kontratlar `python -m watcher.worker` süreçlerine bölünür
+WATCHER_LEASE_SECONDS = float(os.getenv('WATCHER_LEASE_SECONDS', '30'))  # shard kirası; ölü worker'ın shard'ları bu süreden sonra devralınır
+WATCHER_EMBEDDED = os.getenv('WATCHER_EMBEDDED', '1') != '0'  # 0: eşik döngüsü `manage.py run_watcher` ile ayrı süreçte
+WATCHER_ALERT_HYSTERESIS = float(os.getenv('WATCHER_ALERT_HYSTERESIS', '0.1'))  # seviye, eşiğin bu oranı altına inince yeniden kurulur; 1: hiç
+WATCHER_ALERT_COOLDOWN_SECONDS = float(os.getenv('WATCHER_ALERT_COOLDOWN_SECONDS', '0'))  # abonelik başına bildirimler arası en az süre (varsayılan)
+WATCHER_DIGEST_WINDOW_SECONDS = float(os.getenv('WATCHER_DIGEST_WINDOW_SECONDS', '0'))  # sohbet başına geçiş özeti penceresi; 0: tick başına
+# Yavaş tick teşhisi (watcher/profiling.py): bütçeyi aşan tick'te son N tick'in aşama süreleri diske
+WATCHER_FLIGHT_RECORDER_TICKS = int(os.getenv('WATCHER_FLIGHT_RECORDER_TICKS', '300'))
+WATCHER_FLIGHT_DIR = Path(os.getenv('WATCHER_FLIGHT_DIR', str(BASE_DIR / 'var' / 'flight')))
+WATCHER_FLIGHT_DUMP_INTERVAL_SECONDS = float(os.getenv('WATCHER_FLIGHT_DUMP_INTERVAL_SECONDS', '60'))
+WATCHER_FLIGHT_MAX_DUMPS = int(os.getenv('WATCHER_FLIGHT_MAX_DUMPS', '50'))
+# İstek üzerine profil (SIGUSR1 / manage.py profile_ticks / admin): sonraki N tick
+WATCHER_PROFILE_DIR = Path(os.getenv('WATCHER_PROFILE_DIR', str(BASE_DIR / 'var' / 'profiles')))
+WATCHER_PROFILE_TICKS = int(os.getenv('WATCHER_PROFILE_TICKS', '5'))
+WATCHER_PROFILE_MODE = os.getenv('WATCHER_PROFILE_MODE', 'cprofile')  # cprofile | sample
+WATCHER_PROFILE_SAMPLE_INTERVAL = float(os.getenv('WATCHER_PROFILE_SAMPLE_INTERVAL', '0.005'))
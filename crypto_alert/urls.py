@@ -1,6 +1,11 @@
 from django.contrib import admin
 from django.urls import path
 
+from alerts.views import prometheus_metrics
+from bot.webhook import telegram_webhook
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('telegram/webhook/', telegram_webhook, name='telegram-webhook'),
+    path('metrics/', prometheus_metrics, name='metrics'),
 ]
@@ -1,6 +1,29 @@
-from django.contrib import admin
-from .models import User, Token, UserToken
+import socket
+
+from django.contrib import admin, messages
+from .models import User, Token, TokenMarketState, UserToken, WatcherLease, WatcherWorker
+from .profiling import PROFILE_DIR, PROFILE_MODE, PROFILE_TICKS, request_profile
 
 admin.site.register(User)
 admin.site.register(Token)
 admin.site.register(UserToken)
+admin.site.register(TokenMarketState)
+admin.site.register(WatcherLease)
+
+
+@admin.register(WatcherWorker)
+class WatcherWorkerAdmin(admin.ModelAdmin):
+    list_display = ("owner", "started_at", "expires_at")
+    actions = ("profile_next_ticks",)
+
+    @admin.action(description="Sonraki tick'leri profille")
+    def profile_next_ticks(self, request, queryset):
+        # owner = host:pid:rastgele; istek dosyası sadece bu makinedeki süreçlere ulaşır
+        host = socket.gethostname()
+        for worker in queryset:
+            worker_host, pid, _ = (worker.owner.split(":") + ["", "", ""])[:3]
+            if worker_host != host or not pid.isdigit():
+                self.message_user(request, f"{worker.owner}: başka makinede, atlandı", messages.WARNING)
+                continue
+            request_profile(PROFILE_TICKS, PROFILE_MODE, int(pid))
+            self.message_user(request, f"{worker.owner}: sonraki {PROFILE_TICKS} tick → {PROFILE_DIR}")
@@ -0,0 +1,67 @@
+# watcher/alerting.py
+"""
+Abonelik başına uyarı durum makinesi (satır başına O(1)).
+
+Durum: kayıtlı seviye L ∈ {none, low, mid, high} (UserToken.last_alert_level).
+- Yukarı: mcap L'nin üstündeki bir eşiği geçerse yeni seviye, bildirim.
+- Yeniden kurma (histerezis): mcap t_L·(1 − WATCHER_ALERT_HYSTERESIS) altına inerse seviye,
+  bandı hâlâ tutulan en yüksek seviyeye düşer. Böylece eşik etrafında salınan token
+  her salınımda değil, sadece bandın tamamını geçtiğinde yeniden bildirir.
+  WATCHER_ALERT_HYSTERESIS ≥ 1 → seviye hiç düşmez (eski davranış).
+- Aşağı bildirim: UserToken.alert_down açıksa düşüş de bildirilir.
+- Bekleme: son bildirimden sonra cooldown_seconds (boşsa WATCHER_ALERT_COOLDOWN_SECONDS)
+  dolmadan hiçbir geçiş uygulanmaz; abonelik süre dolunca yeniden değerlendirilir
+  (ThresholdIndex.cool). Mesaj sayısı abonelik başına ≤ 1 + T / cooldown.
+"""
+from __future__ import annotations
+from typing import Optional, Tuple
+
+from django.conf import settings
+
+from watcher.index import Subscription
+
+Level = str  # "none" | "low" | "mid" | "high"
+
+HYSTERESIS = getattr(settings, "WATCHER_ALERT_HYSTERESIS", 0.1)
+DEFAULT_COOLDOWN = getattr(settings, "WATCHER_ALERT_COOLDOWN_SECONDS", 0.0)
+
+LEVELS = ("none", "low", "mid", "high")
+LEVEL_RANK = {name: rank for rank, name in enumerate(LEVELS)}
+
+# (yeni seviye, bildir mi)
+Transition = Tuple[Level, bool]
+COOLING: Transition = ("", False)  # geçiş var ama bekleme süresinde
+
+
+def level_for(mcap: float, low: float, mid: float, high: float) -> Level:
+    if mcap >= high:
+        return "high"
+    if mcap >= mid:
+        return "mid"
+    if mcap >= low:
+        return "low"
+    return "none"
+
+
+def should_notify(prev_level: Level, new_level: Level) -> bool:
+    """Yukarı seviye geçişi mi (none → low/mid/high, low → mid/high, mid → high)."""
+    return LEVEL_RANK[new_level] > LEVEL_RANK[prev_level or "none"]
+
+
+def cooldown_of(sub: Subscription) -> float:
+    return sub.cooldown if sub.cooldown is not None else DEFAULT_COOLDOWN
+
+
+def transition(sub: Subscription, mcap: float, now: float,
+               hysteresis: float = HYSTERESIS) -> Optional[Transition]:
+    """Aboneliğin mcap'teki geçişi; değişiklik yoksa None, bekleme süresindeyse COOLING."""
+    rank = LEVEL_RANK[sub.level or "none"]
+    new = level_for(mcap, sub.low, sub.mid, sub.high)
+    if LEVEL_RANK[new] <= rank:
+        keep = 1.0 - hysteresis
+        new = level_for(mcap, sub.low * keep, sub.mid * keep, sub.high * keep)
+        if LEVEL_RANK[new] >= rank:
+            return None
+    if now < sub.last_alert + cooldown_of(sub):
+        return COOLING
+    return new, (LEVEL_RANK[new] > rank or sub.down)
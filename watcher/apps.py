@@ -3,3 +3,6 @@ from django.apps import AppConfig
 class WatcherConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'watcher'
+
+    def ready(self):
+        from . import signals  # noqa: F401  (abonelik kaydı olayları)
@@ -0,0 +1,131 @@
+# watcher/digest.py
+"""
+Uyarı özetleri: bir sohbetin aynı tick'teki (ya da WATCHER_DIGEST_WINDOW_SECONDS
+penceresindeki) tüm eşik geçişleri tek mesajda toplanır. Piyasa topluca hareket ettiğinde
+40 token takip eden kullanıcıya 40 değil 1 mesaj gider; sadece Telegram'ın 4096
+karakter sınırında bölünür.
+
+Pencere > 0 ise geçişler commit edildikten sonra süreç belleğinde bekler; kapanışta
+flush(force=True) ile gönderilir (süreç çökerse pencere içindekiler kaybolur).
+"""
+from __future__ import annotations
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+DIGEST_WINDOW_SECONDS = getattr(settings, "WATCHER_DIGEST_WINDOW_SECONDS", 0.0)  # 0: tick başına
+
+TELEGRAM_MAX_MESSAGE = 4096
+_DEFAULT_PAIR_URL = "https://dexscreener.com/"
+
+
+@dataclass(slots=True)
+class Crossing:
+    contract: str
+    mcap: float
+    level: str
+    low: float
+    mid: float
+    high: float
+    pair_url: Optional[str] = None
+    direction: str = "up"  # "down": histerezis bandının altına düşüş (UserToken.alert_down)
+
+
+def _tg_len(text: str) -> int:
+    # Telegram sınırı UTF-16 birimiyle sayılır (emoji = 2)
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _single_text(c: Crossing) -> str:
+    title = "📈 *Market Cap Eşiği Aşıldı!*" if c.direction == "up" else "📉 *Market Cap Eşiğin Altına Düştü!*"
+    return (
+        f"{title}\n"
+        f"`{c.contract}`\n"
+        f"MCAP: *{int(c.mcap):,}* USD\n"
+        f"Seviye: *{c.level.upper()}* "
+        f"({int(c.low)}/{int(c.mid)}/{int(c.high)})\n"
+        f"[Grafik / İşlem]({c.pair_url or _DEFAULT_PAIR_URL})"
+    )
+
+
+def _digest_line(c: Crossing) -> str:
+    return (
+        f"{'📈' if c.direction == 'up' else '📉'} `{c.contract}`\n"
+        f"  *{c.level.upper()}* ({int(c.low)}/{int(c.mid)}/{int(c.high)}) — "
+        f"MCAP *{int(c.mcap):,}* USD · [Grafik]({c.pair_url or _DEFAULT_PAIR_URL})"
+    )
+
+
+def render(crossings: List[Crossing], limit: int = TELEGRAM_MAX_MESSAGE) -> List[str]:
+    """Bir sohbetin geçişleri → mesaj(lar). Tek geçiş eski biçimde; çoksa özet, satır sınırında bölünür."""
+    if not crossings:
+        return []
+    if len(crossings) == 1:
+        return [_single_text(crossings[0])]
+
+    if all(c.direction == "up" for c in crossings):
+        header = f"📈 *Market Cap Eşikleri Aşıldı* ({len(crossings)} token)\n"
+    else:
+        header = f"🔔 *Market Cap Eşik Bildirimleri* ({len(crossings)} token)\n"
+    cont = header.split(" ", 1)[0] + " *(devam)*\n"
+    messages: List[str] = []
+    current, size = header, _tg_len(header)
+    for c in crossings:
+        line = "\n" + _digest_line(c)
+        n = _tg_len(line)
+        if size + n > limit and current not in (header, cont):
+            messages.append(current)
+            current, size = cont, _tg_len(cont)
+        current += line
+        size += n
+    messages.append(current)
+    return messages
+
+
+class AlertDigest:
+    """Sohbet başına bekleyen geçişler; aynı kontratın sonraki geçişi öncekinin yerini alır."""
+
+    def __init__(self, window: float = DIGEST_WINDOW_SECONDS, clock: Callable[[], float] = time.monotonic):
+        self.window = window
+        self.clock = clock
+        self._pending: Dict[str, Dict[str, Crossing]] = {}
+        self._first_at: Dict[str, float] = {}
+
+    def __len__(self) -> int:
+        return sum(map(len, self._pending.values()))
+
+    def add(self, chat_id: str, crossing: Crossing) -> None:
+        chat = self._pending.get(chat_id)
+        if chat is None:
+            chat = self._pending[chat_id] = {}
+            self._first_at[chat_id] = self.clock()
+        chat.pop(crossing.contract, None)
+        chat[crossing.contract] = crossing
+
+    def flush(self, force: bool = False) -> List[Tuple[str, str]]:
+        """Penceresi dolan sohbetlerin mesajları: [(chat_id, metin), ...]."""
+        now = self.clock()
+        out: List[Tuple[str, str]] = []
+        for chat_id in list(self._pending):
+            if not force and now - self._first_at[chat_id] < self.window:
+                continue
+            crossings = list(self._pending.pop(chat_id).values())
+            del self._first_at[chat_id]
+            out.extend((chat_id, text) for text in render(crossings))
+        return out
+
+    def clear(self) -> None:
+        self._pending.clear()
+        self._first_at.clear()
+
+
+_digest: Optional[AlertDigest] = None
+
+
+def get_alert_digest() -> AlertDigest:
+    global _digest
+    if _digest is None:
+        _digest = AlertDigest()
+    return _digest
@@ -0,0 +1,359 @@
+# watcher/history.py
+from __future__ import annotations
+import asyncio
+import hashlib
+import logging
+import mmap
+import os
+import re
+import struct
+import time
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from django.conf import settings
+
+from watcher.registry import get_registry
+
+log = logging.getLogger(__name__)
+
+HISTORY_ENABLED = getattr(settings, "WATCHER_HISTORY_ENABLED", True)
+HISTORY_DIR = getattr(settings, "WATCHER_HISTORY_DIR", Path(settings.BASE_DIR) / "var" / "history")
+HISTORY_MEMORY_SAMPLES = getattr(settings, "WATCHER_HISTORY_MEMORY_SAMPLES", 120)   # 30 sn'de bir → 1 saat
+HISTORY_RETENTION_SECONDS = getattr(settings, "WATCHER_HISTORY_RETENTION_SECONDS", 86400)
+
+# Kayıt: ts (uint32, epoch sn) + price, mcap, liquidity, volume (float32) = 20 byte.
+# float32 ~7 anlamlı basamak tutar; mikro fiyatlar (1e-9) ve 1e12 mcap için yeterli.
+_REC = struct.Struct("<Iffff")
+_SAFE_NAME = re.compile(r"^[0-9A-Za-z]{1,80}$")
+
+Sample = Tuple[int, float, float, float, float]  # (ts, price, mcap, liquidity, volume)
+
+
+def _f(value: Optional[float]) -> float:
+    try:
+        return float(value) if value is not None else float("nan")
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+class HistoryRing:
+    """Sabit boyutlu, önceden ayrılmış dizilerle halka tampon (kontrat başına)."""
+    __slots__ = ("capacity", "size", "head", "ts", "price", "mcap", "liq", "vol")
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.size = 0
+        self.head = 0  # bir sonraki yazılacak konum
+        self.ts = array("I", bytes(4 * capacity))
+        self.price = array("f", bytes(4 * capacity))
+        self.mcap = array("f", bytes(4 * capacity))
+        self.liq = array("f", bytes(4 * capacity))
+        self.vol = array("f", bytes(4 * capacity))
+
+    def append(self, ts: int, price: float, mcap: float, liq: float, vol: float) -> None:
+        i = self.head
+        self.ts[i], self.price[i], self.mcap[i], self.liq[i], self.vol[i] = ts, price, mcap, liq, vol
+        self.head = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def oldest_ts(self) -> Optional[int]:
+        if not self.size:
+            return None
+        return self.ts[(self.head - self.size) % self.capacity]
+
+    def samples(self, since: int = 0) -> List[Sample]:
+        out: List[Sample] = []
+        start = self.head - self.size
+        for k in range(self.size):
+            i = (start + k) % self.capacity
+            if self.ts[i] >= since:
+                out.append((self.ts[i], self.price[i], self.mcap[i], self.liq[i], self.vol[i]))
+        return out
+
+
+class PriceHistory:
+    """
+    Kontrat başına zaman serisi:
+    - bellekte son `capacity` örnek (halka tampon), tick'in sıcak yolunda O(1) ekleme;
+    - diskte kontrat başına append-only sabit kayıt dosyası (20 byte/örnek), periyodik flush;
+    - geçmiş sorguları mmap + ikili arama ile (dosya okunmadan);
+    - yeniden başlatmada halka, dosyanın son `capacity` kaydından thread'de doldurulur
+      (preload); döngü thread'i dosya okumaz, diskten okuyan sorgular *_async sürümleriyle.
+    10k kontrat × 120 örnek ≈ 24 MB bellek; 24 saat × 30 sn ≈ 56 KB/kontrat disk.
+    """
+
+    def __init__(self, directory: Path = HISTORY_DIR, capacity: int = HISTORY_MEMORY_SAMPLES,
+                 retention_seconds: int = HISTORY_RETENTION_SECONDS):
+        self.directory = Path(directory)
+        self.capacity = max(1, capacity)
+        self.retention_seconds = retention_seconds
+        self._rings: Dict[str, HistoryRing] = {}
+        self._pending: Dict[str, bytearray] = {}
+        self._flushing: Dict[str, bytearray] = {}  # thread'de yazılmakta olanlar (sorgular için)
+        self._unfilled: Set[str] = set()  # diskteki geçmişi henüz halkaya eklenmemiş kontratlar
+        self._flush_lock: Optional[asyncio.Lock] = None
+
+    # ---------------- Yazma ----------------
+    def record(self, contract: str, price: Optional[float], mcap: Optional[float],
+               liquidity: Optional[float], volume: Optional[float], ts: Optional[int] = None) -> None:
+        ts = int(time.time()) if ts is None else int(ts)
+        values = (_f(price), _f(mcap), _f(liquidity), _f(volume))
+        self._ring(contract).append(ts, *values)
+        buf = self._pending.get(contract)
+        if buf is None:
+            buf = self._pending[contract] = bytearray()
+        buf += _REC.pack(ts, *values)
+
+    def flush(self) -> int:
+        """Bekleyen örnekleri dosyalara ekler (senkron; döngü dışındaki çağıranlar için)."""
+        pending, self._pending = self._pending, {}
+        written, failed = self._write(pending)
+        self._requeue(failed)
+        return written
+
+    async def flush_async(self) -> int:
+        """
+        Bekleyenler döngü thread'inde ayrılır, dosyalara thread'de yazılır; başarısız olanlar
+        yine döngü thread'inde geri eklenir (record() ile yarış yok). Flush'lar sıralı.
+        """
+        async with self._lock():
+            pending, self._pending = self._pending, {}
+            self._flushing = pending
+            try:
+                written, failed = await asyncio.to_thread(self._write, pending)
+            finally:
+                self._flushing = {}
+            self._requeue(failed)
+        return written
+
+    async def preload(self, contracts: Optional[Iterable[str]] = None) -> int:
+        """
+        Halkaları diskteki son kayıtlarla doldurur; dosyalar thread'de okunur. `contracts`
+        verilmezse record() ile boş açılmış halkalar. Doldurulan kontrat sayısı.
+        """
+        async with self._lock():  # yazım/sıkıştırma ile aynı anda okuma yok
+            if contracts is None:
+                targets = list(self._unfilled)
+            else:
+                targets = [c for c in contracts if c not in self._rings or c in self._unfilled]
+            if not targets:
+                return 0
+            tails = await asyncio.to_thread(lambda: {c: self._tail(c, self.capacity) for c in targets})
+            for contract, tail in tails.items():
+                self._fill(contract, tail)
+        return len(tails)
+
+    def retain(self, contracts: Iterable[str]) -> int:
+        """Takipten çıkan kontratların halkalarını bırakır (disk kaydı kalır). Bırakılan sayısı."""
+        keep = set(contracts)
+        gone = [c for c in self._rings if c not in keep]
+        for contract in gone:
+            del self._rings[contract]
+            self._unfilled.discard(contract)
+        return len(gone)
+
+    # ---------------- Okuma ----------------
+    def recent(self, contract: str) -> List[Sample]:
+        """Son örnekler. Bellekte yoksa diskten okur (senkron; döngüde recent_async)."""
+        ring = self._rings.get(contract)
+        if ring is None or contract in self._unfilled:
+            return self._merge_unflushed(contract, self._tail(contract, self.capacity), 0, 2 ** 32 - 1)[-self.capacity:]
+        return ring.samples()
+
+    async def recent_async(self, contract: str) -> List[Sample]:
+        ring = self._rings.get(contract)
+        if ring is not None and contract not in self._unfilled:
+            return ring.samples()
+        async with self._lock():
+            tail = await asyncio.to_thread(self._tail, contract, self.capacity)
+            return self._merge_unflushed(contract, tail, 0, 2 ** 32 - 1)[-self.capacity:]
+
+    def query(self, contract: str, since: int, until: Optional[int] = None) -> List[Sample]:
+        """[since, until] aralığındaki örnekler, eskiden yeniye (senkron; döngüde query_async)."""
+        until = 2 ** 32 - 1 if until is None else until
+        hit = self._query_ring(contract, since, until)
+        if hit is not None:
+            return hit
+        return self._merge_unflushed(contract, self._read_disk(contract, since, until), since, until)
+
+    async def query_async(self, contract: str, since: int, until: Optional[int] = None) -> List[Sample]:
+        """query() gibi; aralık bellekte değilse dosya thread'de okunur."""
+        until = 2 ** 32 - 1 if until is None else until
+        hit = self._query_ring(contract, since, until)
+        if hit is not None:
+            return hit
+        # Kilit: okuma ile birleştirme arasında bir flush örnekleri diskten de bekleyenlerden de kaçırmasın
+        async with self._lock():
+            out = await asyncio.to_thread(self._read_disk, contract, since, until)
+            return self._merge_unflushed(contract, out, since, until)
+
+    # ---------------- İç ----------------
+    def _lock(self) -> asyncio.Lock:
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        return self._flush_lock
+
+    def _query_ring(self, contract: str, since: int, until: int) -> Optional[List[Sample]]:
+        """Aralık tamamen bellekteyse örnekler (hızlı yol), değilse None."""
+        ring = self._rings.get(contract)
+        oldest = ring.oldest_ts() if ring is not None else None
+        if oldest is not None and oldest <= since:
+            return [s for s in ring.samples(since) if s[0] <= until]
+        return None
+
+    def _merge_unflushed(self, contract: str, out: List[Sample], since: int, until: int) -> List[Sample]:
+        """Diskten okunanların ardına henüz yazılmamış örnekleri ekler."""
+        for buf in (self._flushing.get(contract), self._pending.get(contract)):
+            if buf:
+                last = out[-1][0] if out else -1
+                out.extend(s for s in _REC.iter_unpack(bytes(buf)) if since <= s[0] <= until and s[0] > last)
+        return out
+
+    def _path(self, contract: str) -> Path:
+        name = contract if _SAFE_NAME.match(contract) else hashlib.sha1(contract.encode()).hexdigest()
+        shard = hashlib.sha1(contract.encode()).hexdigest()[:2]
+        return self.directory / shard / f"{name}.bin"
+
+    def _ring(self, contract: str) -> HistoryRing:
+        ring = self._rings.get(contract)
+        if ring is None:
+            # Sıcak yolda dosya okunmaz: boş açılır, diskteki geçmiş preload ile öne eklenir
+            ring = self._rings[contract] = HistoryRing(self.capacity)
+            self._unfilled.add(contract)
+        return ring
+
+    def _fill(self, contract: str, tail: List[Sample]) -> None:
+        """Diskten okunan son kayıtları halkadaki örneklerin önüne ekler (döngü thread'inde)."""
+        self._unfilled.discard(contract)
+        ring = self._rings.get(contract)
+        oldest = ring.oldest_ts() if ring is not None else None
+        # Okumadan önce flush edilenler halkada zaten var
+        older = [s for s in tail if oldest is None or s[0] < oldest]
+        if ring is not None and not older:
+            return
+        filled = HistoryRing(self.capacity)
+        for sample in older + (ring.samples() if ring is not None else []):
+            filled.append(*sample)
+        self._rings[contract] = filled
+
+    def _write(self, pending: Dict[str, bytearray]) -> Tuple[int, Dict[str, bytearray]]:
+        """Sadece verilen tamponları yazar, paylaşılan duruma dokunmaz: (yazılan, başarısızlar)."""
+        written = 0
+        failed: Dict[str, bytearray] = {}
+        for contract, buf in pending.items():
+            path = self._path(contract)
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                with open(path, "ab") as fh:
+                    fh.write(buf)
+                written += len(buf) // _REC.size
+                self._maybe_compact(path)
+            except OSError:
+                log.exception("Fiyat geçmişi yazılamadı: %s", contract)
+                failed[contract] = buf
+        return written, failed
+
+    def _requeue(self, failed: Dict[str, bytearray]) -> None:
+        # Kaybetme: bir sonraki flush'ta tekrar dene (eski örnekler önde)
+        for contract, buf in failed.items():
+            self._pending[contract] = buf + self._pending.get(contract, bytearray())
+
+    def _tail(self, contract: str, n: int) -> List[Sample]:
+        path = self._path(contract)
+        try:
+            size = path.stat().st_size
+        except OSError:
+            return []
+        count = size // _REC.size
+        if not count:
+            return []
+        take = min(n, count)
+        with open(path, "rb") as fh:
+            fh.seek((count - take) * _REC.size)
+            return list(_REC.iter_unpack(fh.read(take * _REC.size)))
+
+    def _read_disk(self, contract: str, since: int, until: int) -> List[Sample]:
+        path = self._path(contract)
+        try:
+            fh = open(path, "rb")
+        except OSError:
+            return []
+        with fh:
+            size = os.fstat(fh.fileno()).st_size
+            count = size // _REC.size
+            if not count:
+                return []
+            with mmap.mmap(fh.fileno(), count * _REC.size, access=mmap.ACCESS_READ) as mm:
+                ts_at = lambda k: struct.unpack_from("<I", mm, k * _REC.size)[0]  # noqa: E731
+                lo, hi = 0, count
+                while lo < hi:  # ts ≥ since olan ilk kayıt
+                    mid = (lo + hi) // 2
+                    if ts_at(mid) < since:
+                        lo = mid + 1
+                    else:
+                        hi = mid
+                out: List[Sample] = []
+                for k in range(lo, count):
+                    rec = _REC.unpack_from(mm, k * _REC.size)
+                    if rec[0] > until:
+                        break
+                    out.append(rec)
+                return out
+
+    def _maybe_compact(self, path: Path) -> None:
+        """Dosya saklama süresinin iki katından büyükse eski kayıtları at (atomik değiştirme)."""
+        if not self.retention_seconds:
+            return
+        size = path.stat().st_size
+        with open(path, "rb") as fh:
+            head = fh.read(_REC.size)
+        if len(head) < _REC.size:
+            return
+        first_ts = _REC.unpack(head)[0]
+        cutoff = int(time.time()) - self.retention_seconds
+        if first_ts >= cutoff - self.retention_seconds:
+            return
+        with open(path, "rb") as fh:
+            data = fh.read(size - size % _REC.size)
+        keep = bytearray()
+        for off in range(0, len(data), _REC.size):
+            if struct.unpack_from("<I", data, off)[0] >= cutoff:
+                keep = data[off:]
+                break
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "wb") as fh:
+            fh.write(keep)
+        os.replace(tmp, path)
+
+
+_history: Optional[PriceHistory] = None
+
+
+def get_price_history() -> PriceHistory:
+    global _history
+    if _history is None:
+        _history = PriceHistory()
+    return _history
+
+
+async def preload_price_history(_app=None) -> None:
+    """Açılışta (kayıt defteri yüklendikten sonra): takip edilen kontratların halkalarını diskten doldur."""
+    registry = get_registry()
+    if HISTORY_ENABLED and registry.loaded:
+        await get_price_history().preload(registry.index.contracts())
+
+
+async def flush_price_history(_context=None) -> None:
+    """
+    PTB JobQueue: bekleyen örnekleri periyodik olarak diske yaz, sonradan açılan halkaları
+    diskten doldur, takipten çıkanları bırak.
+    """
+    if HISTORY_ENABLED:
+        history = get_price_history()
+        await history.flush_async()
+        await history.preload()
+        registry = get_registry()
+        if registry.loaded:  # yükleme bitmeden boş liste her şeyi bırakırdı
+            history.retain(registry.index.contracts())
@@ -0,0 +1,372 @@
+# watcher/index.py
+from __future__ import annotations
+import math
+import time
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+Level = str  # "none" | "low" | "mid" | "high"
+
+
+class Subscription:
+    """
+    Tick'in ihtiyaç duyduğu UserToken alanları (bellekte, satır başına ~120 byte).
+    Uyarı politikası alanları (down, cooldown, last_alert) için bkz. watcher/alerting.py.
+    """
+    __slots__ = ("id", "token_id", "chat_id", "contract", "low", "mid", "high", "level",
+                 "down", "cooldown", "last_alert")
+
+    def __init__(self, id: int, token_id: int, chat_id: str, contract: str,
+                 low: float, mid: float, high: float, level: Level = "none",
+                 down: bool = False, cooldown: Optional[float] = None, last_alert: float = 0.0):
+        self.id = id
+        self.token_id = token_id
+        self.chat_id = chat_id
+        self.contract = contract
+        self.low = low
+        self.mid = mid
+        self.high = high
+        self.level = level or "none"
+        self.down = down
+        self.cooldown = cooldown        # None → varsayılan bekleme
+        self.last_alert = last_alert    # son bildirim (epoch sn)
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> "Subscription":
+        """_load_user_tokens() satırından."""
+        last_alert_at = row.get("last_alert_at")
+        return cls(
+            row["id"], row["token_id"], row["user__telegram_id"], row["token__contract_address"],
+            row["threshold_low"], row["threshold_mid"], row["threshold_high"], row["last_alert_level"],
+            row.get("alert_down", False), row.get("cooldown_seconds"),
+            last_alert_at.timestamp() if last_alert_at is not None else 0.0,
+        )
+
+    def thresholds(self):
+        return (self.low, self.mid, self.high)
+
+
+class _SortedThresholds:
+    """Eşik değerleri artan sırada + aynı sırada UserToken id'leri."""
+    __slots__ = ("values", "ids")
+
+    def __init__(self) -> None:
+        self.values: List[float] = []
+        self.ids: List[int] = []
+
+    def build(self, pairs: Iterable[tuple]) -> None:
+        ordered = sorted(pairs)
+        self.values = [v for v, _ in ordered]
+        self.ids = [i for _, i in ordered]
+
+    def add(self, value: float, ut_id: int) -> None:
+        i = bisect_right(self.values, value)
+        self.values.insert(i, value)
+        self.ids.insert(i, ut_id)
+
+    def remove(self, value: float, ut_id: int) -> None:
+        i = bisect_left(self.values, value)
+        j = bisect_right(self.values, value)
+        for k in range(i, j):
+            if self.ids[k] == ut_id:
+                del self.values[k]
+                del self.ids[k]
+                return
+
+    def between(self, lo: float, hi: float) -> List[int]:
+        """lo < eşik ≤ hi olan id'ler."""
+        return self.ids[bisect_right(self.values, lo):bisect_right(self.values, hi)]
+
+
+class _ContractEntry:
+    __slots__ = ("token_id", "ids", "low", "mid", "high", "dirty", "cooling")
+
+    def __init__(self, token_id: int) -> None:
+        self.token_id = token_id
+        self.ids: Set[int] = set()
+        self.low = _SortedThresholds()
+        self.mid = _SortedThresholds()
+        self.high = _SortedThresholds()
+        self.dirty: Set[int] = set()
+        self.cooling: Dict[int, float] = {}  # bekleme süresi dolunca yeniden değerlendirilecekler
+
+    def arrays(self):
+        return (self.low, self.mid, self.high)
+
+
+class ThresholdIndex:
+    """
+    Kontrat başına sıralı eşik dizileri. Önceki ve yeni mcap verildiğinde seviyesi
+    değişebilecek abonelikler bisect ile bulunur; tick maliyeti abone sayısıyla değil,
+    eşik geçişi sayısıyla ölçeklenir.
+
+    Değişmez (invariant): kontratın last_mcap'i p ise tüm aboneleri p'de değerlendirilmiştir
+    (p'de geçiş yok; bkz. watcher/alerting.py). Yeni/eşiği değişen abonelikler `dirty`,
+    bekleme süresi yüzünden geçişi ertelenenler `cooling` olarak işaretlenir ve
+    koşulsuz değerlendirilir.
+    """
+
+    def __init__(self) -> None:
+        self.generation = 0
+        self._track_changes = False  # ilk drain_changes'e (sütun önbelleği) kadar kayıt yok
+        self._edit_seq = 0
+        self.clear()
+
+    def clear(self) -> None:
+        self.generation += 1  # tam yeniden kurulum (sütun önbellekleri de yenilenir)
+        self._changed: Set[int] = set()
+        self._edits: Dict[int, int] = {}  # abonelik → son eşik/kayıt değişikliğinin sırası
+        self._edit_seq += 1
+        self._base_edit = self._edit_seq  # yeniden yükleme her aboneliği değişmiş sayar
+        self.subs: Dict[int, Subscription] = {}
+        self.last_mcap: Dict[str, float] = {}
+        self.loaded = False
+        self._contracts: Dict[str, _ContractEntry] = {}
+        self._by_chat: Dict[str, Set[int]] = {}
+        self._loading = False
+        self._pending: List[tuple] = []
+
+    # ---------------- Yükleme ----------------
+    def begin_load(self) -> None:
+        """DB okuması sürerken gelen değişiklikler kaybolmasın diye kaydedilir."""
+        self._loading = True
+        self._pending = []
+
+    def finish_load(self, rows: Iterable[Dict[str, Any]]) -> None:
+        pending, last_mcap = self._pending, self.last_mcap
+        self.clear()
+        for row in rows:
+            sub = Subscription.from_row(row)
+            self.subs[sub.id] = sub
+            self._by_chat.setdefault(sub.chat_id, set()).add(sub.id)
+            entry = self._entry(sub.contract, sub.token_id)
+            entry.ids.add(sub.id)
+
+        for contract, entry in self._contracts.items():
+            subs = [self.subs[i] for i in entry.ids]
+            entry.low.build((s.low, s.id) for s in subs)
+            entry.mid.build((s.mid, s.id) for s in subs)
+            entry.high.build((s.high, s.id) for s in subs)
+
+        # Yeniden yüklemede DB'deki seviyeler son değerlendirilen mcap'e karşılık gelir
+        self.last_mcap = {c: m for c, m in last_mcap.items() if c in self._contracts}
+        self.loaded = True
+        for op, args in pending:
+            getattr(self, op)(*args)
+
+    def _entry(self, contract: str, token_id: int) -> _ContractEntry:
+        entry = self._contracts.get(contract)
+        if entry is None:
+            entry = self._contracts[contract] = _ContractEntry(token_id)
+        return entry
+
+    # ---------------- Artımlı bakım ----------------
+    def upsert(self, sub: Subscription) -> None:
+        if self._loading:
+            self._pending.append(("upsert", (sub,)))
+        old = self.subs.get(sub.id)
+        if old is not None:
+            self._unlink(old)
+        self._mark(sub.id)
+        self._edited(sub.id)
+        self.subs[sub.id] = sub
+        self._by_chat.setdefault(sub.chat_id, set()).add(sub.id)
+        entry = self._entry(sub.contract, sub.token_id)
+        entry.ids.add(sub.id)
+        for arr, value in zip(entry.arrays(), sub.thresholds()):
+            arr.add(value, sub.id)
+        entry.dirty.add(sub.id)
+
+    def remove(self, ut_id: int) -> None:
+        if self._loading:
+            self._pending.append(("remove", (ut_id,)))
+        sub = self.subs.pop(ut_id, None)
+        if sub is not None:
+            self._mark(ut_id)
+            self._edits.pop(ut_id, None)
+            self._unlink(sub)
+
+    def update_thresholds(self, chat_id: str, contract: Optional[str],
+                          low: float, mid: float, high: float) -> int:
+        """Handler'daki toplu UPDATE'in bellekteki karşılığı."""
+        if self._loading:
+            self._pending.append(("update_thresholds", (chat_id, contract, low, mid, high)))
+        changed = 0
+        for ut_id in list(self._by_chat.get(str(chat_id), ())):
+            sub = self.subs[ut_id]
+            if contract is not None and sub.contract != contract:
+                continue
+            self._unlink(sub)
+            sub.low, sub.mid, sub.high = low, mid, high
+            self.subs[ut_id] = sub
+            self._by_chat.setdefault(sub.chat_id, set()).add(ut_id)
+            entry = self._entry(sub.contract, sub.token_id)
+            entry.ids.add(ut_id)
+            for arr, value in zip(entry.arrays(), sub.thresholds()):
+                arr.add(value, ut_id)
+            entry.dirty.add(ut_id)
+            self._mark(ut_id)
+            self._edited(ut_id)
+            changed += 1
+        return changed
+
+    def set_level(self, sub: Subscription, level: Level, alerted_at: Optional[float] = None) -> None:
+        """Tick'te uygulanan geçiş; bellekteki seviye (ve bildirildiyse zamanı) kaydı."""
+        sub.level = level
+        if alerted_at is not None:
+            sub.last_alert = alerted_at
+        self._mark(sub.id)
+
+    def cool(self, sub: Subscription, until: float) -> None:
+        """Geçişi bekleme süresine takıldı: `until`'e kadar her tick aday."""
+        entry = self._contracts.get(sub.contract)
+        if entry is not None:
+            entry.cooling[sub.id] = until
+
+    def drain_changes(self) -> Set[int]:
+        """
+        Son çağrıdan beri eklenen/değişen/silinen abonelik id'leri. Değişiklikler ancak
+        bir tüketici (vectorized.ColumnCache) ilk kez çağırdıktan sonra biriktirilir;
+        skaler yolda küme büyümez.
+        """
+        self._track_changes = True
+        changed, self._changed = self._changed, set()
+        return changed
+
+    def version(self, ut_id: int) -> int:
+        """
+        Aboneliğin değişiklik sayacı: değerlendirme anında alınır, commit'te karşılaştırılır.
+        Arada eşiği değişen aboneliğe eski eşiklerle hesaplanan sonuç uygulanmaz.
+        """
+        return self._edits.get(ut_id, self._base_edit)
+
+    def _edited(self, ut_id: int) -> None:
+        self._edit_seq += 1
+        self._edits[ut_id] = self._edit_seq
+
+    def _mark(self, ut_id: int) -> None:
+        if self._track_changes:
+            self._changed.add(ut_id)
+
+    def _unlink(self, sub: Subscription) -> None:
+        chat_ids = self._by_chat.get(sub.chat_id)
+        if chat_ids is not None:
+            chat_ids.discard(sub.id)
+            if not chat_ids:
+                del self._by_chat[sub.chat_id]
+        entry = self._contracts.get(sub.contract)
+        if entry is None:
+            return
+        for arr, value in zip(entry.arrays(), sub.thresholds()):
+            arr.remove(value, sub.id)
+        entry.ids.discard(sub.id)
+        entry.dirty.discard(sub.id)
+        entry.cooling.pop(sub.id, None)
+        if not entry.ids:
+            del self._contracts[sub.contract]
+            self.last_mcap.pop(sub.contract, None)
+
+    # ---------------- Tick sorguları ----------------
+    def contracts(self) -> List[str]:
+        return sorted(self._contracts)
+
+    def contract_count(self) -> int:
+        return len(self._contracts)
+
+    def token_id(self, contract: str) -> Optional[int]:
+        entry = self._contracts.get(contract)
+        return entry.token_id if entry is not None else None
+
+    def subscribers(self, contract: str) -> List[Subscription]:
+        entry = self._contracts.get(contract)
+        return [self.subs[i] for i in entry.ids] if entry is not None else []
+
+    def candidates(self, contract: str, mcap: float, hysteresis: float = 1.0) -> List[Subscription]:
+        """
+        Yeni mcap ile seviyesi değişebilecek abonelikler:
+        önceki mcap bilinmiyorsa hepsi; yükselişte (prev, mcap] aralığında eşiği olanlar;
+        düşüşte yeniden kurma noktası t·(1 − hysteresis) (mcap, prev] aralığında olanlar;
+        her durumda dirty ve cooling olanlar. hysteresis ≥ 1 → seviye düşmez.
+        """
+        entry = self._contracts.get(contract)
+        if entry is None:
+            return []
+        prev = self.last_mcap.get(contract)
+        if prev is None:
+            return [self.subs[i] for i in entry.ids]
+
+        ids: Set[int] = set(entry.dirty)
+        ids.update(entry.cooling)
+        if mcap > prev:
+            for arr in entry.arrays():
+                ids.update(arr.between(prev, mcap))
+        elif mcap < prev and hysteresis < 1.0:
+            keep = 1.0 - hysteresis
+            # Sınırdaki yuvarlama için aralık hafifçe genişletilir; fazladan aday zararsız
+            lo, hi = mcap / keep * (1 - 1e-12), prev / keep * (1 + 1e-12)
+            for arr in entry.arrays():
+                ids.update(arr.between(lo, hi))
+        return [self.subs[i] for i in ids]
+
+    def nearest_event(self, contract: str, mcap: float, hysteresis: float = 1.0) -> Optional[float]:
+        """
+        Zamanlayıcı için mcap'e (log ölçeğinde) en yakın olay noktası: üstteki ilk eşik ya da
+        alttaki ilk yeniden kurma noktası t·(1 − hysteresis). Yoksa None.
+        """
+        best = self.nearest_above(contract, mcap)
+        entry = self._contracts.get(contract)
+        if entry is None or hysteresis >= 1.0 or mcap <= 0:
+            return best
+        keep = 1.0 - hysteresis
+        for arr in entry.arrays():
+            i = bisect_left(arr.values, mcap / keep) - 1
+            if i >= 0 and arr.values[i] > 0:
+                point = arr.values[i] * keep
+                if best is None or abs(math.log(point / mcap)) < abs(math.log(best / mcap)):
+                    best = point
+        return best
+
+    def nearest_above(self, contract: str, mcap: float) -> Optional[float]:
+        """mcap'in üstündeki (henüz geçilmemiş) en yakın eşik; yoksa None."""
+        entry = self._contracts.get(contract)
+        if entry is None:
+            return None
+        best: Optional[float] = None
+        for arr in entry.arrays():
+            i = bisect_right(arr.values, mcap)
+            if i < len(arr.values) and (best is None or arr.values[i] < best):
+                best = arr.values[i]
+        return best
+
+    def commit(self, contract: str, mcap: float, now: Optional[float] = None,
+               evaluated: Optional[Dict[int, int]] = None) -> None:
+        """
+        Kontratın tüm adayları `mcap` ile (`now` anında) değerlendirildi. `evaluated`
+        (abonelik → değerlendirmedeki version()) verilirse sadece sayacı hâlâ aynı olanların
+        dirty işareti kalkar; arada değişenler aday kalır.
+        """
+        self.last_mcap[contract] = mcap
+        entry = self._contracts.get(contract)
+        if entry is not None:
+            if evaluated is None:
+                entry.dirty.clear()
+            else:
+                for ut_id, version in evaluated.items():
+                    if self.version(ut_id) == version:
+                        entry.dirty.discard(ut_id)
+            if entry.cooling:
+                now = time.time() if now is None else now
+                entry.cooling = {i: until for i, until in entry.cooling.items() if until > now}
+
+    def __len__(self) -> int:
+        return len(self.subs)
+
+
+_index: Optional[ThresholdIndex] = None
+
+
+def get_threshold_index() -> ThresholdIndex:
+    global _index
+    if _index is None:
+        _index = ThresholdIndex()
+    return _index
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('watcher', '0002_remove_token_name_remove_token_symbol_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='usertoken',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
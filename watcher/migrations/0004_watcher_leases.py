@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('watcher', '0003_alter_usertoken_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WatcherLease',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveIntegerField(unique=True)),
+                ('owner', models.CharField(blank=True, default='', max_length=100)),
+                ('epoch', models.PositiveBigIntegerField(default=0)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='WatcherWorker',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('owner', models.CharField(max_length=100, unique=True)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
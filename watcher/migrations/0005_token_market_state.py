@@ -0,0 +1,57 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils import timezone
+
+
+def copy_last_seen(apps, schema_editor):
+    """Her kontrat için abonelerden birinin last_seen_mcap'ini TokenMarketState'e taşı."""
+    UserToken = apps.get_model('watcher', 'UserToken')
+    TokenMarketState = apps.get_model('watcher', 'TokenMarketState')
+    now = timezone.now()
+    seen = {}
+    for token_id, mcap in (UserToken.objects.filter(last_seen_mcap__isnull=False)
+                           .values_list('token_id', 'last_seen_mcap')):
+        seen.setdefault(token_id, mcap)
+    TokenMarketState.objects.bulk_create(
+        [TokenMarketState(token_id=t, last_mcap=m, fetched_at=now) for t, m in seen.items()],
+        batch_size=500,
+    )
+
+
+def restore_last_seen(apps, schema_editor):
+    UserToken = apps.get_model('watcher', 'UserToken')
+    TokenMarketState = apps.get_model('watcher', 'TokenMarketState')
+    for token_id, mcap in TokenMarketState.objects.values_list('token_id', 'last_mcap'):
+        UserToken.objects.filter(token_id=token_id).update(last_seen_mcap=mcap)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('watcher', '0004_watcher_leases'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TokenMarketState',
+            fields=[
+                ('token', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='market', serialize=False, to='watcher.token')),
+                ('last_mcap', models.FloatField(blank=True, null=True)),
+                ('price_usd', models.FloatField(blank=True, null=True)),
+                ('liquidity_usd', models.FloatField(blank=True, null=True)),
+                ('volume_h24', models.FloatField(blank=True, null=True)),
+                ('chain_id', models.CharField(blank=True, default='', max_length=32)),
+                ('dex_id', models.CharField(blank=True, default='', max_length=32)),
+                ('pair_address', models.CharField(blank=True, default='', max_length=100)),
+                ('pair_url', models.URLField(blank=True, default='', max_length=300)),
+                ('fetched_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.RunPython(copy_last_seen, restore_last_seen),
+        migrations.RemoveField(
+            model_name='usertoken',
+            name='last_seen_mcap',
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('watcher', '0005_token_market_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usertoken',
+            name='alert_down',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='usertoken',
+            name='cooldown_seconds',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='usertoken',
+            name='last_alert_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -13,6 +13,26 @@ class User(models.Model):
     def __str__(self):
         return self.username or self.telegram_id
 
+class TokenMarketState(models.Model):
+    """
+    Kontrat başına son piyasa verisi (watcher her tick'te kontrat başına tek satır yazar).
+    UserToken'da sadece kullanıcıya özel uyarı durumu kalır.
+    """
+    token = models.OneToOneField(Token, on_delete=models.CASCADE, primary_key=True, related_name="market")
+    last_mcap = models.FloatField(null=True, blank=True)
+    price_usd = models.FloatField(null=True, blank=True)
+    liquidity_usd = models.FloatField(null=True, blank=True)
+    volume_h24 = models.FloatField(null=True, blank=True)
+    # En likit pair
+    chain_id = models.CharField(max_length=32, blank=True, default="")
+    dex_id = models.CharField(max_length=32, blank=True, default="")
+    pair_address = models.CharField(max_length=100, blank=True, default="")
+    pair_url = models.URLField(max_length=300, blank=True, default="")
+    fetched_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.token} @ {self.last_mcap}"
+
 class UserToken(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     token = models.ForeignKey(Token, on_delete=models.CASCADE)
@@ -26,11 +46,57 @@ class UserToken(models.Model):
         choices=[("none", "none"), ("low", "low"), ("mid", "mid"), ("high", "high")],
         default="none",
     )
-    last_seen_mcap = models.FloatField(null=True, blank=True)  # son görülen market cap
-    updated_at = models.DateTimeField(auto_now=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)  # registry uzlaştırması bununla
+
+    # --- uyarı politikası (watcher/alerting.py) ---
+    alert_down = models.BooleanField(default=False)  # histerezis bandının altına düşüşü de bildir
+    cooldown_seconds = models.PositiveIntegerField(null=True, blank=True)  # boş: WATCHER_ALERT_COOLDOWN_SECONDS
+    last_alert_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         unique_together = (("user", "token"),)
 
     def __str__(self):
         return f"{self.user} - {self.token}"
+
+
+class WatcherWorker(models.Model):
+    """Canlı watcher süreçleri; shard payı (⌈shard / canlı süreç⌉) bununla hesaplanır."""
+    owner = models.CharField(max_length=100, unique=True)  # host:pid:rastgele
+    started_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.owner
+
+
+class WatcherLease(models.Model):
+    """
+    Shard kiralaması: bir shard'ın kontratlarını sadece kirayı tutan süreç işler.
+    Her el değiştirmede epoch artar; tick yazımları (owner, epoch) eşleşmesiyle korunur.
+    """
+    shard = models.PositiveIntegerField(unique=True)
+    owner = models.CharField(max_length=100, blank=True, default="")
+    epoch = models.PositiveBigIntegerField(default=0)
+    expires_at = models.DateTimeField(db_index=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"shard {self.shard} → {self.owner or '-'} (epoch {self.epoch})"
+
+
+class BotState(models.Model):
+    """
+    PTB sohbet durumu (bot/persistence.py): wizard adımı ve user_data. Webhook modunda
+    her ASGI worker'ı güncellemeyi işlemeden önce buradan okur, işledikten sonra yazar.
+    """
+    kind = models.CharField(max_length=60)   # "user" | "conv:<ConversationHandler adı>"
+    key = models.CharField(max_length=100)   # user id ya da konuşma anahtarı (JSON liste)
+    data = models.JSONField(null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = (("kind", "key"),)
+
+    def __str__(self):
+        return f"{self.kind}:{self.key}"
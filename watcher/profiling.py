@@ -0,0 +1,324 @@
+# watcher/profiling.py
+"""
+Yavaş tick teşhisi.
+
+FlightRecorder (her zaman açık): son WATCHER_FLIGHT_RECORDER_TICKS tick'in aşama süreleri
+(TickReport.stages) bellekte halka tamponda tutulur. Bir tick bütçesini aşınca (süre > bütçe
+ya da kontrat devredildi) tampon WATCHER_FLIGHT_DIR altına JSON olarak yazılır; en fazla
+WATCHER_FLIGHT_DUMP_INTERVAL_SECONDS'ta bir, en fazla WATCHER_FLIGHT_MAX_DUMPS dosya.
+
+TickProfiler (istek üzerine): sonraki N tick profillenir, sonuç WATCHER_PROFILE_DIR altına.
+- cprofile: cProfile → .pstats + en pahalı fonksiyonların özeti (.txt)
+- sample:   event loop thread'inin yığını WATCHER_PROFILE_SAMPLE_INTERVAL'da bir örneklenir
+            → .folded (flamegraph.pl / speedscope) + özet (.txt); cProfile'dan çok daha ucuz
+İkisi de sadece event loop thread'ini görür: DB havuzu (bot/db.py) ve aiohttp beklemeleri
+await süresi olarak görünür.
+
+Açma yolları:
+- SIGUSR1 (install_signal_handler; run_watcher ve gömülü watcher'lı bot kurar)
+- `python manage.py profile_ticks --ticks 5 --mode sample [--pid PID]`
+- admin: WatcherWorker listesinde "Sonraki tick'leri profille"
+Son ikisi istek dosyası bırakır (profile-request[-<pid>].json); watcher her tick başında
+bakar (tek stat çağrısı). Dosya aynı makinedeki süreçlere ulaşır.
+"""
+from __future__ import annotations
+import collections
+import contextlib
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import signal
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+from django.conf import settings
+
+from watcher.runner import TickReport
+
+log = logging.getLogger(__name__)
+
+_VAR = Path(settings.BASE_DIR) / "var"
+FLIGHT_RECORDER_TICKS = getattr(settings, "WATCHER_FLIGHT_RECORDER_TICKS", 300)
+FLIGHT_DIR = Path(getattr(settings, "WATCHER_FLIGHT_DIR", _VAR / "flight"))
+FLIGHT_DUMP_INTERVAL_SECONDS = getattr(settings, "WATCHER_FLIGHT_DUMP_INTERVAL_SECONDS", 60.0)
+FLIGHT_MAX_DUMPS = getattr(settings, "WATCHER_FLIGHT_MAX_DUMPS", 50)
+PROFILE_DIR = Path(getattr(settings, "WATCHER_PROFILE_DIR", _VAR / "profiles"))
+PROFILE_TICKS = getattr(settings, "WATCHER_PROFILE_TICKS", 5)
+PROFILE_MODE = getattr(settings, "WATCHER_PROFILE_MODE", "cprofile")
+PROFILE_SAMPLE_INTERVAL = getattr(settings, "WATCHER_PROFILE_SAMPLE_INTERVAL", 0.005)
+
+MODES = ("cprofile", "sample")
+REQUEST_NAME = "profile-request"
+
+
+def _stamp() -> str:
+    return time.strftime("%Y%m%d-%H%M%S") + f"-{os.getpid()}"
+
+
+def _prune(directory: Path, pattern: str, keep: int) -> None:
+    files = sorted(directory.glob(pattern), key=lambda p: p.stat().st_mtime)
+    for old in files[:max(0, len(files) - keep)]:
+        with contextlib.suppress(OSError):
+            old.unlink()
+
+
+# ---------------- Uçuş kaydedici ----------------
+class FlightRecorder:
+    def __init__(self, size: int = FLIGHT_RECORDER_TICKS, directory: Path = FLIGHT_DIR,
+                 dump_interval: float = FLIGHT_DUMP_INTERVAL_SECONDS, max_dumps: int = FLIGHT_MAX_DUMPS):
+        self.directory = Path(directory)
+        self.dump_interval = dump_interval
+        self.max_dumps = max_dumps
+        self.ticks: Deque[Dict[str, Any]] = collections.deque(maxlen=size)
+        self.slow = 0
+        self._last_dump = float("-inf")
+
+    def record(self, report: TickReport, budget: float) -> Optional[Path]:
+        """Tick'i tampona ekler; bütçeyi aştıysa (ve aralık dolduysa) tamponu diske yazar."""
+        entry = {
+            "started_at": round(report.started_at, 3),
+            "duration": round(report.duration, 4),
+            "budget": budget,
+            "stages": {k: round(v, 4) for k, v in report.stages.items()},
+            "contracts": report.contracts,
+            "processed": report.processed,
+            "carried": report.carried,
+            "crossings": report.crossings,
+            "skipped": report.skipped,
+        }
+        self.ticks.append(entry)
+        if report.skipped or (report.duration <= budget and not report.carried):
+            return None
+        self.slow += 1
+        now = time.monotonic()
+        if now - self._last_dump < self.dump_interval:
+            return None
+        self._last_dump = now
+        return self.dump(entry)
+
+    def dump(self, trigger: Optional[Dict[str, Any]] = None) -> Optional[Path]:
+        path = self.directory / f"slow-tick-{_stamp()}.json"
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps({"pid": os.getpid(), "trigger": trigger, "ticks": list(self.ticks)}))
+            _prune(self.directory, "slow-tick-*.json", self.max_dumps)
+        except OSError:
+            log.exception("Uçuş kaydı yazılamadı: %s", path)
+            return None
+        log.warning("Tick bütçeyi aştı (%.2f sn); son %s tick: %s",
+                    trigger["duration"] if trigger else 0.0, len(self.ticks), path)
+        return path
+
+
+# ---------------- Örnekleyici ----------------
+class StackSampler:
+    """Hedef thread'in yığınını ayrı bir thread'den periyodik okur (sys._current_frames)."""
+
+    def __init__(self, thread_id: int, interval: float = PROFILE_SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts: collections.Counter = collections.Counter()
+        self.samples = 0
+        self.active = threading.Event()  # sadece tick sürerken örnekle
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="tick-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self.active.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.active.wait()
+            time.sleep(self.interval)
+            if not self.active.is_set() or self._stop.is_set():
+                continue
+            frame = sys._current_frames().get(self.thread_id)
+            stack: List[str] = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+                self.samples += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {n}\n" for stack, n in self.counts.most_common())
+
+    def summary(self, top: int = 40) -> str:
+        own: collections.Counter = collections.Counter()
+        inclusive: collections.Counter = collections.Counter()
+        for stack, n in self.counts.items():
+            frames = stack.split(";")
+            own[frames[-1]] += n
+            for name in set(frames):
+                inclusive[name] += n
+        total = max(1, self.samples)
+        out = [f"{self.samples} örnek, {self.interval * 1000:.1f} ms aralık", "", "kendi süresi:"]
+        out += [f"  {n / total:6.1%}  {name}" for name, n in own.most_common(top)]
+        out += ["", "kapsayan süre:"]
+        out += [f"  {n / total:6.1%}  {name}" for name, n in inclusive.most_common(top)]
+        return "\n".join(out) + "\n"
+
+
+# ---------------- Profilleyici ----------------
+class TickProfiler:
+    def __init__(self, directory: Path = PROFILE_DIR, sample_interval: float = PROFILE_SAMPLE_INTERVAL):
+        self.directory = Path(directory)
+        self.sample_interval = sample_interval
+        self.remaining = 0
+        self.mode = PROFILE_MODE
+        self.last_output: List[Path] = []
+        self._ticks = 0
+        self._profile: Optional[cProfile.Profile] = None
+        self._sampler: Optional[StackSampler] = None
+
+    @property
+    def armed(self) -> bool:
+        return self.remaining > 0
+
+    def arm(self, ticks: int = PROFILE_TICKS, mode: str = PROFILE_MODE) -> None:
+        """Sonraki `ticks` tick'i profille (sürmekte olan oturum varsa uzatır)."""
+        if mode not in MODES:
+            raise ValueError(f"Bilinmeyen profil modu: {mode}")
+        if self.armed and mode != self.mode:
+            log.warning("Profil zaten açık (%s); yeni istek sayıyı uzatır", self.mode)
+        else:
+            self.mode = mode
+        self.remaining = max(self.remaining, ticks)
+        log.info("Sonraki %s tick profillenecek (%s)", self.remaining, self.mode)
+
+    def poll(self) -> None:
+        """Bu sürece (ya da herhangi birine) bırakılmış istek dosyasını tüket."""
+        for path in (self.directory / f"{REQUEST_NAME}-{os.getpid()}.json", self.directory / f"{REQUEST_NAME}.json"):
+            try:
+                claimed = path.with_suffix(f".{os.getpid()}.claimed")
+                os.replace(path, claimed)  # aynı dosyayı iki süreç almasın
+            except OSError:
+                continue
+            try:
+                request = json.loads(claimed.read_text() or "{}")
+                self.arm(int(request.get("ticks", PROFILE_TICKS)), request.get("mode", PROFILE_MODE))
+            except (OSError, ValueError) as exc:
+                log.warning("Profil isteği okunamadı (%s): %s", path, exc)
+            finally:
+                with contextlib.suppress(OSError):
+                    claimed.unlink()
+
+    @contextlib.contextmanager
+    def tick(self) -> Iterator[None]:
+        if not self.armed:
+            yield
+            return
+        if self.mode == "cprofile":
+            if self._profile is None:
+                self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            if self._sampler is None:
+                self._sampler = StackSampler(threading.get_ident(), self.sample_interval)
+                self._sampler.start()
+            self._sampler.active.set()
+        try:
+            yield
+        finally:
+            if self._profile is not None:
+                self._profile.disable()
+            if self._sampler is not None:
+                self._sampler.active.clear()
+            self._ticks += 1
+            self.remaining -= 1
+            if self.remaining <= 0:
+                self.finish()
+
+    def finish(self) -> List[Path]:
+        """Oturumu kapatır, sonucu yazar."""
+        base = self.directory / f"tick-{_stamp()}"
+        outputs: List[Path] = []
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            header = f"{self._ticks} tick, mod={self.mode}\n"
+            if self._profile is not None:
+                outputs.append(base.with_suffix(".pstats"))
+                self._profile.dump_stats(str(outputs[-1]))
+                text = io.StringIO()
+                pstats.Stats(self._profile, stream=text).sort_stats("cumulative").print_stats(50)
+                outputs.append(base.with_suffix(".txt"))
+                outputs[-1].write_text(header + text.getvalue())
+            if self._sampler is not None:
+                self._sampler.stop()
+                outputs.append(base.with_suffix(".folded"))
+                outputs[-1].write_text(self._sampler.folded())
+                outputs.append(base.with_suffix(".txt"))
+                outputs[-1].write_text(header + self._sampler.summary())
+        except OSError:
+            log.exception("Profil yazılamadı: %s", base)
+        finally:
+            self._profile = self._sampler = None
+            self.remaining = self._ticks = 0
+        if outputs:
+            log.info("Tick profili: %s", ", ".join(map(str, outputs)))
+        self.last_output = outputs
+        return outputs
+
+
+def request_profile(ticks: int = PROFILE_TICKS, mode: str = PROFILE_MODE, pid: Optional[int] = None,
+                    directory: Path = PROFILE_DIR) -> Path:
+    """Başka bir watcher sürecine istek bırak (pid yoksa ilk bakan süreç alır)."""
+    if mode not in MODES:
+        raise ValueError(f"Bilinmeyen profil modu: {mode}")
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / (f"{REQUEST_NAME}-{pid}.json" if pid else f"{REQUEST_NAME}.json")
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps({"ticks": ticks, "mode": mode}))
+    os.replace(tmp, path)
+    return path
+
+
+def install_signal_handler(loop) -> bool:
+    """SIGUSR1 → sonraki PROFILE_TICKS tick'i profille. Desteklenmiyorsa False."""
+    sig = getattr(signal, "SIGUSR1", None)
+    if sig is None:
+        return False
+    try:
+        loop.add_signal_handler(sig, get_tick_profiler().arm)
+    except (NotImplementedError, RuntimeError, ValueError):
+        return False  # Windows ya da ana thread dışı
+    return True
+
+
+def remove_signal_handler(loop) -> None:
+    sig = getattr(signal, "SIGUSR1", None)
+    if sig is not None:
+        with contextlib.suppress(NotImplementedError, RuntimeError, ValueError):
+            loop.remove_signal_handler(sig)
+
+
+_recorder: Optional[FlightRecorder] = None
+_profiler: Optional[TickProfiler] = None
+
+
+def get_flight_recorder() -> FlightRecorder:
+    global _recorder
+    if _recorder is None:
+        _recorder = FlightRecorder()
+    return _recorder
+
+
+def get_tick_profiler() -> TickProfiler:
+    global _profiler
+    if _profiler is None:
+        _profiler = TickProfiler()
+    return _profiler
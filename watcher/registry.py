@@ -0,0 +1,181 @@
+# watcher/registry.py
+from __future__ import annotations
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.utils import timezone
+
+from bot.db import db_sync
+from watcher.index import Subscription, ThresholdIndex, get_threshold_index
+from watcher.models import UserToken
+
+log = logging.getLogger(__name__)
+
+RECONCILE_SECONDS = getattr(settings, "WATCHER_RECONCILE_SECONDS", 60)
+FULL_RESYNC_EVERY = getattr(settings, "WATCHER_FULL_RESYNC_EVERY", 60)
+_CLOCK_SKEW = timedelta(seconds=2)
+
+
+# ---------------- DB helpers (sync → async) ----------------
+_FIELDS = (
+    "id",
+    "token_id",
+    "user__telegram_id",
+    "token__contract_address",
+    "threshold_low",
+    "threshold_mid",
+    "threshold_high",
+    "last_alert_level",
+    "alert_down",
+    "cooldown_seconds",
+    "last_alert_at",
+    "updated_at",
+)
+
+
+@db_sync
+def _load_user_tokens(since: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """
+    UserToken'ları tek query ile gerekli alanlar halinde döndürür.
+    `since` verilirse sadece o andan sonra değişenler (updated_at indeksli).
+    """
+    qs = UserToken.objects.select_related("user", "token")
+    if since is not None:
+        qs = qs.filter(updated_at__gte=since)
+    return list(qs.values(*_FIELDS))
+
+
+@db_sync
+def _load_ids() -> List[int]:
+    return list(UserToken.objects.values_list("id", flat=True))
+
+
+def _subscription(ut: UserToken) -> Subscription:
+    return Subscription(
+        ut.id, ut.token_id, ut.user.telegram_id, ut.token.contract_address,
+        ut.threshold_low, ut.threshold_mid, ut.threshold_high, ut.last_alert_level,
+        ut.alert_down, ut.cooldown_seconds,
+        ut.last_alert_at.timestamp() if ut.last_alert_at is not None else 0.0,
+    )
+
+
+class SubscriptionRegistry:
+    """
+    Süreç boyunca yaşayan abonelik kaydı: açılışta bir kez yüklenir, sonra
+    - handler DB helper'larından gelen olaylar (toplu eşik güncellemesi),
+    - post_save / post_delete sinyalleri (yeni abonelik, admin düzenlemeleri, silme),
+    - periyodik updated_at uzlaştırması (başka süreçlerin yazdıkları)
+    ile güncel tutulur. Tick başına DB okuması yok.
+
+    Sinyaller DB thread'inde tetiklenir; indeks sadece event loop thread'inde değişir.
+    """
+
+    def __init__(self, index: Optional[ThresholdIndex] = None):
+        self.index = index or get_threshold_index()
+        self.watermark: Optional[datetime] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._last_reconcile = 0.0
+        self._reconciles = 0
+
+    @property
+    def loaded(self) -> bool:
+        return self.index.loaded
+
+    # ---------------- Yükleme / uzlaştırma ----------------
+    async def load(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        started = timezone.now()
+        self.index.begin_load()
+        self.index.finish_load(await _load_user_tokens())
+        self.watermark = started
+        self._last_reconcile = time.monotonic()
+        log.info("Abonelik kaydı yüklendi: %s abonelik, %s kontrat",
+                 len(self.index), len(self.index.contracts()))
+
+    async def reload(self) -> None:
+        """
+        Sıfırdan yükleme: son görülen mcap'ler de unutulur, sonraki tick tüm aboneleri
+        değerlendirir. Seviyeler başka süreçte değişmiş olabilecekken (shard devri,
+        geri alınan tick) kullanılır.
+        """
+        self.index.clear()
+        await self.load()
+
+    async def ensure_loaded(self) -> None:
+        if not self.loaded:
+            await self.load()
+        else:
+            self._loop = asyncio.get_running_loop()
+
+    async def maybe_reconcile(self) -> None:
+        if time.monotonic() - self._last_reconcile >= RECONCILE_SECONDS:
+            await self.reconcile()
+
+    async def reconcile(self) -> int:
+        """
+        updated_at > watermark olan satırları yeniden okur; her FULL_RESYNC_EVERY
+        turda bir de id kümesini karşılaştırıp başka süreçlerde silinenleri düşürür.
+        """
+        started = timezone.now()
+        since = (self.watermark or started) - _CLOCK_SKEW
+        rows = await _load_user_tokens(since)
+        for row in rows:
+            self.index.upsert(Subscription.from_row(row))
+
+        self._reconciles += 1
+        if FULL_RESYNC_EVERY and self._reconciles % FULL_RESYNC_EVERY == 0:
+            db_ids = set(await _load_ids())
+            for ut_id in set(self.index.subs) - db_ids:
+                self.index.remove(ut_id)
+            missing = db_ids - set(self.index.subs)
+            if missing:
+                for row in await _load_user_tokens():
+                    if row["id"] in missing:
+                        self.index.upsert(Subscription.from_row(row))
+
+        self.watermark = started
+        self._last_reconcile = time.monotonic()
+        return len(rows)
+
+    # ---------------- Değişiklik olayları (herhangi bir thread'den) ----------------
+    def _call(self, fn, *args) -> None:
+        loop = self._loop
+        if loop is None or not self.loaded:
+            return  # henüz yüklenmedi: load() zaten DB'den okuyacak
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop or not loop.is_running():
+            fn(*args)
+        else:
+            loop.call_soon_threadsafe(fn, *args)
+
+    def subscription_saved(self, ut: UserToken) -> None:
+        self._call(self.index.upsert, _subscription(ut))
+
+    def subscription_deleted(self, ut_id: int) -> None:
+        self._call(self.index.remove, ut_id)
+
+    def thresholds_changed(self, chat_id: str, contract: Optional[str],
+                           low: float, mid: float, high: float) -> None:
+        self._call(self.index.update_thresholds, str(chat_id), contract, low, mid, high)
+
+
+_registry: Optional[SubscriptionRegistry] = None
+
+
+def get_registry() -> SubscriptionRegistry:
+    global _registry
+    if _registry is None:
+        _registry = SubscriptionRegistry()
+    return _registry
+
+
+async def load_registry(_app: Any = None) -> None:
+    """PTB Application.post_init: abonelikleri açılışta yükle."""
+    await get_registry().load()
@@ -0,0 +1,99 @@
+# watcher/runner.py
+from __future__ import annotations
+import logging
+import time
+from bisect import bisect_right
+import contextlib
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from bot import metrics
+
+log = logging.getLogger(__name__)
+
+_TICK_SECONDS = metrics.histogram("watcher_tick_seconds", "Tick süresi (uçtan uca)")
+_TICKS_SKIPPED = metrics.counter("watcher_ticks_skipped_total", "Önceki tick sürdüğü için atlanan tick'ler")
+_CARRIED = metrics.counter("watcher_contracts_carried_total", "Süre dolduğu için sonraki tick'e kalan kontratlar")
+
+
+@dataclass
+class TickReport:
+    started_at: float = 0.0      # time.time()
+    duration: float = 0.0
+    contracts: int = 0           # bu tick'e seçilen kontrat
+    processed: int = 0
+    carried: int = 0             # süre dolduğu için sonraki tick'e kalan
+    crossings: int = 0
+    skipped: bool = False        # önceki tick hâlâ sürüyordu
+    stages: Dict[str, float] = field(default_factory=dict)  # aşama → sn (load, fetch, evaluate, write, send)
+
+
+class RoundRobinCursor:
+    """
+    Sabit aralıklı modda kalıcı tur imleci: her tick son işlenen kontratın
+    ardından başlar, böylece süre dolunca kalanlar bir sonraki tick'in başına geçer
+    ve her kontrat en geç ⌈N / tick başına kapasite⌉ tick'te bir yenilenir.
+    """
+
+    def __init__(self) -> None:
+        self.position: Optional[str] = None
+
+    def order(self, contracts: List[str]) -> List[str]:
+        """`contracts` sıralı olmalı (ThresholdIndex.contracts())."""
+        if self.position is None:
+            return list(contracts)
+        start = bisect_right(contracts, self.position)
+        return contracts[start:] + contracts[:start]
+
+    def advance(self, last_processed: str) -> None:
+        self.position = last_processed
+
+
+class TickRunner:
+    """
+    Tick'lerin asla üst üste binmemesini sağlar: önceki tick sürerken gelen
+    çağrı beklemeden atlanır. Her tick'e bir bitiş zamanı (deadline) verilir.
+    recorder/profiler: watcher/profiling.py (uçuş kaydedici, istek üzerine profil).
+    """
+
+    def __init__(self, budget_seconds: float, recorder: Any = None, profiler: Any = None):
+        self.budget_seconds = budget_seconds
+        self.recorder = recorder
+        self.profiler = profiler
+        self.running = False
+        self.skipped = 0
+        self.last_report: Optional[TickReport] = None
+
+    async def run(self, tick: Callable[[float], Awaitable[TickReport]],
+                  budget_seconds: Optional[float] = None) -> TickReport:
+        if self.running:
+            self.skipped += 1
+            _TICKS_SKIPPED.inc()
+            log.warning("Önceki tick sürüyor, bu tick atlandı (toplam %s)", self.skipped)
+            report = TickReport(started_at=time.time(), skipped=True)
+            if self.recorder is not None:
+                self.recorder.record(report, self.budget_seconds)
+            return report
+
+        self.running = True
+        budget = budget_seconds if budget_seconds is not None else self.budget_seconds
+        if self.profiler is not None:
+            self.profiler.poll()
+        started, wall = time.monotonic(), time.time()
+        deadline = started + budget
+        try:
+            with self.profiler.tick() if self.profiler is not None else contextlib.nullcontext():
+                report = await tick(deadline)
+        finally:
+            self.running = False
+        report.started_at = wall
+        report.duration = time.monotonic() - started
+        self.last_report = report
+        _TICK_SECONDS.observe(report.duration)
+        _CARRIED.inc(report.carried)
+        if self.recorder is not None:
+            self.recorder.record(report, budget)
+        if report.carried:
+            log.info("Tick süresi doldu: %s/%s kontrat işlendi, %s sonraki tick'e kaldı",
+                     report.processed, report.contracts, report.carried)
+        return report
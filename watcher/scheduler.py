@@ -0,0 +1,149 @@
+# watcher/scheduler.py
+from __future__ import annotations
+import heapq
+import itertools
+import math
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+
+POLL_MIN_SECONDS = getattr(settings, "WATCHER_POLL_MIN_SECONDS", 5.0)
+POLL_MAX_SECONDS = getattr(settings, "WATCHER_POLL_MAX_SECONDS", 300.0)
+POLL_BUDGET_RPS = getattr(settings, "WATCHER_POLL_BUDGET_RPS", 100.0)  # kontrat/sn
+POLL_SAFETY = getattr(settings, "WATCHER_POLL_SAFETY", 0.25)
+
+_VOL_ALPHA = 0.3        # EWMA ağırlığı
+_VOL_FLOOR = 1e-4       # hiç hareket etmeyen token için taban (≈ %0.01 / √sn)
+
+
+class _PollState:
+    __slots__ = ("mcap", "at", "vol", "failures")
+
+    def __init__(self) -> None:
+        self.mcap: Optional[float] = None
+        self.at = 0.0
+        self.vol: Optional[float] = None  # |ln(m1/m0)| / √dt  (göreli hareket / √saniye)
+        self.failures = 0
+
+
+class PollScheduler:
+    """
+    Kontrat başına bir sonraki sorgu zamanını tutan öncelik kuyruğu.
+
+    Aralık, mcap'in en yakın geçilmemiş eşiğe göreli uzaklığı (d) ve son oynaklıktan (σ)
+    türetilir: rastgele yürüyüşte eşiğe varma süresi ~ (d/σ)², güvenlik katsayısıyla
+    küçültülüp [POLL_MIN, POLL_MAX] aralığına sıkıştırılır. Sınıra yakın kontratlar
+    birkaç saniyede bir, uykudakiler dakikalarca bir sorgulanır. Tick başına en fazla
+    budget_rps × geçen süre kadar kontrat çıkar; kalanlar kuyruğun başında bekler.
+    """
+
+    def __init__(
+        self,
+        min_interval: float = POLL_MIN_SECONDS,
+        max_interval: float = POLL_MAX_SECONDS,
+        budget_rps: float = POLL_BUDGET_RPS,
+        safety: float = POLL_SAFETY,
+    ):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.budget_rps = budget_rps
+        self.safety = safety
+        self._heap: List[Tuple[float, int, str]] = []
+        self._due: Dict[str, float] = {}
+        self._state: Dict[str, _PollState] = {}
+        self._seq = itertools.count()
+        self._last_take: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    def _push(self, contract: str, due: float) -> None:
+        self._due[contract] = due
+        heapq.heappush(self._heap, (due, next(self._seq), contract))
+
+    def sync(self, contracts: Iterable[str], now: Optional[float] = None) -> None:
+        """Yeni kontratlar hemen sorgulanır; takipten çıkanlar `forget` ile düşer."""
+        now = time.monotonic() if now is None else now
+        for contract in contracts:
+            if contract not in self._due:
+                self._push(contract, now)
+
+    def forget(self, contract: str) -> None:
+        self._due.pop(contract, None)  # heap kaydı pop edilirken atlanır
+        self._state.pop(contract, None)
+
+    def take_due(self, now: Optional[float] = None, limit: Optional[int] = None) -> List[str]:
+        """Zamanı gelmiş kontratlar (en gecikmiş önce), global bütçe kadar."""
+        now = time.monotonic() if now is None else now
+        if limit is None:
+            elapsed = self.min_interval if self._last_take is None else now - self._last_take
+            limit = max(1, int(self.budget_rps * max(elapsed, self.min_interval)))
+        self._last_take = now
+
+        out: List[str] = []
+        while self._heap and len(out) < limit:
+            due, _, contract = self._heap[0]
+            if due > now:
+                break
+            heapq.heappop(self._heap)
+            if self._due.get(contract) != due:
+                continue  # eski/iptal kayıt
+            del self._due[contract]
+            out.append(contract)
+        return out
+
+    def requeue(self, contracts: Iterable[str], now: Optional[float] = None) -> None:
+        """Alınıp işlenemeyenleri (ör. tick süresi doldu) kuyruğun başına geri koy."""
+        now = time.monotonic() if now is None else now
+        for contract in contracts:
+            if contract not in self._due:
+                self._push(contract, now - 1e-6)
+
+    # ---------------- Gözlem → sonraki zaman ----------------
+    def observe(self, contract: str, mcap: float, nearest: Optional[float],
+                now: Optional[float] = None) -> float:
+        now = time.monotonic() if now is None else now
+        st = self._state.get(contract)
+        if st is None:
+            st = self._state[contract] = _PollState()
+
+        if st.mcap and mcap > 0 and now > st.at:
+            r = abs(math.log(mcap / st.mcap)) / math.sqrt(now - st.at)
+            st.vol = r if st.vol is None else (_VOL_ALPHA * r + (1 - _VOL_ALPHA) * st.vol)
+        st.mcap, st.at, st.failures = mcap, now, 0
+
+        interval = self.interval_for(mcap, nearest, st.vol)
+        self._push(contract, now + interval)
+        return interval
+
+    def interval_for(self, mcap: float, nearest: Optional[float], vol: Optional[float]) -> float:
+        if nearest is None or mcap <= 0 or nearest <= 0:
+            return self.max_interval  # yakında olay noktası yok
+        # Olay noktası üstte (eşik) ya da altta (histerezis yeniden kurma noktası) olabilir
+        d = abs(math.log(nearest / mcap))
+        if d == 0 or vol is None:
+            # Eşikte ya da henüz oynaklık bilinmiyor: hızlı gözlem
+            return self.min_interval
+        eta = (d / max(vol, _VOL_FLOOR)) ** 2
+        return min(self.max_interval, max(self.min_interval, self.safety * eta))
+
+    def failed(self, contract: str, now: Optional[float] = None) -> None:
+        """Veri alınamadı: artan beklemeyle tekrar dene."""
+        now = time.monotonic() if now is None else now
+        st = self._state.get(contract)
+        if st is None:
+            st = self._state[contract] = _PollState()
+        st.failures += 1
+        delay = min(self.max_interval, self.min_interval * (2 ** min(st.failures, 6)))
+        self._push(contract, now + delay)
+
+
+_scheduler: Optional[PollScheduler] = None
+
+
+def get_poll_scheduler() -> PollScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = PollScheduler()
+    return _scheduler
@@ -0,0 +1,138 @@
+# watcher/sharding.py
+from __future__ import annotations
+import logging
+import math
+import os
+import socket
+import uuid
+import zlib
+from datetime import timedelta
+from typing import Dict, Optional, Set, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from bot.db import db_sync
+from watcher.models import WatcherLease, WatcherWorker
+
+log = logging.getLogger(__name__)
+
+SHARDS = getattr(settings, "WATCHER_SHARDS", 1)
+LEASE_SECONDS = getattr(settings, "WATCHER_LEASE_SECONDS", 30)
+
+
+def shard_of(contract: str, shards: int = SHARDS) -> int:
+    """Kontratın shard'ı; süreçten bağımsız (crc32), tüm worker'larda aynı."""
+    return zlib.crc32(contract.encode()) % max(1, shards)
+
+
+class LeaseLost(Exception):
+    """Tick yazımı sırasında shard kirasının başka sürece geçtiği görüldü."""
+
+
+class LeaseManager:
+    """
+    DB satırlarıyla shard kiralaması (WatcherLease):
+    - heartbeat: tutulan kiraları uzatır, payı aşanları bırakır, süresi dolmuş
+      (ölü sürece ait) ya da boş shard'ları epoch'u artırarak devralır;
+    - pay: ⌈shard / canlı worker⌉; yeni worker gelince diğerleri fazlasını bırakır;
+    - fence: tick yazımıyla aynı transaction'da (owner, epoch) kontrolü + uzatma.
+      Kira kaybedildiyse transaction geri alınır ve mesajlar gönderilmez; yeni sahip
+      durumu DB'den okur, böylece aynı geçiş iki worker'dan bildirilmez.
+    """
+
+    def __init__(self, owner: Optional[str] = None, shards: int = SHARDS,
+                 lease_seconds: float = LEASE_SECONDS):
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.shards = max(1, shards)
+        self.lease_seconds = lease_seconds
+        self.owned: Dict[int, int] = {}  # shard → epoch
+        self._seeded = False
+
+    def owns(self, contract: str) -> bool:
+        return shard_of(contract, self.shards) in self.owned
+
+    # ---------------- DB (sync) ----------------
+    def _seed(self, now) -> None:
+        if self._seeded:
+            return
+        WatcherLease.objects.bulk_create(
+            [WatcherLease(shard=s, expires_at=now) for s in range(self.shards)],
+            ignore_conflicts=True,
+        )
+        self._seeded = True
+
+    def heartbeat_sync(self) -> Tuple[Set[int], Set[int]]:
+        """Kiraları uzat / dengele. Dönüş: (kazanılan, kaybedilen) shard'lar."""
+        now = timezone.now()
+        until = now + timedelta(seconds=self.lease_seconds)
+        before = set(self.owned)
+        with transaction.atomic():
+            self._seed(now)
+            WatcherWorker.objects.update_or_create(owner=self.owner, defaults={"expires_at": until})
+            WatcherWorker.objects.filter(expires_at__lt=now - timedelta(seconds=self.lease_seconds)).delete()
+            live = max(1, WatcherWorker.objects.filter(expires_at__gt=now).count())
+            target = math.ceil(self.shards / live)
+
+            # 1) Tutulanları uzat (epoch değişmediyse hâlâ bizim)
+            for shard, epoch in list(self.owned.items()):
+                renewed = (WatcherLease.objects
+                           .filter(shard=shard, owner=self.owner, epoch=epoch)
+                           .update(expires_at=until, heartbeat_at=now))
+                if not renewed:
+                    del self.owned[shard]
+
+            # 2) Pay aşıldıysa fazlasını bırak (yeni worker katıldı)
+            for shard in sorted(self.owned, reverse=True)[:max(0, len(self.owned) - target)]:
+                WatcherLease.objects.filter(shard=shard, owner=self.owner).update(owner="", expires_at=now)
+                del self.owned[shard]
+
+            # 3) Eksikse boş / süresi dolmuş shard'ları devral
+            need = target - len(self.owned)
+            if need > 0:
+                free = list(WatcherLease.objects
+                            .filter(shard__lt=self.shards, expires_at__lte=now)
+                            .exclude(shard__in=list(self.owned))
+                            .order_by("shard")
+                            .values_list("shard", flat=True)[:need])
+                for shard in free:
+                    taken = (WatcherLease.objects
+                             .filter(shard=shard, expires_at__lte=now)
+                             .update(owner=self.owner, epoch=F("epoch") + 1,
+                                     expires_at=until, heartbeat_at=now))
+                    if taken:
+                        self.owned[shard] = WatcherLease.objects.values_list("epoch", flat=True).get(shard=shard)
+
+        after = set(self.owned)
+        gained, lost = after - before, before - after
+        if gained or lost:
+            log.info("Shard kiraları (%s): +%s -%s → %s", self.owner, sorted(gained), sorted(lost), sorted(after))
+        return gained, lost
+
+    def fence(self) -> None:
+        """Açık bir transaction içinde çağrılır: kiralar hâlâ bizimse uzatır, değilse LeaseLost."""
+        now = timezone.now()
+        until = now + timedelta(seconds=self.lease_seconds)
+        for shard, epoch in list(self.owned.items()):
+            held = (WatcherLease.objects
+                    .filter(shard=shard, owner=self.owner, epoch=epoch)
+                    .update(expires_at=until, heartbeat_at=now))
+            if not held:
+                del self.owned[shard]
+                raise LeaseLost(shard)
+
+    def release_sync(self) -> None:
+        now = timezone.now()
+        with transaction.atomic():
+            WatcherLease.objects.filter(owner=self.owner).update(owner="", expires_at=now)
+            WatcherWorker.objects.filter(owner=self.owner).delete()
+        self.owned.clear()
+
+    # ---------------- async ----------------
+    async def heartbeat(self) -> Tuple[Set[int], Set[int]]:
+        return await db_sync(self.heartbeat_sync)()
+
+    async def release(self) -> None:
+        await db_sync(self.release_sync)()
@@ -0,0 +1,39 @@
+# watcher/signals.py
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from bot.identity import forget_identity
+from watcher.models import Token, User, UserToken
+from watcher.registry import get_registry
+
+
+@receiver(post_save, sender=UserToken, dispatch_uid="watcher_usertoken_saved")
+def _usertoken_saved(sender, instance: UserToken, **kwargs) -> None:
+    get_registry().subscription_saved(instance)
+
+
+@receiver(post_delete, sender=UserToken, dispatch_uid="watcher_usertoken_deleted")
+def _usertoken_deleted(sender, instance: UserToken, **kwargs) -> None:
+    get_registry().subscription_deleted(instance.id)
+
+
+@receiver(post_delete, sender=User, dispatch_uid="watcher_user_deleted")
+def _user_deleted(sender, instance: User, **kwargs) -> None:
+    forget_identity(tg_id=instance.telegram_id)
+
+
+@receiver(post_delete, sender=Token, dispatch_uid="watcher_token_deleted")
+def _token_deleted(sender, instance: Token, **kwargs) -> None:
+    forget_identity(contract=instance.contract_address)
+
+
+@receiver(connection_created, dispatch_uid="watcher_sqlite_pragmas")
+def _sqlite_pragmas(sender, connection, **kwargs) -> None:
+    # Her yeni SQLite bağlantısında: WAL ile okumalar yazmayla paralel (DB havuzu, sharded worker'lar)
+    if connection.vendor != "sqlite" or not getattr(settings, "SQLITE_WAL", True):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
@@ -1,121 +1,389 @@
 # watcher/tasks.py
 from __future__ import annotations
-from typing import Any, Dict, List, Tuple, Optional
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
-from asgiref.sync import sync_to_async
-from telegram import Bot
-from watcher.models import UserToken
-from bot.service import fetch_many_stats            # DexScreener client (aiohttp, async)
-from bot.services import send_telegram_message     # Telegram sender (aiohttp, async)
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from watcher.models import TokenMarketState, UserToken
+from watcher.index import Subscription, ThresholdIndex
+from watcher.registry import get_registry
+from watcher.scheduler import PollScheduler, get_poll_scheduler
+from watcher import alerting, vectorized
+from watcher.runner import RoundRobinCursor, TickReport, TickRunner
+from watcher.history import HISTORY_ENABLED, get_price_history
+from watcher.digest import Crossing, get_alert_digest
+from watcher.sharding import LeaseLost, LeaseManager
+from watcher.profiling import get_flight_recorder, get_tick_profiler
+from bot import metrics
+from bot.db import db_sync
+from bot.service import TokenStats, fetch_many_stats     # DexScreener client (aiohttp, async)
+from bot.dispatcher import get_dispatcher           # Telegram gönderim kuyruğu (rate-limitli)
+
+log = logging.getLogger(__name__)
 
 Level = str  # "none" | "low" | "mid" | "high"
 
+WRITE_BATCH_SIZE = getattr(settings, "WATCHER_WRITE_BATCH_SIZE", 500)
+VECTORIZE_MIN = getattr(settings, "WATCHER_VECTORIZE_MIN", 5000)
+ADAPTIVE_POLLING = getattr(settings, "WATCHER_ADAPTIVE_POLLING", True)
+TICK_BUDGET_SECONDS = getattr(settings, "WATCHER_TICK_BUDGET_SECONDS", 25.0)
+TICK_CHUNK = getattr(settings, "WATCHER_TICK_CHUNK", 240)  # grup başına kontrat (≈ 8 toplu istek)
+
+# ---------------- Metrikler ----------------
+_STAGE_SECONDS = metrics.histogram(
+    "watcher_tick_stage_seconds", "Tick aşamalarının süresi (tick başına toplam)", ("stage",))
+# load: kayıt + kontrat seçimi, fetch: DexScreener, evaluate: aday + geçiş + geçmiş,
+# write: toplu DB yazımı, send: özet + gönderim kuyruğu
+_STAGES = {name: _STAGE_SECONDS.labels(name) for name in ("load", "fetch", "evaluate", "write", "send")}
+_CONTRACTS_PROCESSED = metrics.counter("watcher_contracts_processed_total", "Değerlendirilen kontratlar")
+_ALERTS = metrics.counter("watcher_alerts_total", "Kuyruğa alınan eşik geçişi bildirimleri")
+_LEASE_LOST = metrics.counter("watcher_lease_lost_total", "Kira kaybı yüzünden geri alınan tick'ler")
+_WRITE_FAILED = metrics.counter("watcher_write_failures_total", "Yazımı başarısız olup geri alınan tick'ler")
+metrics.gauge("watcher_subscriptions", "Bellekteki abonelik sayısı", lambda: len(get_registry().index.subs))
+metrics.gauge("watcher_contracts", "Takip edilen kontrat sayısı", lambda: get_registry().index.contract_count())
+
 
 # ---------------- DB helpers (sync → async) ----------------
-@sync_to_async
-def _load_user_tokens() -> List[Dict[str, Any]]:
+class StateChanges:
     """
-    UserToken'ları tek query ile gerekli alanlar halinde döndürür.
+    Bir tick boyunca biriken durum değişiklikleri.
+    - UserToken: sadece kullanıcıya özel uyarı durumu; aynı seviyeye geçen (ve aynı
+      şekilde bildirilen) satırlar tek UPDATE ... WHERE id IN (...) ile yazılır.
+    - TokenMarketState: kontrat başına tek satır (abone sayısından bağımsız), hepsi
+      tek INSERT ... ON CONFLICT DO UPDATE ile.
+    - Bellekteki indeks de ancak yazım commit olunca güncellenir (_commit_index): yazım
+      başarısızsa last_mcap eski kalır ve aynı geçişler sonraki tick'te yeniden üretilir.
     """
-    qs = (UserToken.objects
-          .select_related("user", "token")
-          .values(
-              "id",
-              "user__telegram_id",
-              "token__contract_address",
-              "threshold_low",
-              "threshold_mid",
-              "threshold_high",
-              "last_alert_level",
-              "last_seen_mcap",
-          ))
-    return list(qs)
-
-@sync_to_async
-def _update_level_and_seen(ut_id: int, new_level: Level, mcap: Optional[float]) -> int:
-    return (UserToken.objects
-            .filter(id=ut_id)
-            .update(last_alert_level=new_level, last_seen_mcap=mcap))
-
-@sync_to_async
-def _update_seen_only(ut_id: int, mcap: Optional[float]) -> int:
-    return (UserToken.objects
-            .filter(id=ut_id)
-            .update(last_seen_mcap=mcap))
-
-
-# ---------------- Seviye hesaplama ----------------
-def _level_for(mcap: float, low: float, mid: float, high: float) -> Level:
-    if mcap >= high:
-        return "high"
-    if mcap >= mid:
-        return "mid"
-    if mcap >= low:
-        return "low"
-    return "none"
 
+    def __init__(self) -> None:
+        self.levels: Dict[Tuple[Level, bool], List[int]] = defaultdict(list)  # (seviye, bildirildi mi)
+        self.market: Dict[int, TokenMarketState] = {}
+        self.crossings: List[Tuple[str, Crossing]] = []  # (chat_id, geçiş); commit sonrası özetlenir
+        # (abonelik, seviye, bildirim anı, değerlendirmedeki version())
+        self.index_levels: List[Tuple[Subscription, Level, Optional[float], int]] = []
+        # kontrat → (mcap, {değerlendirilen abonelik: version()}, an)
+        self.index_mcaps: Dict[str, Tuple[float, Dict[int, int], float]] = {}
+        self.index_cooling: List[Tuple[Subscription, float]] = []  # (abonelik, bekleme bitişi)
 
-# ---------------- Ana job (PTB JobQueue ile çağrılır) ----------------
-async def check_thresholds_and_notify(context) -> None:
+    def set_level(self, ut_id: int, level: Level, alerted: bool = False) -> None:
+        self.levels[(level, alerted)].append(ut_id)
+
+    def set_market(self, token_id: int, stats: TokenStats, fetched_at: datetime) -> None:
+        self.market[token_id] = TokenMarketState(
+            token_id=token_id,
+            last_mcap=stats.market_cap,
+            price_usd=stats.price_usd,
+            liquidity_usd=stats.liquidity_usd,
+            volume_h24=stats.volume_h24,
+            chain_id=stats.chain_id or "",
+            dex_id=stats.dex_id or "",
+            pair_address=stats.pair_address or "",
+            pair_url=stats.pair_url or "",
+            fetched_at=fetched_at,
+        )
+
+    def queue_crossing(self, chat_id: str, crossing: Crossing) -> None:
+        self.crossings.append((chat_id, crossing))
+
+    def __len__(self) -> int:
+        return sum(map(len, self.levels.values())) + len(self.market)
+
+
+def _commit_index(index: ThresholdIndex, changes: StateChanges,
+                  scheduler: Optional[PollScheduler] = None) -> None:
+    """
+    Commit edilen tick'i belleğe uygula: bekleme işaretleri, seviyeler, son mcap'ler ve
+    (uyarlamalı modda) sonraki sorgu zamanları.
+    """
+    for sub, until in changes.index_cooling:
+        if index.subs.get(sub.id) is sub:
+            index.cool(sub, until)
+    for sub, level, alerted_at, version in changes.index_levels:
+        # Arada silinen ya da eşiği değişen aboneliğe eski eşiklerle hesaplanan seviye uygulanmaz
+        # (dirty kalır, sonraki tick yeni eşiklerle değerlendirir)
+        if index.subs.get(sub.id) is sub and index.version(sub.id) == version:
+            index.set_level(sub, level, alerted_at=alerted_at)
+    for contract, (mcap, evaluated, now) in changes.index_mcaps.items():
+        index.commit(contract, mcap, now, evaluated)
+        if scheduler is not None:
+            scheduler.observe(contract, mcap, index.nearest_event(contract, mcap, alerting.HYSTERESIS))
+
+
+def _chunks(ids: List[Any], size: int) -> List[List[Any]]:
+    size = max(1, size)
+    return [ids[i:i + size] for i in range(0, len(ids), size)]
+
+
+_MARKET_FIELDS = ["last_mcap", "price_usd", "liquidity_usd", "volume_h24", "chain_id", "dex_id",
+                  "pair_address", "pair_url", "fetched_at"]
+
+
+@db_sync
+def _apply_state_changes(changes: StateChanges, batch_size: int = WRITE_BATCH_SIZE,
+                         fence: Optional[Callable[[], None]] = None) -> int:
+    """
+    Tüm değişiklikleri tek thread geçişi + tek transaction içinde yazar.
+    `fence` (sharded mod) aynı transaction'da kiranın hâlâ bizde olduğunu doğrular;
+    değilse LeaseLost ile her şey geri alınır.
+    """
+    updated = 0
+    with transaction.atomic():
+        if fence is not None:
+            fence()
+        if changes.market:
+            TokenMarketState.objects.bulk_create(
+                list(changes.market.values()),
+                batch_size=batch_size,
+                update_conflicts=True,
+                unique_fields=["token"],
+                update_fields=_MARKET_FIELDS,
+            )
+            updated += len(changes.market)
+        alerted_at = timezone.now()
+        for (level, alerted), ids in changes.levels.items():
+            fields = {"last_alert_level": level}
+            if alerted:
+                fields["last_alert_at"] = alerted_at  # bekleme süresi yeniden başlatmada da korunur
+            for chunk in _chunks(ids, batch_size):
+                updated += UserToken.objects.filter(id__in=chunk).update(**fields)
+    return updated
+
+
+# ---------------- Seviye hesaplama (bkz. watcher/alerting.py) ----------------
+_level_for = alerting.level_for
+_should_notify = alerting.should_notify
+
+Transition = Tuple[Subscription, Level, bool]  # (abonelik, yeni seviye, bildir mi)
+
+
+def _evaluate_scalar(subs: List[Subscription], mcaps: Dict[str, float],
+                     now: float) -> Tuple[List[Transition], List[Subscription]]:
+    out: List[Transition] = []
+    cooling: List[Subscription] = []
+    for sub in subs:
+        result = alerting.transition(sub, mcaps[sub.contract], now)
+        if result is alerting.COOLING:
+            cooling.append(sub)
+        elif result is not None:
+            out.append((sub, result[0], result[1]))
+    return out, cooling
+
+
+def _evaluate(index: ThresholdIndex, subs: List[Subscription], mcaps: Dict[str, float],
+              now: float) -> Tuple[List[Transition], List[Subscription]]:
+    """
+    Uygulanacak geçişler (abonelik, yeni seviye, bildir mi) ve bekleme süresine takılanlar.
+    Aday sayısı büyükse (soğuk başlangıç, sert piyasa hareketi) tick'ler arası
+    önbelleklenen NumPy sütunları üzerinden tüm indeks tek seferde değerlendirilir.
+    """
+    if len(subs) >= VECTORIZE_MIN and vectorized.available():
+        return vectorized.get_column_cache().crossings(index, mcaps, now)
+    return _evaluate_scalar(subs, mcaps, now)
+
+
+async def _ensure_index() -> ThresholdIndex:
     """
-    - Tüm kullanıcıların takip ettiği kontratları çek
-    - DexScreener'dan mcap verilerini topla
-    - Eşik aşımı varsa kullanıcıya bildir, DB'yi güncelle
-    Not: Sadece YUKARI yönlü yeni seviyeye geçişte bildirim atar.
+    Abonelik kaydı açılışta bir kez yüklenir (PTB post_init ya da ilk tick);
+    sonrası olaylarla güncel, arada bir ucuz updated_at uzlaştırması.
     """
-    # 1) DB: user-token kayıtlarını al
-    uts = await _load_user_tokens()
-    if not uts:
-        return
-
-    # 2) Unique kontrat listesi çıkar → tek seferde API çağır
-    contracts = sorted({row["token__contract_address"] for row in uts})
-    stats: Dict[str, Tuple[Optional[float], Dict[str, Any]]] = await fetch_many_stats(contracts)
-
-    # 3) Her user-token için kontrol et
-    for row in uts:
-        ut_id = row["id"]
-        chat_id = row["user__telegram_id"]
-        contract = row["token__contract_address"]
-        low, mid, high = row["threshold_low"], row["threshold_mid"], row["threshold_high"]
-        prev_level: Level = row["last_alert_level"] or "none"
-
-        mcap, detail = stats.get(contract, (None, {}))
+    registry = get_registry()
+    await registry.ensure_loaded()
+    await registry.maybe_reconcile()
+    return registry.index
+
+
+# ---------------- Tick adımları ----------------
+def _select_contracts(index: ThresholdIndex, scheduler: Optional[PollScheduler],
+                      lease: Optional[LeaseManager] = None) -> List[str]:
+    contracts = index.contracts()
+    if lease is not None:
+        # Sharded mod: sadece kirası bu süreçte olan shard'ların kontratları
+        contracts = [c for c in contracts if lease.owns(c)]
+    if scheduler is None:
+        # Sabit aralık: hepsi, kalıcı tur imlecinden başlayarak
+        return _cursor.order(contracts)
+
+    # Uyarlamalı mod: sadece zamanı gelen kontratlar (eşiğe yakın olanlar daha sık)
+    scheduler.sync(contracts)
+    due: List[str] = []
+    for contract in scheduler.take_due():
+        if index.token_id(contract) is None or (lease is not None and not lease.owns(contract)):
+            scheduler.forget(contract)  # takipten çıkmış ya da shard başka süreçte
+        else:
+            due.append(contract)
+    return due
+
+
+def _process_chunk(index: ThresholdIndex, contracts: List[str], stats: Dict[str, TokenStats],
+                   scheduler: Optional[PollScheduler], changes: StateChanges,
+                   now: Optional[float] = None) -> int:
+    """Bir grup kontratın verisini değerlendirir, bildirimleri kuyruğa ekler. Bildirim sayısı döner."""
+    # Kontrat başına sadece adayları topla, sonra tek seferde değerlendir
+    mcaps: Dict[str, float] = {}
+    candidates: List[Subscription] = []
+    evaluated: Dict[str, Dict[int, int]] = {}
+    history = get_price_history()
+    now = time.time() if now is None else now
+    for contract in contracts:
+        token_stats = stats.get(contract)
+        mcap = token_stats.market_cap if token_stats is not None else None
         if mcap is None:
-            # Veri alınamadı; sadece last_seen değiştir (isteğe bağlı)
+            # Veri alınamadı; bir sonraki tick'te tekrar denenir
+            if scheduler is not None:
+                scheduler.failed(contract)
             continue
+        mcaps[contract] = mcap
+        if HISTORY_ENABLED:
+            history.record(contract, token_stats.price_usd, mcap,
+                           token_stats.liquidity_usd, token_stats.volume_h24, ts=int(now))
+        subs = index.candidates(contract, mcap, alerting.HYSTERESIS)
+        evaluated[contract] = {sub.id: index.version(sub.id) for sub in subs}
+        candidates.extend(subs)
 
-        new_level = _level_for(mcap, low, mid, high)
+    # Geçişler önce sadece StateChanges'e; indeks tick yazımı commit olunca (_commit_index)
+    transitions, cooling = _evaluate(index, candidates, mcaps, now)
+    for sub in cooling:
+        changes.index_cooling.append((sub, sub.last_alert + alerting.cooldown_of(sub)))
+    notified = 0
+    for sub, new_level, notify in transitions:
+        # Mesaj, seviye DB'ye yazıldıktan sonra sohbet başına özetlenip gönderilir (bkz. _run_tick)
+        if notify and sub.chat_id:
+            direction = "up" if alerting.should_notify(sub.level, new_level) else "down"
+            changes.queue_crossing(str(sub.chat_id), Crossing(
+                sub.contract, mcaps[sub.contract], new_level, sub.low, sub.mid, sub.high,
+                stats[sub.contract].pair_url, direction,
+            ))
+            notified += 1
+        changes.index_levels.append((sub, new_level, now if notify else None, index.version(sub.id)))
+        changes.set_level(sub.id, new_level, alerted=notify)
 
-        # Sadece YUKARI geçişte bildir (spam engeli)
-        # none -> low/mid/high | low -> mid/high | mid -> high
-        should_notify = (
-            (prev_level == "none" and new_level in {"low", "mid", "high"}) or
-            (prev_level == "low" and new_level in {"mid", "high"}) or
-            (prev_level == "mid" and new_level == "high")
-        )
+    # Piyasa durumu kontrat başına tek satır (sadece mcap değiştiyse)
+    fetched_at = timezone.now()
+    for contract, mcap in mcaps.items():
+        if index.last_mcap.get(contract) != mcap:
+            changes.set_market(index.token_id(contract), stats[contract], fetched_at)
+        changes.index_mcaps[contract] = (mcap, evaluated[contract], now)
+    return notified
 
-        if should_notify:
-            # Mesaj metni
-            pair_url = detail.get("pair_url") or "https://dexscreener.com/"
-            text = (
-                "📈 *Market Cap Eşiği Aşıldı!*\n"
-                f"`{contract}`\n"
-                f"MCAP: *{int(mcap):,}* USD\n"
-                f"Seviye: *{new_level.upper()}* "
-                f"({int(low)}/{int(mid)}/{int(high)})\n"
-                f"[Grafik / İşlem]({pair_url})"
-            )
+
+def _stage(report: TickReport, name: str, seconds: float) -> None:
+    # Tick raporu (uçuş kaydedici, watcher/profiling.py) + metrik
+    report.stages[name] = seconds
+    _STAGES[name].observe(seconds)
+
+
+def _send_messages(changes: Optional[StateChanges] = None, force: bool = False) -> None:
+    # Geçişler sohbet başına özetlenir (watcher/digest.py); penceresi dolanlar kuyruğa eklenir.
+    # Gönderim/limit/429/403 dispatcher'ın işi.
+    digest = get_alert_digest()
+    if changes is not None:
+        for chat_id, crossing in changes.crossings:
+            digest.add(chat_id, crossing)
+    messages = digest.flush(force=force)
+    if messages:
+        dispatcher = get_dispatcher()
+        for chat_id, text in messages:
+            dispatcher.enqueue(chat_id, text, parse_mode="Markdown")
+
+
+def flush_alerts() -> None:
+    """Kapanışta: pencerede bekleyen özetleri hemen kuyruğa ekle."""
+    _send_messages(force=True)
+
+
+async def _run_tick(deadline: float, lease: Optional[LeaseManager] = None) -> TickReport:
+    """
+    - Takip edilen kontratları bellekteki kayıttan seç (sharded modda sadece kiradaki shard'lar)
+    - TICK_CHUNK'lık gruplar halinde DexScreener'dan çek, değerlendir
+    - Süre (deadline) dolarsa kalanları sonraki tick'in başına devret
+    - DB'yi tick sonunda tek transaction'da güncelle, ardından bildir
+    """
+    # 1) Bellekteki abonelik kaydı (tick başına DB okuması yok)
+    started = time.perf_counter()
+    index = await _ensure_index()
+    scheduler = get_poll_scheduler() if ADAPTIVE_POLLING else None
+    contracts = _select_contracts(index, scheduler, lease)
+    report = TickReport(contracts=len(contracts))
+    _stage(report, "load", time.perf_counter() - started)
+
+    changes = StateChanges()
+    done = 0
+    fetch_seconds = evaluate_seconds = 0.0
+    try:
+        # 2) Gruplar halinde çek + değerlendir, süre bitene kadar
+        for start in range(0, len(contracts), TICK_CHUNK):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            chunk = contracts[start:start + TICK_CHUNK]
+            started = time.perf_counter()
             try:
-                if chat_id:
-                    await send_telegram_message(str(chat_id), text, parse_mode="Markdown")
+                stats = await asyncio.wait_for(fetch_many_stats(chunk), remaining)
+            except asyncio.TimeoutError:
+                break
+            finally:
+                fetch_seconds += time.perf_counter() - started
+            started = time.perf_counter()
+            report.crossings += _process_chunk(index, chunk, stats, scheduler, changes)
+            evaluate_seconds += time.perf_counter() - started
+            done += len(chunk)
+    finally:
+        _stage(report, "fetch", fetch_seconds)
+        _stage(report, "evaluate", evaluate_seconds)
+        _CONTRACTS_PROCESSED.inc(done)
+        _ALERTS.inc(report.crossings)
+
+        # 3) Bitmeyenleri devret: uyarlamalı modda kuyruğun başına, değilse tur imleci (commit sonrası)
+        leftover = contracts[done:]
+        report.processed, report.carried = done, len(leftover)
+        if scheduler is not None:
+            scheduler.requeue(leftover)
+
+        # 4) Tek transaction'da toplu yaz; commit olmayan geçiş indekse işlenmez ve bildirilmez
+        committed = True
+        if changes:
+            started = time.perf_counter()
+            try:
+                await _apply_state_changes(changes, fence=lease.fence if lease is not None else None)
+            except LeaseLost as exc:
+                committed = False
+                _LEASE_LOST.inc()
+                log.warning("Shard %s kirası kaybedildi; tick geri alındı, kayıt yeniden yükleniyor", exc)
+                await get_registry().reload()  # devredilen shard'lar yeni sahibin durumundan okunur
             except Exception:
-                # Kullanıcı botu engellemiş olabilir, sessiz geç
-                pass
+                # ör. SQLite "database is locked": indeks dokunulmadığı için geçişler sonraki tick'te yeniden
+                committed = False
+                _WRITE_FAILED.inc()
+                log.exception("Tick durumu yazılamadı; geçişler sonraki tick'te yeniden değerlendirilecek")
+            finally:
+                _stage(report, "write", time.perf_counter() - started)
+        if not committed and scheduler is not None:
+            scheduler.requeue(changes.index_mcaps)  # gözlem kaydedilmedi: sonraki tick yeniden sorgula
+        if committed:
+            _commit_index(index, changes, scheduler)
+            if scheduler is None and done:
+                _cursor.advance(contracts[done - 1])
+            started = time.perf_counter()
+            _send_messages(changes if changes else None)  # boşsa: önceki tick'lerden penceresi dolan özetler
+            _stage(report, "send", time.perf_counter() - started)
+    return report
 
-            # DB güncelle
-            await _update_level_and_seen(ut_id, new_level, mcap)
-        else:
-            # Seviye değişmediyse, sadece son görülen MCAP'i güncelle (opsiyonel)
-            if row.get("last_seen_mcap") != mcap:
-                await _update_seen_only(ut_id, mcap)
+
+_cursor = RoundRobinCursor()
+_runner = TickRunner(TICK_BUDGET_SECONDS, recorder=get_flight_recorder(), profiler=get_tick_profiler())
+
+
+# ---------------- Ana job (PTB JobQueue ile çağrılır) ----------------
+async def check_thresholds_and_notify(context) -> None:
+    """
+    Eşik kontrol tick'i. Tick'ler üst üste binmez (önceki sürerken gelen atlanır)
+    ve her tick WATCHER_TICK_BUDGET_SECONDS içinde biter.
+    Bildirim kuralları (histerezis, bekleme, aşağı yön) için bkz. watcher/alerting.py.
+    """
+    await _runner.run(_run_tick)
@@ -0,0 +1,248 @@
+# watcher/vectorized.py
+from __future__ import annotations
+from typing import Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np  # opsiyonel: yoksa tick skaler yolda kalır
+except ImportError:  # pragma: no cover
+    np = None
+
+from watcher.alerting import HYSTERESIS, LEVELS, cooldown_of
+from watcher.index import Subscription, ThresholdIndex
+
+LEVEL_CODE = {name: code for code, name in enumerate(LEVELS)}
+
+# (abonelik, yeni seviye, bildir mi)
+Transitions = List[Tuple[Subscription, str, bool]]
+
+
+def available() -> bool:
+    return np is not None
+
+
+class SubscriptionColumns:
+    """
+    Abonelikler sütun halinde: ids, contract_idx, low/mid/high, level (kod),
+    down (aşağı bildirim), cooldown_until (son bildirim + bekleme, epoch sn).
+    mcap kontrat başına bir dizi; satır başına değer contract_idx ile toplanır (gather).
+    """
+    COLUMNS = ("ids", "contract_idx", "low", "mid", "high", "level", "down", "cooldown_until")
+
+    def __init__(self, ids, contract_idx, low, mid, high, level, down, cooldown_until, contracts: List[str]):
+        self.ids = ids
+        self.contract_idx = contract_idx
+        self.low = low
+        self.mid = mid
+        self.high = high
+        self.level = level
+        self.down = down
+        self.cooldown_until = cooldown_until
+        self.contracts = contracts
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def from_subscriptions(cls, subs: Sequence[Subscription],
+                           contracts: Optional[List[str]] = None) -> "SubscriptionColumns":
+        if contracts is None:
+            contracts = sorted({s.contract for s in subs})
+        pos = {c: i for i, c in enumerate(contracts)}
+        n = len(subs)
+        return cls(
+            np.fromiter((s.id for s in subs), dtype=np.int64, count=n),
+            np.fromiter((pos[s.contract] for s in subs), dtype=np.int32, count=n),
+            np.fromiter((s.low for s in subs), dtype=np.float64, count=n),
+            np.fromiter((s.mid for s in subs), dtype=np.float64, count=n),
+            np.fromiter((s.high for s in subs), dtype=np.float64, count=n),
+            np.fromiter((LEVEL_CODE[s.level or "none"] for s in subs), dtype=np.int8, count=n),
+            np.fromiter((s.down for s in subs), dtype=np.bool_, count=n),
+            np.fromiter((s.last_alert + cooldown_of(s) for s in subs), dtype=np.float64, count=n),
+            contracts,
+        )
+
+    def mcap_vector(self, mcaps: Dict[str, Optional[float]]):
+        """Kontrat sırasına göre mcap dizisi; veri yoksa NaN."""
+        return np.array(
+            [mcaps.get(c) if mcaps.get(c) is not None else np.nan for c in self.contracts],
+            dtype=np.float64,
+        )
+
+
+def _levels(m, low, mid, high):
+    # level_for ile aynı öncelik: high > mid > low (eşikler sırasız olsa bile)
+    return np.where(m >= high, 3, np.where(m >= mid, 2, np.where(m >= low, 1, 0))).astype(np.int8)
+
+
+def evaluate(cols: SubscriptionColumns, contract_mcap, now: float = 0.0,
+             hysteresis: float = HYSTERESIS) -> Tuple["np.ndarray", "np.ndarray", "np.ndarray", "np.ndarray"]:
+    """
+    alerting.transition'ın vektörel karşılığı.
+    Dönüş: (yeni seviye kodları, uygulanan geçiş maskesi, bildirim maskesi, bekleme maskesi).
+    mcap'i NaN olan satırlar geçiş üretmez.
+    """
+    m = contract_mcap[cols.contract_idx]
+    up = _levels(m, cols.low, cols.mid, cols.high)
+    keep = 1.0 - hysteresis
+    held = _levels(m, cols.low * keep, cols.mid * keep, cols.high * keep)
+    new = np.where(up > cols.level, up, np.where(held < cols.level, held, cols.level)).astype(np.int8)
+    changed = (new != cols.level) & ~np.isnan(m)
+    cooling = changed & (now < cols.cooldown_until)
+    applied = changed & ~cooling
+    notify = applied & ((new > cols.level) | cols.down)
+    return new, applied, notify, cooling
+
+
+def _collect(subs: Sequence[Optional[Subscription]], new, applied, notify,
+             cooling, rows=None) -> Tuple[Transitions, List[Subscription]]:
+    # rows: değerlendirilen satırların `subs` içindeki konumları (alt küme değerlendirildiyse)
+    at = (lambda i: subs[i]) if rows is None else (lambda i: subs[rows[i]])  # noqa: E731
+    return (
+        [(at(i), LEVELS[new[i]], bool(notify[i])) for i in np.flatnonzero(applied)],
+        [at(i) for i in np.flatnonzero(cooling)],
+    )
+
+
+def crossings(subs: Sequence[Subscription], mcaps: Dict[str, Optional[float]], now: float = 0.0,
+              hysteresis: float = HYSTERESIS) -> Tuple[Transitions, List[Subscription]]:
+    """Tick için: (uygulanan geçişler, bekleme süresine takılanlar)."""
+    if not subs:
+        return [], []
+    cols = SubscriptionColumns.from_subscriptions(subs)
+    return _collect(subs, *evaluate(cols, cols.mcap_vector(mcaps), now, hysteresis))
+
+
+class ColumnCache:
+    """
+    İndeksin tamamının tick'ler arasında yaşayan sütun kopyası.
+    Her tick'te sadece indeksin değişiklik akışı (drain_changes) uygulanır; silinen
+    satırlar mezar taşı olarak kalır (mcap'i her zaman NaN olan ek kontrat slotu),
+    oranları %10'u geçince ya da indeks yeniden yüklenince sütunlar baştan kurulur.
+    Kurulumda satırlar kontrata göre sıralanır: kontrat başına bitişik bir aralık
+    (sonradan eklenen/taşınanlar ayrı listede), değerlendirme sadece o grubun satırlarında.
+    """
+
+    def __init__(self) -> None:
+        self.cols: Optional[SubscriptionColumns] = None
+        self.generation = -1
+        self.subs: List[Optional[Subscription]] = []
+        self.pos: Dict[int, int] = {}
+        self.contract_pos: Dict[str, int] = {}
+        self.ranges: Dict[str, Tuple[int, int]] = {}  # kontrat → [başlangıç, bitiş) satırları
+        self.extra: Dict[str, List[int]] = {}         # kurulumdan sonra eklenen/taşınan satırlar
+        self.dead = 0
+        self.moved = 0
+
+    def _rebuild(self, index: ThresholdIndex) -> None:
+        index.drain_changes()
+        self.subs = sorted(index.subs.values(), key=lambda s: s.contract)
+        self.pos = {s.id: i for i, s in enumerate(self.subs)}
+        self.ranges = {}
+        for i, s in enumerate(self.subs):
+            start = self.ranges.get(s.contract, (i, i))[0]
+            self.ranges[s.contract] = (start, i + 1)
+        contracts = sorted(self.ranges)
+        self.contract_pos = {c: i for i, c in enumerate(contracts)}
+        self.cols = SubscriptionColumns.from_subscriptions(self.subs, contracts)
+        self.generation = index.generation
+        self.extra = {}
+        self.dead = 0
+        self.moved = 0
+
+    def _contract(self, contract: str) -> int:
+        pos = self.contract_pos.get(contract)
+        if pos is None:
+            pos = self.contract_pos[contract] = len(self.cols.contracts)
+            self.cols.contracts.append(contract)
+        return pos
+
+    def _patch(self, index: ThresholdIndex) -> None:
+        cols = self.cols
+        appended: List[Subscription] = []
+        for ut_id in index.drain_changes():
+            sub = index.subs.get(ut_id)
+            row = self.pos.get(ut_id)
+            if row is None:
+                if sub is not None:
+                    appended.append(sub)
+                continue
+            if sub is None:
+                self.subs[row] = None
+                del self.pos[ut_id]
+                cols.contract_idx[row] = -1  # mezar taşı
+                self.dead += 1
+                continue
+            self.subs[row] = sub
+            pos = self._contract(sub.contract)
+            if cols.contract_idx[row] != pos:  # kontratı değişti: yeni kontratın satırlarına
+                cols.contract_idx[row] = pos
+                self.extra.setdefault(sub.contract, []).append(row)
+                self.moved += 1
+            cols.low[row], cols.mid[row], cols.high[row] = sub.low, sub.mid, sub.high
+            cols.level[row] = LEVEL_CODE[sub.level or "none"]
+            cols.down[row] = sub.down
+            cols.cooldown_until[row] = sub.last_alert + cooldown_of(sub)
+
+        if appended:
+            for s in appended:
+                self._contract(s.contract)
+            extra = SubscriptionColumns.from_subscriptions(appended, cols.contracts)
+            start = len(self.subs)
+            for name in SubscriptionColumns.COLUMNS:
+                setattr(cols, name, np.concatenate([getattr(cols, name), getattr(extra, name)]))
+            self.subs.extend(appended)
+            for i, s in enumerate(appended):
+                self.pos[s.id] = start + i
+                self.extra.setdefault(s.contract, []).append(start + i)
+            self.moved += len(appended)
+
+    def sync(self, index: ThresholdIndex) -> SubscriptionColumns:
+        if (self.cols is None or self.generation != index.generation
+                or (self.dead + self.moved) * 10 > len(self.subs)):
+            self._rebuild(index)
+        else:
+            self._patch(index)
+        return self.cols
+
+    def crossings(self, index: ThresholdIndex, mcaps: Dict[str, Optional[float]], now: float = 0.0,
+                  hysteresis: float = HYSTERESIS) -> Tuple[Transitions, List[Subscription]]:
+        """
+        `mcaps`'teki kontratların tüm aboneliklerini tek seferde değerlendirir (tick grubu
+        başına sadece o grubun satırları). Aday olmayan satırlar tanım gereği geçiş üretmez
+        (bkz. ThresholdIndex değişmezi), dolayısıyla sonuç skaler yolla aynıdır.
+        """
+        cols = self.sync(index)
+        # Son slot: mezar taşları (-1) ve gruptaki olmayan kontratlar her zaman NaN görür
+        vec = np.full(len(cols.contracts) + 1, np.nan)
+        parts = []
+        moved = False
+        for contract, mcap in mcaps.items():
+            pos = self.contract_pos.get(contract)
+            if pos is None or mcap is None:
+                continue
+            vec[pos] = mcap
+            span = self.ranges.get(contract)
+            if span is not None:
+                parts.append(np.arange(span[0], span[1], dtype=np.int64))
+            extra = self.extra.get(contract)
+            if extra:
+                parts.append(np.asarray(extra, dtype=np.int64))
+                moved = True
+        if not parts:
+            return [], []
+        rows = np.concatenate(parts)
+        if moved:
+            rows = np.unique(rows)  # taşınan satır eski aralığında da duruyor
+        group = SubscriptionColumns(*(getattr(cols, name)[rows] for name in SubscriptionColumns.COLUMNS),
+                                    contracts=cols.contracts)
+        return _collect(self.subs, *evaluate(group, vec, now, hysteresis), rows=rows)
+
+
+_column_cache: Optional[ColumnCache] = None
+
+
+def get_column_cache() -> ColumnCache:
+    global _column_cache
+    if _column_cache is None:
+        _column_cache = ColumnCache()
+    return _column_cache
@@ -0,0 +1,35 @@
+# watcher/worker.py
+"""
+Sharded watcher süreci. Aynı makinede (ya da aynı DB'yi gören makinelerde) N kopya:
+
+    WATCHER_SHARDS=16 python -m watcher.worker
+
+Her süreç kontratların crc32 % WATCHER_SHARDS bölümlerinden payına düşenleri
+DB kiralarıyla (WatcherLease) alır; ölen sürecin shard'ları kira süresi dolunca
+diğerlerine geçer. Bu modda bot.py eşik job'unu çalıştırmaz.
+`python manage.py run_watcher` ile aynı döngü; argümanlar ona geçer.
+Not: TG_GLOBAL_RPS / DEX_RPS süreç başınadır; toplam limiti süreç sayısına bölün.
+"""
+import os
+import sys
+import logging
+
+import django
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "crypto_alert.settings")
+django.setup()
+
+from django.core.management import call_command  # noqa: E402
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    call_command("run_watcher", *sys.argv[1:])
+
+
+if __name__ == "__main__":
+    main()